@@ -1,11 +1,15 @@
 # Python imports
 import cgi
-import locale
+import email.utils
+import hashlib
+import heapq
 import logging
+import multiprocessing
 import os
 import os.path
 import sys
 import time
+import traceback
 
 try:
     from cStringIO import StringIO
@@ -15,9 +19,16 @@ except ImportError:
 # Douglas imports
 from douglas import __version__
 from douglas import crashhandling
+from douglas import dates
+from douglas import entryindex
+from douglas import incremental
+from douglas import memcache
+from douglas import pagecache
 from douglas import plugin_utils
 from douglas import tools
-from douglas.entries.fileentry import FileEntry
+from douglas.entries.entrylist import EntryList
+from douglas.incremental import Manifest
+from douglas.renderers.jinjarenderer import get_theme_signature
 from douglas.settings import import_config
 
 
@@ -43,6 +54,56 @@ def initialize(cfg):
     cfg['extensions'] = extensions
 
 
+# This holds the config for compile worker processes.  It gets set by
+# ``compile_worker_init`` when the worker process starts up.
+_compile_cfg = None
+
+
+def compile_url(cfg, url, query):
+    """Compiles a single url and returns a ``(url, query, error,
+    deps)`` tuple where ``error`` is ``None`` if everything went fine
+    or the formatted traceback if it didn't and ``deps`` is the
+    snapshot of the dependencies recorded while compiling.
+    """
+    incremental.start_recording()
+    try:
+        tools.render_url_statically(dict(cfg), url, query)
+    except Exception:
+        incremental.stop_recording()
+        return (url, query, traceback.format_exc(), None)
+    deps = incremental.stop_recording()
+    return (url, query, None, deps.snapshot())
+
+
+def compile_worker_init(cfg):
+    """Initializes a compile worker process.
+
+    This imports and initializes the plugins once for the lifetime of
+    the worker rather than once per url.
+    """
+    global _compile_cfg
+    _compile_cfg = cfg
+    initialize(cfg)
+
+
+def compile_worker(url_query):
+    """Compiles a ``(url, query)`` tuple in a compile worker
+    process.
+    """
+    url, query = url_query
+    print '   Rendering {0} ...'.format(url)
+    return compile_url(_compile_cfg, url, query)
+
+
+def run_end_callback(request):
+    """Generator that runs the ``end`` callback when it's consumed and
+    doesn't yield anything.
+    """
+    tools.run_callback("end", {'request': request})
+    return
+    yield
+
+
 class Douglas(object):
     """Main class for Douglas functionality.  It handles
     initialization, defines default behavior, and also pushes the
@@ -112,6 +173,11 @@ class Douglas(object):
         if not compiling:
             self.get_request().buffer_input_stream()
 
+            # Let the datadir get checked for changed entries once
+            # for this request if the check interval is up.  When
+            # compiling, that happens once for the whole compile.
+            entryindex.get_index(self._config).expire()
+
         # Run the start callback
         tools.run_callback("start", {'request': self._request})
 
@@ -124,8 +190,14 @@ class Douglas(object):
         if not handled == 1:
             blosxom_handler(self._request)
 
-        # Do end callback
-        tools.run_callback("end", {'request': self._request})
+        # Do end callback.  If the body is being streamed, the
+        # templates haven't rendered yet, so it runs after the rest of
+        # the body has been consumed.
+        response = self._request.get_response()
+        if response.is_streaming():
+            response.write_stream(run_end_callback(self._request))
+        else:
+            tools.run_callback("end", {'request': self._request})
 
         # We're done, clean up.  Only call this if we're not in
         # compiling mode.
@@ -162,7 +234,7 @@ class Douglas(object):
         # we're done, clean up
         self.cleanup()
 
-    def run_compile(self, incremental=False):
+    def run_compile(self, incremental=False, jobs=1):
         """Compiles the blog into an HTML site.
 
         This will go through all possible things in the blog and
@@ -174,7 +246,14 @@ class Douglas(object):
 
         :param incremental: Whether (True) or not (False) to compile
             incrementally. If we're incrementally compiling, then only
-            the urls that are likely to have changed get re-compiled.
+            the urls where an entry, template, config value or list
+            of entries they depend on changed get re-compiled.
+
+        :param jobs: The number of processes to render urls with. If
+            this is greater than 1, then the urls are split up across
+            a pool of worker processes.
+
+        :returns: 0 if everything compiled and 1 if there were errors
 
         """
         self.initialize()
@@ -204,6 +283,7 @@ class Douglas(object):
         categories = {}
 
         # first we handle entries and categories
+        entryindex.get_index(cfg).update(force=True)
         listing = tools.get_entries(cfg, datadir)
 
         for mem in listing:
@@ -213,52 +293,39 @@ class Douglas(object):
             if not ext in cfg['extensions'].keys():
                 continue
 
-            # Get the mtime of the entry.
-            mtime = time.mktime(tools.filestat(self._request, mem))
-
             # remove the datadir from the front and the bit at the end
             mem = mem[len(datadir):mem.rfind('.')]
 
-            # This is the compiled file filename.
-            fn = os.path.normpath(compiledir + mem)
-
-            if incremental:
-                # If we're incrementally rendering, we check the mtime
-                # for the compiled file for one of the themes. If the entry
-                # is more recent than the compiled version, we recompile.
-                # Otherwise we skip it.
-                try:
-                    smtime = os.stat(fn + '.' + themes[0])[8]
-                    if smtime < mtime or not incremental:
-                        continue
-
-                except (IOError, OSError):
-                    pass
-
             # Figure out category indexes to re-render.
             temp = os.path.dirname(mem).split(os.sep)
             for i in range(len(temp)+1):
                 p = os.sep.join(temp[0:i])
                 categories[p] = 0
 
-            # Figure out year/month/day indexes to re-render.
-            mtime = time.localtime(mtime)
-            year = time.strftime('%Y', mtime)
-            month = time.strftime('%m', mtime)
-            day = time.strftime('%d', mtime)
+            # Toss each theme for this entry in the render queue.
+            for f in themes:
+                renderme.append((mem + '.' + f, ''))
 
-            if yearindexes:
-                dates[year] = 1
+        # Figure out year/month/day indexes to re-render from the
+        # date buckets in the entry index.  This skips dates that
+        # only have entries that aren't in the listing (e.g. entries
+        # that the entries callback removed).
+        listed = set(listing)
+        date_buckets = entryindex.get_index(cfg).get_dates()
+        for year, months in date_buckets.items():
+            for month, days in months.items():
+                for day, day_files in days.items():
+                    if not listed.intersection(day_files):
+                        continue
 
-            if monthindexes:
-                dates[year + '/' + month] = 1
+                    if yearindexes:
+                        dates[year] = 1
 
-            if dayindexes:
-                dates[year + '/' + month + '/' + day] = 1
+                    if monthindexes:
+                        dates[year + '/' + month] = 1
 
-            # Toss each theme for this entry in the render queue.
-            for f in themes:
-                renderme.append((mem + '.' + f, ''))
+                    if dayindexes:
+                        dates[year + '/' + month + '/' + day] = 1
 
         print '- Found {0} entry(es) ...'.format(len(renderme))
 
@@ -321,14 +388,58 @@ class Douglas(object):
         print 'Compiling {0} url(s) total.'.format(len(renderme))
         print ''
 
+        renderme = [(url.replace(os.sep, '/'), q) for url, q in renderme]
+
+        manifest = Manifest(cfg)
+        if incremental:
+            # Only compile the urls where something they depend on
+            # changed since the last time they were compiled.
+            manifest.load()
+            total = len(renderme)
+            renderme = [(url, q) for url, q in renderme
+                        if manifest.is_stale(url, q)]
+            print '- Skipping {0} unchanged url(s) ...'.format(
+                total - len(renderme))
+            print ''
+
         print 'Rendering files ...'
-        for url, q in renderme:
-            url = url.replace(os.sep, '/')
-            print '   Rendering {0} ...'.format(url)
-            tools.render_url_statically(dict(cfg), url, q)
+        if jobs > 1:
+            print '- Using {0} processes ...'.format(jobs)
+            pool = multiprocessing.Pool(
+                jobs, compile_worker_init, (dict(cfg),))
+            try:
+                results = pool.map(compile_worker, renderme, chunksize=1)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            results = []
+            for url, q in renderme:
+                print '   Rendering {0} ...'.format(url)
+                results.append(compile_url(cfg, url, q))
+
+        for url, q, error, deps in results:
+            if not error:
+                manifest.update(url, q, deps)
+        manifest.save()
+
+        errors = sorted((url, error) for url, q, error, deps in results
+                        if error)
+        if errors:
+            print ''
+            print 'Errors rendering {0} url(s):'.format(len(errors))
+            for url, error in errors:
+                print ''
+                print '   {0}'.format(url)
+                for line in error.splitlines():
+                    print '      {0}'.format(line)
 
         # We're done, clean up
         self.cleanup()
+        return 1 if errors else 0
 
     def run_collectstatic(self):
         """Collects static files and copies them to compiledir"""
@@ -386,34 +497,81 @@ class DouglasWSGIApp(object):
             self.config.update(tools.convert_configini_values(configini))
 
         tools.setup_logging(self.config)
+        memcache.configure(self.config)
         initialize(self.config)
 
+        self.pagecache = pagecache.build_pagecache(self.config)
+
     def run_douglas(self, env, start_response):
-        """Executes a single run of Douglas wrapped in the crash handler."""
+        """Executes a single run of Douglas wrapped in the crash handler.
+
+        :returns: iterable of strings for the response body
+        """
         response = None
+        cacheable = False
         try:
             # ensure that PATH_INFO exists. a few plugins break if this is
             # missing.
             if 'PATH_INFO' not in env:
                 env['PATH_INFO'] = ''
 
+            if self.pagecache is not None:
+                cached = self.pagecache.get(env)
+                if cached is not None:
+                    return self.send_cached(env, start_response, *cached)
+
             p = Douglas(dict(self.config), env)
             p.run()
             response = p.get_response()
+            cacheable = (self.pagecache is not None
+                         and not p.get_request().get_data().get(
+                             'no_pagecache'))
 
         except Exception:
             ch = crashhandling.CrashHandler(True, env)
             response = ch.handle_by_response(*sys.exc_info())
 
-        start_response(response.status, list(response.headers.items()))
+        headers = list(response.headers.items())
+        start_response(response.status, headers)
+        if response.is_streaming() and not cacheable:
+            return stream_body(response)
         response.seek(0)
-        return response.read()
+        body = response.read()
+        if cacheable:
+            self.pagecache.set(env, response.status, headers, body)
+        return [body]
+
+    def send_cached(self, env, start_response, status, headers, body):
+        """Sends a response from the page cache."""
+        header_dict = dict(headers)
+        if is_not_modified(env, header_dict.get('ETag'),
+                           header_dict.get('Last-Modified')):
+            start_response('304 Not Modified', headers)
+            return ['']
+
+        start_response(status, headers)
+        return [body]
 
     def __call__(self, env, start_response):
-        return [self.run_douglas(env, start_response)]
+        return self.run_douglas(env, start_response)
 
     def __iter__(self):
-        yield self.run_douglas(self.environ, self.start_response)
+        for chunk in self.run_douglas(self.environ, self.start_response):
+            yield chunk
+
+
+def stream_body(response):
+    """Yields the body of a streaming response.
+
+    By the time this runs, the status and headers have been sent, so
+    if something goes wrong rendering the rest of the body, all we
+    can do is log it and stop.
+    """
+    try:
+        for chunk in response.iter_body():
+            yield chunk
+    except Exception:
+        logging.getLogger().exception('Error while streaming response')
 
 
 def douglas_app_factory(global_config, **local_config):
@@ -664,6 +822,11 @@ class Response(object):
 
     This class is basically a wrapper arround a ``StringIO`` instance.
     It also provides methods for managing http headers.
+
+    Renderers can hand the response an iterable of body chunks with
+    ``write_stream`` which doesn't get consumed until the body is
+    sent with ``iter_body``.  Reading from the response buffers the
+    whole body first.
     """
     def __init__(self, request):
         """Sets the ``Request`` object that leaded to this response.
@@ -675,13 +838,12 @@ class Response(object):
         self.headers = {}
         self.status = "200 OK"
 
+        # List of strings and iterables of strings that come before
+        # what's in self._out.
+        self._parts = []
+
         self.close = self._out.close
         self.flush = self._out.flush
-        self.read = self._out.read
-        self.readline = self._out.readline
-        self.readlines = self._out.readlines
-        self.seek = self._out.seek
-        self.tell = self._out.tell
         self.write = self._out.write
         self.writelines = self._out.writelines
 
@@ -693,8 +855,75 @@ class Response(object):
         See
         http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/252151
         """
+        self.buffer_body()
         return self._out
 
+    def read(self, *args):
+        self.buffer_body()
+        return self._out.read(*args)
+
+    def readline(self, *args):
+        self.buffer_body()
+        return self._out.readline(*args)
+
+    def readlines(self, *args):
+        self.buffer_body()
+        return self._out.readlines(*args)
+
+    def seek(self, *args):
+        self.buffer_body()
+        return self._out.seek(*args)
+
+    def tell(self):
+        self.buffer_body()
+        return self._out.tell()
+
+    def write_stream(self, iterable):
+        """Adds an iterable of strings to the body.
+
+        The iterable doesn't get consumed until the body is sent or
+        read.
+
+        :param iterable: iterable of strings
+        """
+        self._parts.append(self._out.getvalue())
+        self._out.seek(0)
+        self._out.truncate()
+        self._parts.append(iterable)
+
+    def is_streaming(self):
+        """Returns whether there's an iterable in the body that hasn't
+        been consumed.
+        """
+        return bool(self._parts)
+
+    def iter_body(self):
+        """Returns a generator of the strings in the body.
+
+        This consumes iterables passed to ``write_stream``, so it can
+        only be done once.
+        """
+        parts, self._parts = self._parts, []
+        for part in parts:
+            if isinstance(part, str):
+                if part:
+                    yield part
+            else:
+                for chunk in part:
+                    yield chunk
+        yield self._out.getvalue()
+
+    def buffer_body(self):
+        """Consumes iterables passed to ``write_stream`` so that the
+        whole body is in the buffer.
+        """
+        if not self._parts:
+            return
+        data = ''.join(self.iter_body())
+        self._out.seek(0)
+        self._out.truncate()
+        self._out.write(data)
+
     def set_status(self, status):
         """Sets the status code for this response.  The status should
         be a valid HTTP response status.
@@ -763,15 +992,103 @@ class Response(object):
 
         :param out: the file-like object to print the body to.
         """
-        self.seek(0)
         try:
-            out.write(self.read())
+            for chunk in self.iter_body():
+                out.write(chunk)
         except IOError:
             # this is usually a Broken Pipe because the client dropped the
             # connection.  so we skip it.
             pass
 
 
+def conditional_get_handler(request):
+    """Adds ``ETag`` and ``Last-Modified`` headers to the response and
+    figures out whether the client already has the current version of
+    the page.
+
+    The ``ETag`` is derived from the entries being shown, the state of
+    the entry index (which things like category and tag lists are
+    built from), the theme files, the url and the config.
+
+    :param request: the request object.
+
+    :returns: True if the client has the current version and the
+        response is a ``304 Not Modified`` and False otherwise
+    """
+
+    config = request.get_configuration()
+    data = request.get_data()
+    http = request.get_http()
+    response = request.get_response()
+
+    theme = data.get('theme') or config.get('default_theme', 'html')
+    theme_sig, latest = get_theme_signature(config['themedir'], theme)
+    index_digest, index_latest = entryindex.get_index(config).get_summary()
+    latest = max(latest, index_latest)
+
+    entry_sigs = []
+    for entry in data['entry_list']:
+        fn = getattr(entry, '_filename', None)
+        if not fn:
+            continue
+        try:
+            st = os.stat(fn)
+        except OSError:
+            continue
+        entry_sigs.append((fn, st.st_mtime, st.st_size))
+        latest = max(latest, st.st_mtime)
+
+    etag = '"{0}"'.format(hashlib.md5(repr((
+        http.get('PATH_INFO', ''),
+        http.get('QUERY_STRING', ''),
+        theme,
+        theme_sig,
+        index_digest,
+        entry_sigs,
+        incremental.config_signature(config)
+    ))).hexdigest())
+    latest = int(latest)
+
+    last_modified = None
+    response.add_header('ETag', etag)
+    if latest:
+        last_modified = dates.httpdate(latest)
+        response.add_header('Last-Modified', last_modified)
+
+    if is_not_modified(http, etag, last_modified):
+        response.set_status('304 Not Modified')
+        return True
+    return False
+
+
+def is_not_modified(http, etag, last_modified):
+    """Returns whether the ``If-None-Match`` or ``If-Modified-Since``
+    headers in the request show the client already has the version of
+    the page with this etag and last modified time.
+
+    :param http: the http environment dict
+    :param etag: the ``ETag`` header value
+    :param last_modified: the ``Last-Modified`` header value or
+        ``None``
+    """
+    # If-None-Match wins over If-Modified-Since if both are there.
+    if_none_match = http.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+        return etag in tags or '*' in tags
+
+    if_modified_since = http.get('HTTP_IF_MODIFIED_SINCE')
+    if not if_modified_since or not last_modified:
+        return False
+
+    since = email.utils.parsedate_tz(if_modified_since)
+    modified = email.utils.parsedate_tz(last_modified)
+    if since is None or modified is None:
+        return False
+    return email.utils.mktime_tz(modified) <= email.utils.mktime_tz(since)
+
+
 def blosxom_handler(request):
     """This is the default blosxom handler.
 
@@ -787,6 +1104,10 @@ def blosxom_handler(request):
     It calls the prepare callback to do any additional preparation
     before rendering the entries.
 
+    If ``conditional_get`` is on, it figures out whether the client
+    already has the current version of the page and if so, responds
+    with a ``304 Not Modified`` instead of rendering.
+
     Then it tells the renderer to render the entries.
 
     :param request: the request object.
@@ -839,21 +1160,11 @@ def blosxom_handler(request):
     else:
         mtime = time.time()
     mtime_tuple = time.localtime(mtime)
-    mtime_gmtuple = time.gmtime(mtime)
 
+    data['latest_mtime'] = mtime
     data['latest_date'] = time.strftime('%a, %d %b %Y', mtime_tuple)
-
-    # Make sure we get proper 'English' dates when using standards
-    loc = locale.getlocale(locale.LC_ALL)
-    locale.setlocale(locale.LC_ALL, 'C')
-
-    data['latest_w3cdate'] = time.strftime('%Y-%m-%dT%H:%M:%SZ',
-                                           mtime_gmtuple)
-    data['latest_rfc822date'] = time.strftime('%a, %d %b %Y %H:%M GMT',
-                                              mtime_gmtuple)
-
-    # set the locale back
-    locale.setlocale(locale.LC_ALL, loc)
+    data['latest_w3cdate'] = dates.w3cdate(mtime)
+    data['latest_rfc822date'] = dates.rfc822date(mtime)
 
     # we pass the request with the entry_list through the prepare
     # callback giving everyone a chance to transform the data.  the
@@ -864,6 +1175,13 @@ def blosxom_handler(request):
     entry_list = data['entry_list']
     renderer = data['renderer']
 
+    if ((renderer and not renderer.rendered and entry_list
+         and config.get('conditional_get', True)
+         and not data.get('COMPILING')
+         and request.get_http().get('REQUEST_METHOD') in ('GET', 'HEAD'))):
+        if conditional_get_handler(request):
+            renderer.rendered = 1
+
     if renderer and not renderer.rendered:
         if entry_list:
             renderer.set_content(entry_list)
@@ -905,6 +1223,10 @@ def blosxom_entry_parser(filename, request):
     cfg = request.get_configuration()
     return dict(tools.parse_entry_file(filename, cfg['blog_encoding']))
 
+# The title and metadata lines can be read without parsing the whole
+# entry.  See ``FileEntry``.
+blosxom_entry_parser.entry_header = True
+
 
 def blosxom_file_list_handler(args):
     """This is the default handler for getting entries.  It takes the
@@ -922,25 +1244,43 @@ def blosxom_file_list_handler(args):
     config = request.get_configuration()
 
     if data['bl_type'] == 'entry_list':
-        filelist = tools.get_entries(
-            config, data['root_datadir'], int(config['depth']))
+        if data.get('pi_yr'):
+            # We're looking at a set of archives, so this only gets
+            # the entries in the archive.
+            filelist = tools.get_date_entries(
+                config, data['pi_yr'], data.get('pi_mo', ''),
+                data.get('pi_da', ''), int(config['depth']))
+        else:
+            filelist = tools.get_entries(
+                config, data['root_datadir'], int(config['depth']))
+        # That just updated the entry index, so there's no need to
+        # stat all the files again.
+        mtimes = tools.get_mtimes(config, filelist, check=False)
     elif data['bl_type'] == 'entry':
         filelist = [data['root_datadir']]
+        mtimes = tools.get_mtimes(config, filelist)
     else:
         filelist = []
+        mtimes = {}
 
-    entrylist = [FileEntry(request, e, data["root_datadir"]) for e in filelist]
+    # Entries are sorted by their mtime in whole seconds.  This sorts
+    # the file names rather than entries so that entries only get
+    # created for what gets shown.  If no plugins change how the list
+    # is sorted and truncated, then this only picks out the entries
+    # that will get shown.
+    def key(fn):
+        return int(mtimes[fn])
 
-    # if we're looking at a set of archives, remove all the entries
-    # that aren't in the archive
-    if data.get("pi_yr"):
-        datestr = "%s%s%s" % (data["pi_yr"],
-                              data.get("pi_mo", ""),
-                              data.get("pi_da", ""))
-        entrylist = [
-            x for x in entrylist
-            if (time.strftime("%Y%m%d%H%M%S", x["timetuple"])
-                .startswith(datestr))]
+    num_entries = config['num_entries']
+    if ((data.get('truncate', False) and num_entries
+         and not plugin_utils.get_callback_chain('sortlist')
+         and not plugin_utils.get_callback_chain('truncatelist'))):
+        filelist = heapq.nlargest(num_entries, filelist, key=key)
+    else:
+        filelist = sorted(filelist, key=key, reverse=True)
+
+    entrylist = EntryList(request, filelist, mtimes, data["root_datadir"],
+                          sorted=True)
 
     args = {"request": request, "entry_list": entrylist}
     entrylist = tools.run_callback("sortlist",
@@ -954,6 +1294,9 @@ def blosxom_file_list_handler(args):
                                    donefunc=lambda x: x is not None,
                                    defaultfunc=blosxom_truncate_list_handler)
 
+    # Everything after this expects a list.
+    if isinstance(entrylist, EntryList):
+        entrylist = list(entrylist)
     return entrylist
 
 
@@ -968,6 +1311,8 @@ def blosxom_sort_list_handler(args):
     :returns: the sorted ``entry_list``
     """
     entrylist = args["entry_list"]
+    if isinstance(entrylist, EntryList) and entrylist.sorted:
+        return entrylist
     entrylist.sort(key=lambda entry: entry._mtime, reverse=True)
     return entrylist
 
@@ -986,9 +1331,10 @@ def blosxom_truncate_list_handler(args):
     data = request.get_data()
     config = request.get_configuration()
 
+    entrylist = args['entry_list']
     num_entries = config['num_entries']
     if data.get('truncate', False) and num_entries:
-        entrylist = args['entry_list'][:num_entries]
+        entrylist = entrylist[:num_entries]
     return entrylist
 
 
@@ -1026,7 +1372,7 @@ def route_date(cfg, url, data):
     data.update({
         'pi_bl': '',
         'bl_type': 'entry_list',
-        'root_datadir': os.path.join(cfg['datadir'], url.lstrip('/'))
+        'root_datadir': cfg['datadir']
     })
     return data
 
@@ -18,6 +18,7 @@ import time
 
 from douglas import __version__
 from douglas import plugin_utils
+from douglas import tools
 from douglas.app import Douglas, initialize
 from douglas.settings import import_config
 from douglas.tools import (
@@ -526,19 +527,48 @@ def cmd_compile(cfg, command, argv):
     parser = build_parser('%prog compile [options]')
     parser.add_option('--incremental',
                       action='store_true', dest='incremental', default=False,
-                      help='Option that causes compiling to be incremental.')
+                      help='Only compile urls where something they depend on changed.')
+    parser.add_option('--jobs',
+                      type='int', dest='jobs', default=1,
+                      help='Number of processes to render urls with. '
+                      'Defaults to 1.')
 
     (options, args) = parser.parse_args(argv)
 
+    if options.jobs < 1:
+        pwrap_error('ERROR: --jobs must be a positive integer.')
+        return 1
+
     # Turn on memcache.
     from douglas import memcache
+    memcache.configure(cfg)
     memcache.usecache = True
 
     p = build_douglas(cfg)
     if not p:
         return 0
 
-    return p.run_compile(options.incremental)
+    return p.run_compile(options.incremental, options.jobs)
+
+
+@with_config
+def cmd_buildindex(cfg, command, argv):
+    """Builds the entry index."""
+    parser = build_parser('%prog buildindex [options]')
+    (options, args) = parser.parse_args(argv)
+
+    p = build_douglas(cfg)
+    if not p:
+        return 0
+
+    from douglas import entryindex
+    tools.run_callback('start', {'request': p.get_request()})
+
+    index = entryindex.get_index(cfg)
+    index.update(force=True)
+    if options.verbose:
+        print 'Indexed {0} entries.'.format(len(index.entries))
+    return 0
 
 
 @with_config
@@ -554,6 +584,29 @@ def cmd_collectstatic(cfg, command, argv):
     return p.run_collectstatic()
 
 
+@with_config
+def cmd_precompilethemes(cfg, command, argv):
+    """Compiles the templates in all themes ahead of time."""
+    parser = build_parser('%prog precompilethemes [options]')
+    (options, args) = parser.parse_args(argv)
+
+    cachedir = cfg.get('theme_cache_dir')
+    if not cachedir:
+        print 'Set theme_cache_dir in your config file first.'
+        return 1
+
+    from douglas.renderers import jinjarenderer
+
+    themedir = cfg['themedir']
+    for theme in sorted(os.listdir(themedir)):
+        if not os.path.isdir(os.path.join(themedir, theme)):
+            continue
+        count = jinjarenderer.precompile_theme(themedir, theme, cachedir)
+        if options.verbose:
+            print 'Precompiled {0} templates in {1}.'.format(count, theme)
+    return 0
+
+
 DEFAULT_HANDLERS = [
     (key[4:], fun, fun.__doc__)
     for key, fun in globals().items() if key.startswith('cmd_')
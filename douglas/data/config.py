@@ -62,6 +62,9 @@ py["themedir"] = os.path.join(BLOGDIR, "themes")
 # ex: py['ignore_directories'] = ["CVS", "temp"]
 py["ignore_directories"] = []
 
+# Where should Douglas keep the index of entry metadata?
+py["entryindex_filename"] = os.path.join(BLOGDIR, "entries.index")
+
 # Whether or not to do day-based indexes?  (ex. /2012/01/01)
 py['day_indexes'] = False
 
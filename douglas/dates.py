@@ -0,0 +1,92 @@
+"""
+Formats dates for feeds and HTTP headers.
+
+``time.strftime`` uses the process locale for day and month names, so
+getting the English names standards require means switching the
+locale to ``C`` and back.  The locale is process-wide, so that isn't
+safe when other threads are running.  The functions here build the
+strings themselves and never touch the locale.
+
+Formatted values are cached by timestamp since the same handful of
+timestamps get formatted over and over when rendering.
+"""
+
+import time
+
+
+DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+          'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+# The maximum number of timestamps to keep formatted values for per
+# format.  When there are more, the cache gets thrown out.
+MAX_CACHED = 10000
+
+# Maps format name -> dict of timestamp -> formatted string
+_cache = {}
+
+
+def _cached(name, fun, mtime):
+    cache = _cache.setdefault(name, {})
+    try:
+        return cache[mtime]
+    except KeyError:
+        pass
+
+    if len(cache) >= MAX_CACHED:
+        cache.clear()
+    value = cache[mtime] = fun(time.gmtime(mtime))
+    return value
+
+
+def _rfc822date(gmt):
+    return '{0}, {1:02d} {2} {3:04d} {4:02d}:{5:02d} GMT'.format(
+        DAYS[gmt.tm_wday], gmt.tm_mday, MONTHS[gmt.tm_mon - 1],
+        gmt.tm_year, gmt.tm_hour, gmt.tm_min)
+
+
+def _httpdate(gmt):
+    return '{0}, {1:02d} {2} {3:04d} {4:02d}:{5:02d}:{6:02d} GMT'.format(
+        DAYS[gmt.tm_wday], gmt.tm_mday, MONTHS[gmt.tm_mon - 1],
+        gmt.tm_year, gmt.tm_hour, gmt.tm_min, gmt.tm_sec)
+
+
+def _w3cdate(gmt):
+    return '{0:04d}-{1:02d}-{2:02d}T{3:02d}:{4:02d}:{5:02d}Z'.format(
+        gmt.tm_year, gmt.tm_mon, gmt.tm_mday,
+        gmt.tm_hour, gmt.tm_min, gmt.tm_sec)
+
+
+def rfc822date(mtime):
+    """Returns the RFC 822 date for feeds.
+
+    >>> rfc822date(1216659107)
+    'Mon, 21 Jul 2008 16:51 GMT'
+
+    :arg mtime: seconds since the epoch
+    """
+    return _cached('rfc822date', _rfc822date, mtime)
+
+
+def httpdate(mtime):
+    """Returns the RFC 1123 date for HTTP headers like
+    ``Last-Modified``.
+
+    >>> httpdate(1216659107)
+    'Mon, 21 Jul 2008 16:51:47 GMT'
+
+    :arg mtime: seconds since the epoch
+    """
+    return _cached('httpdate', _httpdate, mtime)
+
+
+def w3cdate(mtime):
+    """Returns the W3C date.
+
+    >>> w3cdate(1216659107)
+    '2008-07-21T16:51:47Z'
+
+    :arg mtime: seconds since the epoch
+    """
+    return _cached('w3cdate', _w3cdate, mtime)
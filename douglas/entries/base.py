@@ -8,15 +8,138 @@ This module also holds a generic generate_entry function which will generate
 a BaseEntry with data that you provide for it.
 """
 
-import locale
 import time
-from UserDict import DictMixin
+
+from douglas import dates
 
 
 BIGNUM = 2000000000
 
 
-class EntryBase(object, DictMixin):
+# Date keys that get computed from the entry's time the first time
+# they're looked at.  Maps key -> strftime format for local time or
+# function that takes the mtime.
+DATE_KEYS = {
+    'ti': '%H:%M',
+    'mo': '%b',
+    'mo_num': '%m',
+    'da': '%d',
+    'dw': '%A',
+    'yr': '%Y',
+    'fulltime': '%Y%m%d%H%M%S',
+    'date': '%a, %d %b %Y',
+    # YYYY-MM-DDThh:mm:ssZ
+    'w3cdate': dates.w3cdate,
+    'rfc822date': dates.rfc822date
+}
+
+
+class DictLike(object):
+    """
+    Implements the rest of the dict interface in terms of
+    ``__getitem__``, ``__setitem__``, ``__delitem__`` and ``keys``.
+
+    This is like ``UserDict.DictMixin``, but it's a new-style class
+    with no instance dict, so subclasses can use ``__slots__``.
+    """
+    __slots__ = ()
+
+    def __iter__(self):
+        for key in self.keys():
+            yield key
+
+    def has_key(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __contains__(self, key):
+        return self.has_key(key)
+
+    def iteritems(self):
+        for key in self:
+            yield (key, self[key])
+
+    def iterkeys(self):
+        return self.__iter__()
+
+    def itervalues(self):
+        for _, value in self.iteritems():
+            yield value
+
+    def values(self):
+        return [value for _, value in self.iteritems()]
+
+    def items(self):
+        return list(self.iteritems())
+
+    def clear(self):
+        for key in self.keys():
+            del self[key]
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+        return default
+
+    def pop(self, key, *args):
+        if len(args) > 1:
+            raise TypeError('pop expected at most 2 arguments, got ' +
+                            repr(1 + len(args)))
+        try:
+            value = self[key]
+        except KeyError:
+            if args:
+                return args[0]
+            raise
+        del self[key]
+        return value
+
+    def popitem(self):
+        try:
+            key, value = self.iteritems().next()
+        except StopIteration:
+            raise KeyError('container is empty')
+        del self[key]
+        return (key, value)
+
+    def update(self, other=None, **kwargs):
+        if other is None:
+            pass
+        elif hasattr(other, 'iteritems'):
+            for key, value in other.iteritems():
+                self[key] = value
+        elif hasattr(other, 'keys'):
+            for key in other.keys():
+                self[key] = other[key]
+        else:
+            for key, value in other:
+                self[key] = value
+        if kwargs:
+            self.update(kwargs)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __cmp__(self, other):
+        if other is None:
+            return 1
+        if isinstance(other, DictLike):
+            other = dict(other.iteritems())
+        return cmp(dict(self.iteritems()), other)
+
+    def __len__(self):
+        return len(self.keys())
+
+
+class EntryBase(DictLike):
     """
     EntryBase is the base class for all the Entry classes.  Each
     instance of an Entry class represents a single entry in the
@@ -24,12 +147,22 @@ class EntryBase(object, DictMixin):
     somewhere off the InterWeeb.
 
     EntryBase derivatives are dict-like.
+
+    There can be a lot of entries around when rendering big listings,
+    so entries use ``__slots__`` and the date keys (``ti``, ``date``,
+    ``rfc822date``, ...) get computed the first time they're looked
+    at.
     """
+    __slots__ = ('_metadata', '_id', '_mtime', '_request', '_timetuple',
+                 '_dates_pending')
+
     def __init__(self, request):
         self._metadata = dict()
         self._id = ''
         self._mtime = BIGNUM
         self._request = request
+        self._timetuple = None
+        self._dates_pending = False
 
     def __repr__(self):
         """
@@ -63,58 +196,69 @@ class EntryBase(object, DictMixin):
                           time is expected to be local time, not UTC.
         """
         self._mtime = time.mktime(timetuple)
-        gmtimetuple = time.gmtime(self._mtime)
+        self._timetuple = timetuple
 
         self._metadata.update({
             'timetuple': timetuple,
-            'mtime': self._mtime,
-            'ti': time.strftime('%H:%M', timetuple),
-            'mo': time.strftime('%b', timetuple),
-            'mo_num': time.strftime('%m', timetuple),
-            'da': time.strftime('%d', timetuple),
-            'dw': time.strftime('%A', timetuple),
-            'yr': time.strftime('%Y', timetuple),
-            'fulltime': time.strftime('%Y%m%d%H%M%S', timetuple),
-            'date': time.strftime('%a, %d %b %Y', timetuple)
+            'mtime': self._mtime
         })
 
-        # YYYY-MM-DDThh:mm:ssZ
-        self._metadata['w3cdate'] = time.strftime(
-            '%Y-%m-%dT%H:%M:%SZ', gmtimetuple)
-
-        # Temporarily disable the set locale, so RFC-compliant date is
-        # really RFC-compliant: directives %a and %b are locale
-        # dependent.  Technically, we're after english locale, but
-        # only 'C' locale is guaranteed to exist.
-        loc = locale.getlocale(locale.LC_ALL)
-        locale.setlocale(locale.LC_ALL, 'C')
-
-        self._metadata['rfc822date'] = time.strftime(
-            '%a, %d %b %Y %H:%M GMT', gmtimetuple)
-
-        # set the locale back
-        locale.setlocale(locale.LC_ALL, loc)
+        # Throw out date keys from a previous time so they get
+        # computed from this one.
+        for key in DATE_KEYS:
+            self._metadata.pop(key, None)
+        self._dates_pending = True
+
+    def _compute_date(self, key):
+        """Computes a date key from the entry's time."""
+        fmt = DATE_KEYS[key]
+        if callable(fmt):
+            # These are standard formats that are in English regardless
+            # of the locale.
+            return fmt(self._mtime)
+        return time.strftime(fmt, self._timetuple)
+
+    def _compute_dates(self):
+        """Computes all the date keys that haven't been computed."""
+        if not self._dates_pending:
+            return
+        for key in DATE_KEYS:
+            if key not in self._metadata:
+                self._metadata[key] = self._compute_date(key)
+        self._dates_pending = False
+
+    def _has_key(self, key):
+        """Returns whether the key is set or is a date key that can be
+        computed.
+        """
+        return key in self._metadata or (self._dates_pending
+                                          and key in DATE_KEYS)
 
-    # Everything below this point implements the bits required for the
-    # DictMixin.
+    # Everything below this point implements the bits required for
+    # DictLike.
 
     def __contains__(self, key):
-        return key in self.keys()
-
-    def __iter__(self):
-        for key in self.keys():
-            yield key
+        return self._has_key(key)
 
     def __delitem__(self, key):
+        if key in DATE_KEYS:
+            self._compute_dates()
         return self._metadata.__delitem__(key)
 
     def __getitem__(self, key):
-        return self._metadata.__getitem__(key)
+        try:
+            return self._metadata[key]
+        except KeyError:
+            if not (self._dates_pending and key in DATE_KEYS):
+                raise
+        value = self._metadata[key] = self._compute_date(key)
+        return value
 
     def __setitem__(self, key, value):
         return self._metadata.__setitem__(key, value)
 
     def keys(self):
+        self._compute_dates()
         return self._metadata.keys()
 
 
@@ -0,0 +1,155 @@
+"""
+This module holds the EntryList which is a list of FileEntry instances
+that only creates the entries when they're looked at.
+
+Listing pages only show a handful of entries out of everything in the
+datadir.  The EntryList gets built from file names and mtimes, so
+sorting and truncating it doesn't create, stat or parse entries that
+never get shown.
+"""
+
+import time
+
+from douglas.entries.fileentry import FileEntry
+
+
+class EntryList(object):
+    """
+    List of entries that creates FileEntry instances for file names
+    the first time they're looked at.
+
+    This supports the list operations plugins use on entry lists:
+    ``len``, indexing, slicing, iterating, ``sort``, ``reverse``,
+    ``append``, ``extend``, ``insert``, ``pop``, ``remove`` and
+    ``del``.  Slices are EntryLists, too.
+
+    :arg request: the Request object
+    :arg filenames: list of entry file names
+    :arg mtimes: dict of file name -> mtime in seconds since the epoch
+    :arg root: the root to create FileEntry instances with
+    :arg sorted: whether the file names are already sorted newest
+        first
+    """
+    def __init__(self, request, filenames, mtimes, root, sorted=False):
+        self._request = request
+        # Items are either file names or entries.
+        self._items = list(filenames)
+        self._mtimes = mtimes
+        self._root = root
+        self.sorted = sorted
+
+    def __repr__(self):
+        return '<EntryList: %d entries>' % len(self._items)
+
+    def _get(self, i):
+        item = self._items[i]
+        if isinstance(item, basestring):
+            item = FileEntry(self._request, item, self._root,
+                             timetuple=time.localtime(self._mtimes[item]))
+            self._items[i] = item
+        return item
+
+    def _copy(self, items):
+        return EntryList(self._request, items, self._mtimes, self._root,
+                         self.sorted)
+
+    def copy(self, request=None):
+        """Returns a copy of this EntryList.
+
+        :arg request: the Request object entries that haven't been
+            created yet get created with; defaults to this list's
+        """
+        return EntryList(request or self._request, self._items,
+                         self._mtimes, self._root, self.sorted)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._copy(self._items[i])
+        return self._get(i)
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+    def __setitem__(self, i, value):
+        self.sorted = False
+        if isinstance(i, slice):
+            value = list(value)
+        self._items[i] = value
+
+    def __setslice__(self, i, j, value):
+        return self.__setitem__(slice(i, j), value)
+
+    def __delitem__(self, i):
+        del self._items[i]
+
+    def __delslice__(self, i, j):
+        return self.__delitem__(slice(i, j))
+
+    def __iter__(self):
+        for i in range(len(self._items)):
+            yield self._get(i)
+
+    def __reversed__(self):
+        for i in range(len(self._items) - 1, -1, -1):
+            yield self._get(i)
+
+    def _find(self, entry):
+        # Comparing entries with == parses them, so look for the
+        # entry itself first.
+        for i, mem in enumerate(self._items):
+            if mem is entry:
+                return i
+        for i, mem in enumerate(self):
+            if mem == entry:
+                return i
+        return -1
+
+    def __contains__(self, item):
+        return self._find(item) != -1
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def append(self, entry):
+        self.sorted = False
+        self._items.append(entry)
+
+    def extend(self, entries):
+        self.sorted = False
+        self._items.extend(list(entries))
+
+    def insert(self, i, entry):
+        self.sorted = False
+        self._items.insert(i, entry)
+
+    def pop(self, i=-1):
+        entry = self._get(i)
+        del self._items[i]
+        return entry
+
+    def remove(self, entry):
+        i = self._find(entry)
+        if i == -1:
+            raise ValueError('EntryList.remove(x): x not in list')
+        del self._items[i]
+
+    def index(self, entry):
+        i = self._find(entry)
+        if i == -1:
+            raise ValueError('EntryList.index(x): x not in list')
+        return i
+
+    def reverse(self):
+        self.sorted = False
+        self._items.reverse()
+
+    def sort(self, *args, **kwargs):
+        """Sorts the entries like ``list.sort``.  This creates all the
+        entries.
+        """
+        self._items = list(self)
+        self._items.sort(*args, **kwargs)
+        self.sorted = False
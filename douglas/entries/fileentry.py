@@ -2,37 +2,57 @@ import os
 import re
 import time
 
+from douglas import incremental
 from douglas import tools
 from douglas.entries import base
 
 
+# Marks keys that were deleted before the entry was parsed.
+_DELETED = object()
+
+
 class FileEntry(base.EntryBase):
     """
     This class gets it's data and metadata from the file specified
     by the filename argument.
     """
-    def __init__(self, request, filename, root, datadir=""):
+    __slots__ = ('_filename', '_root', '_datadir', '__header_populated',
+                 '__populated', '__changed')
+
+    def __init__(self, request, filename, root, datadir="", timetuple=None):
         """
         :arg request: the Request object
         :arg filename: the complete filename for the file in question
             including path
         :arg root: i have no clue what this is
         :arg datadir: the datadir
+        :arg timetuple: the filestat for the file if it's already
+            known; otherwise this runs ``tools.filestat``
         """
         base.EntryBase.__init__(self, request)
-        self._config = request.get_configuration()
         self._filename = filename.replace(os.sep, '/')
         self._root = root.replace(os.sep, '/')
 
-        self._datadir = datadir or self._config["datadir"]
+        self._datadir = datadir or request.get_configuration()["datadir"]
         if self._datadir.endswith(os.sep):
             self._datadir = self._datadir[:-1]
 
-        self._timetuple = tools.filestat(self._request, self._filename)
+        if timetuple is None:
+            timetuple = tools.filestat(self._request, self._filename)
+        self._timetuple = timetuple
         self._mtime = time.mktime(self._timetuple)
-        self._fulltime = time.strftime("%Y%m%d%H%M%S", self._timetuple)
+
+        # Entries get populated in two steps: the header (title and
+        # metadata lines) gets read the first time anything is looked
+        # at and the whole entry gets parsed the first time something
+        # that isn't in the header (e.g. body) is looked at.
+        self.__header_populated = 0
         self.__populated = 0
 
+        # Keys that were set or deleted before the entry was parsed.
+        # These win over what the entry parser returns.
+        self.__changed = None
+
     def __repr__(self):
         return "<fileentry f'%s' r'%s'>" % (self._filename, self._root)
 
@@ -50,28 +70,51 @@ class FileEntry(base.EntryBase):
             self._populatedata()
         return super(FileEntry, self).keys()
 
+    def __contains__(self, key):
+        if not self.__header_populated:
+            self._populateheader()
+        if not self.__populated and not self._has_key(key):
+            self._populatedata()
+        return self._has_key(key)
+
     def __delitem__(self, key):
-        if not self.__populated:
+        if not self.__header_populated:
+            self._populateheader()
+        if not self.__populated and not self._has_key(key):
             self._populatedata()
+        if not self.__populated:
+            if self.__changed is None:
+                self.__changed = {}
+            self.__changed[key] = _DELETED
         return super(FileEntry, self).__delitem__(key)
 
     def __getitem__(self, key):
-        if not self.__populated:
+        if not self.__header_populated:
+            self._populateheader()
+        if not self.__populated and not self._has_key(key):
             self._populatedata()
         return super(FileEntry, self).__getitem__(key)
 
     def __setitem__(self, key, value):
+        if not self.__header_populated:
+            self._populateheader()
         if not self.__populated:
-            self._populatedata()
+            if self.__changed is None:
+                self.__changed = {}
+            self.__changed[key] = value
         return super(FileEntry, self).__setitem__(key, value)
 
-    def _populatedata(self):
+    def _populateheader(self):
         """
-        Fills the metadata dict with metadata about the given file.
-        This metadata consists of things we pick up from an os.stat
-        call as well as knowledge of the filename and the root
-        directory.  We then parse the file and fill in the rest of the
-        information that we know.
+        Fills the metadata dict with metadata about the given file
+        that doesn't require parsing the whole file.  This is stuff
+        we know from the filename and the root directory, the mtime
+        and the title and metadata lines at the top of the file.
+
+        The title and metadata lines only get read here for entry
+        parsers that have ``entry_header`` set to True (i.e. they parse
+        the Douglas entry format).  For everything else, the whole
+        entry gets parsed.
         """
         file_basename = os.path.basename(self._filename)
 
@@ -108,15 +151,47 @@ class FileEntry(base.EntryBase):
 
         self.set_time(self._timetuple)
 
+        config = self._request.get_configuration()
+        incremental.record_file(config, self._filename)
+
+        self.__header_populated = 1
+
+        if getattr(self._get_parser(), 'entry_header', False):
+            self._metadata.update(tools.read_entry_header(
+                self._filename, config['blog_encoding']))
+        else:
+            self._populatedata()
+
+    def _get_parser(self):
+        """
+        Returns the entry parser for this file's extension.
+        """
         config = self._request.get_configuration()
 
         fileext = os.path.splitext(self._filename)
         if fileext:
             fileext = fileext[1][1:]
-        eparser = config['extensions'][fileext]
+        return config['extensions'][fileext]
+
+    def _populatedata(self):
+        """
+        Parses the whole file with the entry parser for its extension
+        and fills the metadata dict with what it returns.
+        """
+        if not self.__header_populated:
+            self._populateheader()
+
+        eparser = self._get_parser()
         entrydict = eparser(self._filename, self._request)
 
         # Update the _metadata directly skipping over this class'
         # dict-like stuff. Otherwise we end up in a vicious loop!
         self._metadata.update(entrydict)
+        if self.__changed:
+            for key, value in self.__changed.items():
+                if value is _DELETED:
+                    self._metadata.pop(key, None)
+                else:
+                    self._metadata[key] = value
+        self.__changed = None
         self.__populated = 1
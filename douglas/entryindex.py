@@ -0,0 +1,484 @@
+"""
+The entry index holds metadata for all the entries in the datadir so
+that Douglas doesn't have to walk the datadir, stat every entry, run
+the filestat callback chain and parse every entry file on every
+request.
+
+For each entry, the index keeps:
+
+* ``mtime`` and ``size`` -- from ``os.stat``; used to figure out
+  whether the entry changed
+* ``published`` -- the mtime (seconds since the epoch) as determined
+  by the ``filestat`` callback chain
+* ``title``, ``tags`` -- from the entry header
+* ``category`` -- the directory the entry is in relative to the
+  datadir
+* ``hash`` -- md5 hexdigest of the entry file contents
+
+The index is updated incrementally: only entries that were added,
+changed or removed since the last update get (re-)read.
+
+If ``entryindex_filename`` is set, the index is persisted to that file
+and loaded the next time Douglas starts up.
+"""
+
+import cPickle as pickle
+import hashlib
+import logging
+import os
+import os.path
+import shutil
+import time
+
+
+INDEX_VERSION = 1
+
+
+# Maps (datadir, filename) to EntryIndex instances for this process.
+_indexes = {}
+
+
+def get_index(cfg):
+    """Returns the EntryIndex for this config.
+
+    The index is loaded from disk (if there is one) the first time it's
+    asked for and after that lives for the lifetime of the process.
+
+    :arg cfg: config dict
+
+    :returns: EntryIndex instance
+    """
+    datadir = os.path.normpath(cfg['datadir'])
+    key = (datadir, cfg.get('entryindex_filename', ''))
+
+    index = _indexes.get(key)
+    if index is None or index.signature != get_signature(cfg):
+        index = EntryIndex(cfg)
+        index.load()
+        _indexes[key] = index
+    return index
+
+
+def get_signature(cfg):
+    """Returns the things in the config that affect what's in the index.
+
+    If any of these change, then the index has to be rebuilt from
+    scratch.
+    """
+    return repr((
+        INDEX_VERSION,
+        sorted(cfg.get('extensions', {}).keys()),
+        list(cfg.get('ignore_directories', [])),
+        list(cfg.get('load_plugins', [])),
+        cfg.get('blog_encoding', 'utf-8')
+    ))
+
+
+def category_parents(category):
+    """Yields the category and all its parents including the root
+    category ``''``.
+
+    >>> list(category_parents('a/b'))
+    ['', 'a', 'a/b']
+    """
+    parts = [part for part in category.split('/') if part]
+    for i in range(len(parts) + 1):
+        yield '/'.join(parts[:i])
+
+
+class EntryIndex(object):
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.datadir = os.path.normpath(cfg['datadir'])
+        self.filename = cfg.get('entryindex_filename', '')
+        self.check_interval = cfg.get('entryindex_check_interval', 5)
+        self.signature = get_signature(cfg)
+
+        # Maps entry filename -> record dict
+        self.entries = {}
+
+        # This gets bumped every time the index changes.
+        self.generation = 0
+
+        self.last_checked = 0
+
+        # Whether the datadir has been checked since the last
+        # ``expire``.
+        self.checked = False
+
+        # (generation, digest, latest mtime) for get_summary
+        self._summary = None
+
+        # (generation, buckets) for get_dates
+        self._dates = None
+
+        # Maps category -> [number of entries, latest published time]
+        # for every category and all its parents.  This gets updated
+        # as records are added and removed.
+        self.categories = {}
+
+        # Categories whose latest published time has to be figured
+        # out again because their latest entry was removed or changed.
+        self._stale_categories = set()
+
+    def load(self):
+        """Loads the index from disk if it's persisted and the data
+        there was built with the same signature.
+        """
+        if not self.filename or not os.path.exists(self.filename):
+            return
+
+        try:
+            with open(self.filename, 'rb') as fp:
+                indexdata = pickle.load(fp)
+        except (IOError, EOFError, pickle.UnpicklingError) as exc:
+            logging.getLogger().warning(
+                'Could not load entry index %s: %s', self.filename, exc)
+            return
+
+        if indexdata.get('signature') != self.signature:
+            return
+
+        self.entries = indexdata['entries']
+        self.generation = indexdata['generation']
+        if 'categories' in indexdata:
+            self.categories = indexdata['categories']
+        else:
+            self.build_categories()
+
+    def save(self):
+        """Saves the index to disk if it's persisted."""
+        if not self.filename:
+            return
+
+        indexdata = {
+            'signature': self.signature,
+            'generation': self.generation,
+            'entries': self.entries,
+            'categories': self.get_categories()
+        }
+        tmp_fn = '{0}.{1}.new'.format(self.filename, os.getpid())
+        try:
+            with open(tmp_fn, 'wb') as fp:
+                pickle.dump(indexdata, fp, pickle.HIGHEST_PROTOCOL)
+            shutil.move(tmp_fn, self.filename)
+        except (IOError, OSError) as exc:
+            logging.getLogger().warning(
+                'Could not save entry index %s: %s', self.filename, exc)
+
+    def walk(self):
+        """Returns the list of all entry files in the datadir."""
+        from douglas import tools
+        return tools.walk_entries(self.cfg, self.datadir)
+
+    def build_record(self, filename, st, published=None):
+        """Reads the entry file and builds the index record for it.
+
+        :arg filename: the entry file
+        :arg st: ``os.stat`` result for the file
+        :arg published: the mtime as determined by the ``filestat``
+            callback chain; if ``None``, this runs the chain
+        """
+        from douglas import tools
+
+        if published is None:
+            published = tools.filestat_mtime(self.cfg, filename)
+
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+
+        encoding = self.cfg.get('blog_encoding', 'utf-8')
+        lines = data.decode(encoding, 'replace').splitlines(True)
+        header, header_len = tools.parse_entry_header(lines)
+
+        category = os.path.dirname(filename)[len(self.datadir) + 1:]
+
+        return {
+            'mtime': st.st_mtime,
+            'size': st.st_size,
+            'published': published,
+            'title': header.get('title', ''),
+            'tags': header.get('tags', ''),
+            'category': category.replace(os.sep, '/'),
+            'hash': hashlib.md5(data).hexdigest()
+        }
+
+    def is_stale(self, record, st):
+        return (record is None
+                or record['mtime'] != st.st_mtime
+                or record['size'] != st.st_size)
+
+    def expire(self):
+        """Makes the next ``update`` check the datadir again.
+
+        This gets called at the start of every request, so the datadir
+        gets walked at most once per request and at most every
+        ``entryindex_check_interval`` seconds.
+        """
+        self.checked = False
+
+    def update(self, force=False):
+        """Walks the datadir and updates the records for entries that
+        were added, changed or removed.
+
+        This only walks the datadir if it hasn't done so since the
+        last ``expire``.  If ``entryindex_check_interval`` is set, then
+        this also only walks the datadir if it hasn't done so in that
+        many seconds.
+
+        :arg force: walk the datadir regardless of the check interval
+
+        :returns: True if the index changed and False otherwise
+        """
+        now = time.time()
+        if ((not force
+             and (self.checked
+                  or (self.check_interval
+                      and now - self.last_checked < self.check_interval)))):
+            return False
+        self.last_checked = now
+        self.checked = True
+
+        files = self.walk()
+
+        stale = {}
+        for fn in files:
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+
+            if self.is_stale(self.entries.get(fn), st):
+                stale[fn] = st
+        self.build_records(stale)
+
+        removed = set(self.entries).difference(files)
+        for fn in removed:
+            self.remove_record(fn)
+
+        if stale or removed:
+            self.generation += 1
+            self.save()
+            return True
+        return False
+
+    def get_summary(self):
+        """Returns a ``(digest, latest mtime)`` tuple for the entries in
+        the index.
+
+        The digest changes whenever an entry is added, changed or
+        removed.  The latest mtime is the most recent ``os.stat`` mtime
+        of all the entries.  These get computed once per generation.
+        """
+        if self._summary is None or self._summary[0] != self.generation:
+            md5 = hashlib.md5()
+            latest = 0
+            for fn in sorted(self.entries):
+                record = self.entries[fn]
+                md5.update(repr((fn, record['hash'], record['published'])))
+                latest = max(latest, record['mtime'])
+            self._summary = (self.generation, md5.hexdigest(), latest)
+        return self._summary[1:]
+
+    def get_dates(self):
+        """Returns the date buckets for the entries in the index.
+
+        This maps year -> month -> day -> sorted list of entry
+        filenames where the year, month and day are strings like
+        ``'2012'``, ``'05'`` and ``'09'`` for the published time in
+        local time.  The buckets get computed once per generation.
+        """
+        if self._dates is None or self._dates[0] != self.generation:
+            buckets = {}
+            for fn in sorted(self.entries):
+                published = time.localtime(self.entries[fn]['published'])
+                year = '{0:04d}'.format(published.tm_year)
+                month = '{0:02d}'.format(published.tm_mon)
+                day = '{0:02d}'.format(published.tm_mday)
+                (buckets.setdefault(year, {})
+                        .setdefault(month, {})
+                        .setdefault(day, [])
+                        .append(fn))
+            self._dates = (self.generation, buckets)
+        return self._dates[1]
+
+    def get_date_entries(self, year, month='', day='', recurse=0):
+        """Returns the list of entry files published in the given
+        year, month or day.
+
+        :arg year: the year (e.g. ``'2012'``)
+        :arg month: the month (e.g. ``'05'``) or ``''`` for the whole
+            year
+        :arg day: the day (e.g. ``'09'``) or ``''`` for the whole month
+        :arg recurse: the depth of recursion from the datadir; 0 goes
+            all the way down
+
+        :returns: sorted list of entry filenames
+        """
+        months = self.get_dates().get(year, {})
+        if month:
+            months = {month: months.get(month, {})}
+
+        files = []
+        for days in months.values():
+            if day:
+                files.extend(days.get(day, []))
+            else:
+                for day_files in days.values():
+                    files.extend(day_files)
+
+        if recurse:
+            prefix_len = len(self.datadir) + 1
+            files = [fn for fn in files
+                     if fn[prefix_len:].count(os.sep) < recurse]
+        return sorted(files)
+
+    def build_records(self, stale):
+        """Builds records for a bunch of entries figuring out the
+        published times for all of them in one pass.
+
+        :arg stale: dict of entry filename -> ``os.stat`` result
+        """
+        from douglas import tools
+
+        if not stale:
+            return
+
+        published = tools.filestat_mtime_many(self.cfg, sorted(stale))
+        for fn, st in stale.items():
+            self.set_record(fn, self.build_record(fn, st, published[fn]))
+
+    def set_record(self, filename, record):
+        """Adds or replaces the record for an entry and updates the
+        category counts.
+        """
+        if filename in self.entries:
+            self.remove_record(filename)
+        self.entries[filename] = record
+
+        for category in category_parents(record['category']):
+            node = self.categories.setdefault(category, [0, 0])
+            node[0] += 1
+            node[1] = max(node[1], record['published'])
+
+    def remove_record(self, filename):
+        """Removes the record for an entry and updates the category
+        counts.
+        """
+        record = self.entries.pop(filename)
+        for category in category_parents(record['category']):
+            node = self.categories[category]
+            node[0] -= 1
+            if node[0] == 0:
+                del self.categories[category]
+                self._stale_categories.discard(category)
+            elif record['published'] >= node[1]:
+                self._stale_categories.add(category)
+
+    def build_categories(self):
+        """Builds the category counts from scratch."""
+        self.categories = {}
+        self._stale_categories = set()
+        for fn in sorted(self.entries):
+            record = self.entries.pop(fn)
+            self.set_record(fn, record)
+
+    def get_categories(self):
+        """Returns the category tree for the entries in the index.
+
+        This maps category -> ``[number of entries, latest published
+        time]`` where categories are relative to the datadir and use
+        ``/`` as the separator.  The root category is ``''``.  Counts
+        include entries in subcategories.
+        """
+        if self._stale_categories:
+            stale = self._stale_categories
+            for category in stale:
+                self.categories[category][1] = 0
+            for record in self.entries.values():
+                for category in category_parents(record['category']):
+                    if category in stale:
+                        node = self.categories[category]
+                        node[1] = max(node[1], record['published'])
+            self._stale_categories = set()
+        return self.categories
+
+    def get_record(self, filename):
+        """Returns the up-to-date record for the given entry file or
+        ``None`` if the file isn't an entry in the datadir.
+
+        This stats the file and re-reads it if it changed.
+        """
+        return self.get_records([filename]).get(filename)
+
+    def get_records(self, filenames, check=True):
+        """Returns the up-to-date records for the given files that are
+        entries in the datadir.
+
+        This stats the files and re-reads the ones that changed.
+
+        :arg filenames: list of file names
+        :arg check: whether to stat files that are in the index to see
+            if they changed; pass False if the index was just updated
+
+        :returns: dict of file name (as passed in) -> record
+        """
+        prefix = self.datadir + os.sep
+
+        normed = {}
+        stale = {}
+        for filename in filenames:
+            if not check and filename in self.entries:
+                normed[filename] = filename
+                continue
+
+            fn = os.path.normpath(filename)
+            if not fn.startswith(prefix):
+                continue
+
+            if not check and fn in self.entries:
+                normed[filename] = fn
+                continue
+
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+
+            normed[filename] = fn
+            if self.is_stale(self.entries.get(fn), st):
+                stale[fn] = st
+
+        if stale:
+            self.build_records(stale)
+            self.generation += 1
+            self.save()
+
+        return dict((filename, self.entries[fn])
+                    for filename, fn in normed.items())
+
+    def get_entries(self, root, recurse=0):
+        """Returns the list of entry files under root.
+
+        :arg root: the directory to list entries for--this must be in
+            the datadir
+        :arg recurse: the depth of recursion; 0 goes all the way down
+
+        :returns: sorted list of entry filenames
+        """
+        root = os.path.normpath(root)
+        if root == self.datadir:
+            prefix = self.datadir + os.sep
+        elif root.startswith(self.datadir + os.sep):
+            prefix = root + os.sep
+        else:
+            return []
+
+        files = []
+        for fn in self.entries:
+            if not fn.startswith(prefix):
+                continue
+            if recurse and fn[len(prefix):].count(os.sep) >= recurse:
+                continue
+            files.append(fn)
+        return sorted(files)
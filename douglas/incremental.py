@@ -0,0 +1,282 @@
+"""
+Dependency tracking for incremental compiling.
+
+While a url is compiled, Douglas records what went into it:
+
+* files -- entries that were parsed, templates that were loaded and
+  other data files plugins read (e.g. the tags index)
+* listings -- lists of entries that were asked for with
+  ``tools.get_entries`` or ``tools.get_date_entries`` (e.g. to build
+  an index page or a category list)
+
+The signatures of all those things get saved in the compile manifest
+along with a signature of the config.  The next time the blog is
+compiled incrementally, only the urls whose recorded signatures
+changed get compiled again.
+
+Plugins that pull in data from somewhere Douglas doesn't know about
+should call ``record_file`` so that incremental compiling picks up
+changes to it.
+"""
+
+import cPickle as pickle
+import hashlib
+import logging
+import os
+import os.path
+import shutil
+
+
+MANIFEST_VERSION = 1
+
+MANIFEST_FILENAME = '.douglas_manifest'
+
+
+# Stack of Dependencies instances for the urls being compiled right
+# now.  Things get recorded in all of them since compiling a url can
+# cause other urls to get compiled (e.g. paginate).
+_recording = []
+
+# Maps (datadir, root, recurse) -> (index, generation, filenames,
+# signature) for the listings recorded last.  Every url compiled
+# records the same handful of listings, so their signatures only get
+# figured out again when the index or the list changes.
+_listing_signatures = {}
+
+
+class Dependencies(object):
+    def __init__(self):
+        # Maps filename -> signature
+        self.files = {}
+        # Maps (root, recurse) -> signature
+        self.listings = {}
+
+    def snapshot(self):
+        return {'files': self.files, 'listings': self.listings}
+
+
+def start_recording():
+    """Starts recording dependencies for a url."""
+    _recording.append(Dependencies())
+
+
+def stop_recording():
+    """Stops recording dependencies for a url and returns them.
+
+    :returns: Dependencies instance
+    """
+    return _recording.pop()
+
+
+def is_recording():
+    return bool(_recording)
+
+
+def file_signature(cfg, filename):
+    """Returns the signature for a file.
+
+    For entries in the entry index, this is the content hash.  For
+    everything else, it's the mtime and size.  If the file doesn't
+    exist, this returns ``None``.
+
+    :arg cfg: config dict or ``None`` if the file isn't an entry
+    :arg filename: the file to return the signature for
+    """
+    from douglas import entryindex
+
+    filename = os.path.normpath(filename)
+    if cfg is not None:
+        record = entryindex.get_index(cfg).entries.get(filename)
+        if record is not None:
+            return record['hash']
+
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def listing_signature(cfg, filenames):
+    """Returns the signature for a list of entries.
+
+    This covers which entries are in the list and their published
+    times, but not their contents.
+    """
+    from douglas import entryindex
+
+    entries = entryindex.get_index(cfg).entries
+    md5 = hashlib.md5()
+    for fn in sorted(filenames):
+        record = entries.get(os.path.normpath(fn))
+        if record is not None:
+            published = record['published']
+        else:
+            published = file_signature(cfg, fn)
+        md5.update(repr((fn, published)))
+    return md5.hexdigest()
+
+
+def record_file(cfg, filename):
+    """Records that the url being compiled depends on this file.
+
+    :arg cfg: config dict or ``None`` if the file isn't an entry
+    :arg filename: the file
+    """
+    if not _recording:
+        return
+    sig = file_signature(cfg, filename)
+    for deps in _recording:
+        deps.files[filename] = sig
+
+
+def record_listing(cfg, root, recurse, filenames):
+    """Records that the url being compiled depends on this list of
+    entries.
+    """
+    if not _recording:
+        return
+
+    from douglas import entryindex
+
+    index = entryindex.get_index(cfg)
+    filenames = tuple(filenames)
+    key = (index.datadir, root, recurse)
+    cached = _listing_signatures.get(key)
+    if ((cached is not None and cached[0] is index
+         and cached[1] == index.generation and cached[2] == filenames)):
+        sig = cached[3]
+    else:
+        sig = listing_signature(cfg, filenames)
+        # Files outside the datadir aren't in the index, so their
+        # signatures can change without the generation changing.
+        entries = index.entries
+        if all(os.path.normpath(fn) in entries for fn in filenames):
+            _listing_signatures[key] = (index, index.generation, filenames,
+                                        sig)
+
+    for deps in _recording:
+        deps.listings[(root, recurse)] = sig
+
+
+def record_dependencies(deps):
+    """Records dependencies that were recorded earlier for something
+    else.  This is for things that get computed once and used by many
+    urls.
+
+    :arg deps: Dependencies instance
+    """
+    for mem in _recording:
+        mem.files.update(deps.files)
+        mem.listings.update(deps.listings)
+
+
+def _stable_value(val):
+    """Converts a config value to something with a repr that's the
+    same across processes.
+    """
+    if isinstance(val, dict):
+        return sorted((key, _stable_value(item)) for key, item in val.items())
+    if isinstance(val, (list, tuple)):
+        return [_stable_value(item) for item in val]
+    if isinstance(val, (basestring, int, long, float, bool, type(None))):
+        return val
+    if hasattr(val, '__name__'):
+        # Functions, classes and modules (e.g. entry parsers in
+        # ``extensions``).
+        return '{0}.{1}'.format(getattr(val, '__module__', ''), val.__name__)
+    return type(val).__name__
+
+
+def config_signature(cfg):
+    """Returns a signature for the config values that could affect
+    rendering.
+    """
+    items = [(key, _stable_value(val)) for key, val in sorted(cfg.items())
+             if key != 'stdoutput']
+    return hashlib.md5(repr(items)).hexdigest()
+
+
+def get_manifestfile(cfg):
+    return os.path.join(cfg['compiledir'], MANIFEST_FILENAME)
+
+
+class Manifest(object):
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.filename = get_manifestfile(cfg)
+        self.config = config_signature(cfg)
+
+        # Maps (url, query) -> dependencies snapshot
+        self.urls = {}
+
+        self._listings = {}
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return
+
+        try:
+            with open(self.filename, 'rb') as fp:
+                data = pickle.load(fp)
+        except (IOError, EOFError, pickle.UnpicklingError) as exc:
+            logging.getLogger().warning(
+                'Could not load compile manifest %s: %s', self.filename, exc)
+            return
+
+        # If the config changed, then everything is stale.
+        if ((data.get('version') != MANIFEST_VERSION
+             or data.get('config') != self.config)):
+            return
+
+        self.urls = data['urls']
+
+    def save(self):
+        data = {
+            'version': MANIFEST_VERSION,
+            'config': self.config,
+            'urls': self.urls
+        }
+        tmp_fn = '{0}.{1}.new'.format(self.filename, os.getpid())
+        with open(tmp_fn, 'wb') as fp:
+            pickle.dump(data, fp, pickle.HIGHEST_PROTOCOL)
+        shutil.move(tmp_fn, self.filename)
+
+    def current_listing(self, root, recurse):
+        """Returns the current signature for a listing."""
+        from douglas import tools
+
+        key = (root, recurse)
+        if key not in self._listings:
+            if isinstance(root, tuple):
+                # ('date', year, month, day) from get_date_entries
+                filenames = tools.get_date_entries(
+                    self.cfg, *root[1:], recurse=recurse)
+            else:
+                filenames = tools.get_entries(self.cfg, root, recurse)
+            self._listings[key] = listing_signature(self.cfg, filenames)
+        return self._listings[key]
+
+    def is_stale(self, url, query):
+        """Returns whether the url needs to be compiled."""
+        deps = self.urls.get((url, query))
+        if deps is None:
+            return True
+
+        fn = os.path.normpath(self.cfg['compiledir'] + os.sep + url)
+        if not os.path.exists(fn):
+            return True
+
+        for filename, sig in deps['files'].items():
+            if file_signature(self.cfg, filename) != sig:
+                return True
+
+        for (root, recurse), sig in deps['listings'].items():
+            if self.current_listing(root, recurse) != sig:
+                return True
+
+        return False
+
+    def update(self, url, query, snapshot):
+        """Records dependencies for a url that was compiled."""
+        self.urls[(url, query)] = snapshot
@@ -1,26 +1,383 @@
+import cPickle as pickle
+import hashlib
+import logging
+import os
+import os.path
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
 # Whether or not to use memcache.
 usecache = False
 
-_memcache_cache = {}
+# Scopes whose values only make sense in the process that created
+# them. Backends that share values across processes keep these local.
+local_scopes = set()
+
+
+class DictBackend(object):
+    """Keeps everything in memory forever.
+
+    This is great for compiling, but not for running as a long-running
+    WSGI application since it grows without bound.
+    """
+    def __init__(self):
+        self._cache = {}
+
+    def get(self, scope, key):
+        return self._cache.setdefault(scope, {})[key]
+
+    def set(self, scope, key, value):
+        self._cache.setdefault(scope, {})[key] = value
+
+    def clear(self, scope=None):
+        if scope is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(scope, None)
+
+
+class LRUBackend(object):
+    """Keeps at most ``max_entries`` items per scope in memory
+    evicting the least recently used ones and expiring items after
+    ``ttl`` seconds.
+
+    This is safe to use in long-running WSGI applications.
+
+    :arg max_entries: the maximum number of items per scope; 0 means
+        no limit
+    :arg ttl: the number of seconds items live for; 0 means they live
+        until they're evicted
+    """
+    def __init__(self, max_entries=1000, ttl=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope, key):
+        with self._lock:
+            items = self._cache.setdefault(scope, OrderedDict())
+            expires, value = items.pop(key)
+            if expires and expires < time.time():
+                raise KeyError(key)
+            # Re-insert it so it's the most recently used.
+            items[key] = (expires, value)
+            return value
+
+    def set(self, scope, key, value):
+        expires = time.time() + self.ttl if self.ttl else 0
+        with self._lock:
+            items = self._cache.setdefault(scope, OrderedDict())
+            items.pop(key, None)
+            items[key] = (expires, value)
+            if self.max_entries:
+                while len(items) > self.max_entries:
+                    items.popitem(last=False)
+
+    def clear(self, scope=None):
+        with self._lock:
+            if scope is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(scope, None)
+
+
+class SQLiteBackend(object):
+    """Keeps items in a SQLite database so that all the processes
+    running the blog on a host share them.
+
+    Values are pickled.  Values that can't be pickled and values in
+    ``local_scopes`` (e.g. jinja environments) are kept in memory in
+    the process with an ``LRUBackend``.
+
+    :arg filename: the SQLite database file
+    :arg max_entries: the maximum number of items per scope; 0 means
+        no limit.  When there are too many, the oldest ones get thrown
+        out.
+    :arg ttl: the number of seconds items live for; 0 means they live
+        until they're thrown out
+    """
+    def __init__(self, filename, max_entries=1000, ttl=0):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = LRUBackend(max_entries, ttl)
+        self._conns = threading.local()
+
+    def get_connection(self):
+        # Connections can't be shared across threads or forks, so
+        # there's one per thread per process.
+        conn = getattr(self._conns, 'conn', None)
+        if conn is None or self._conns.pid != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=10)
+            conn.text_factory = str
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'scope TEXT, key TEXT, value BLOB, expires REAL, '
+                'PRIMARY KEY (scope, key))')
+            conn.commit()
+            self._conns.conn = conn
+            self._conns.pid = os.getpid()
+        return conn
+
+    def make_key(self, key):
+        return hashlib.md5(repr(key)).hexdigest()
+
+    def get(self, scope, key):
+        try:
+            return self._local.get(scope, key)
+        except KeyError:
+            pass
+
+        try:
+            row = self.get_connection().execute(
+                'SELECT value, expires FROM cache WHERE scope=? AND key=?',
+                (scope, self.make_key(key))).fetchone()
+        except sqlite3.Error as exc:
+            logging.getLogger().warning('memcache get failed: %s', exc)
+            raise KeyError(key)
+
+        if row is None or (row[1] and row[1] < time.time()):
+            raise KeyError(key)
+
+        try:
+            return pickle.loads(str(row[0]))
+        except Exception as exc:
+            # The row is corrupt, so throw it out and treat it as a
+            # miss.
+            logging.getLogger().warning('memcache get failed: %s', exc)
+            try:
+                conn = self.get_connection()
+                with conn:
+                    conn.execute(
+                        'DELETE FROM cache WHERE scope=? AND key=?',
+                        (scope, self.make_key(key)))
+            except sqlite3.Error:
+                pass
+            raise KeyError(key)
+
+    def set(self, scope, key, value):
+        if scope in local_scopes:
+            self._local.set(scope, key, value)
+            return
+
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self._local.set(scope, key, value)
+            return
+
+        expires = time.time() + self.ttl if self.ttl else 0
+        try:
+            conn = self.get_connection()
+            with conn:
+                # Replacing a row gives it a new rowid, so the rowid
+                # tells us which rows are the oldest.
+                conn.execute(
+                    'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                    (scope, self.make_key(key), sqlite3.Binary(data),
+                     expires))
+                if self.max_entries:
+                    conn.execute(
+                        'DELETE FROM cache WHERE scope=? AND key NOT IN '
+                        '(SELECT key FROM cache WHERE scope=? '
+                        'ORDER BY rowid DESC LIMIT ?)',
+                        (scope, scope, self.max_entries))
+        except sqlite3.Error as exc:
+            logging.getLogger().warning('memcache set failed: %s', exc)
+
+    def clear(self, scope=None):
+        self._local.clear(scope)
+        try:
+            conn = self.get_connection()
+            with conn:
+                if scope is None:
+                    conn.execute('DELETE FROM cache')
+                else:
+                    conn.execute('DELETE FROM cache WHERE scope=?', (scope,))
+        except sqlite3.Error as exc:
+            logging.getLogger().warning('memcache clear failed: %s', exc)
+
+
+class DiskBackend(object):
+    """Keeps pickled items in files in a directory so they survive
+    restarts and can be shared by processes.
+
+    Each scope gets a subdirectory.  When a scope has more than
+    ``max_entries`` items, the least recently used ones get thrown
+    out.  Listing the directory gets expensive when it has a lot of
+    items, so that only gets checked every ``max_entries / 10``
+    writes.
+
+    :arg directory: the directory to keep items in
+    :arg max_entries: the maximum number of items per scope; 0 means
+        no limit
+    :arg ttl: the number of seconds items live for; 0 means they live
+        until they're thrown out
+    """
+    def __init__(self, directory, max_entries=1000, ttl=0):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_every = max(1, max_entries // 10)
+
+        # Maps scope -> number of writes since it was last pruned
+        self._writes = {}
+
+    def get_path(self, scope, key):
+        return os.path.join(self.directory, scope,
+                            hashlib.md5(repr(key)).hexdigest())
+
+    def get(self, scope, key):
+        path = self.get_path(scope, key)
+        try:
+            with open(path, 'rb') as fp:
+                expires, value = pickle.load(fp)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            raise KeyError(key)
+
+        if expires and expires < time.time():
+            raise KeyError(key)
+
+        # Bump the mtime so it's the most recently used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return value
+
+    def set(self, scope, key, value):
+        expires = time.time() + self.ttl if self.ttl else 0
+        path = self.get_path(scope, key)
+        tmp_fn = '{0}.{1}.tmp'.format(path, os.getpid())
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:
+                    # Another process might have created it.
+                    pass
+            with open(tmp_fn, 'wb') as fp:
+                pickle.dump((expires, value), fp, pickle.HIGHEST_PROTOCOL)
+            shutil.move(tmp_fn, path)
+        except (IOError, OSError, pickle.PicklingError, TypeError) as exc:
+            logging.getLogger().warning('memcache set failed: %s', exc)
+            return
+
+        if self.max_entries:
+            writes = self._writes.get(scope, 0) + 1
+            if writes >= self.prune_every:
+                self.prune(scope)
+                writes = 0
+            self._writes[scope] = writes
+
+    def prune(self, scope):
+        """Throws out the least recently used items in the scope if
+        there are more than ``max_entries``.
+        """
+        scopedir = os.path.join(self.directory, scope)
+        try:
+            names = os.listdir(scopedir)
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+
+        files = []
+        for name in names:
+            fn = os.path.join(scopedir, name)
+            try:
+                files.append((os.stat(fn).st_mtime, fn))
+            except OSError:
+                pass
+        files.sort()
+        for mtime, fn in files[:len(files) - self.max_entries]:
+            try:
+                os.remove(fn)
+            except OSError:
+                pass
+
+    def clear(self, scope=None):
+        if scope is None:
+            path = self.directory
+        else:
+            path = os.path.join(self.directory, scope)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+_backend = DictBackend()
+
+
+def get_backend():
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def configure(cfg):
+    """Sets up memcache using the ``use_memcache``,
+    ``memcache_backend``, ``memcache_max_entries``, ``memcache_ttl``
+    and ``memcache_sqlite_filename`` config variables.
+
+    :arg cfg: config dict
+    """
+    global usecache
+    usecache = cfg.get('use_memcache', False)
+
+    name = cfg.get('memcache_backend', 'dict')
+    if name == 'dict':
+        set_backend(DictBackend())
+    elif name == 'lru':
+        set_backend(LRUBackend(cfg.get('memcache_max_entries', 1000),
+                               cfg.get('memcache_ttl', 0)))
+    elif name == 'sqlite':
+        filename = cfg.get('memcache_sqlite_filename', '')
+        if not filename:
+            raise ValueError('memcache_sqlite_filename must be set to use '
+                             'the "sqlite" memcache backend.')
+        set_backend(SQLiteBackend(filename,
+                                  cfg.get('memcache_max_entries', 1000),
+                                  cfg.get('memcache_ttl', 0)))
+    else:
+        raise ValueError('Unknown memcache backend "{0}".'.format(name))
 
 
 def get_cache(scope, key):
-    return _memcache_cache.setdefault(scope, {})[key]
+    return _backend.get(scope, key)
 
 
 def set_cache(scope, key, value):
-    _memcache_cache.setdefault(scope, {})[key] = value
+    _backend.set(scope, key, value)
 
 
-def memcache_decorator(scope, instance=False):
-    """Caches function results in memory
+def clear_cache(scope=None):
+    _backend.clear(scope)
+
+
+def file_signature(filename):
+    """Returns the ``(mtime, size)`` of a file or ``None`` if it
+    doesn't exist.
+    """
+    try:
+        st = os.stat(filename)
+    except (OSError, TypeError):
+        return None
+    return (st.st_mtime, st.st_size)
 
-    This is a pretty classic memoization system for plugins. There's
-    no expiration of cached data---it just hangs out in memory
-    forever.
 
-    This is great for compiling, but probably not for running as a
-    CGI/WSGI application.
+def memcache_decorator(scope, instance=False, file_args=(), shared=True):
+    """Caches function results in memory
+
+    This is a pretty classic memoization system for plugins. How long
+    cached data hangs around depends on the backend. See
+    ``memcache_backend`` in the config.
 
     This is disabled by default. It must be explicitly enabled
     to have effect.
@@ -28,40 +385,50 @@ def memcache_decorator(scope, instance=False):
     Some notes:
 
     1. the function arguments MUST be hashable--no dicts, lists, etc.
-    2. this probably does not play well with
-       non-compiling--that should get checked.
+    2. if the function reads files, pass the positions of the
+       filename arguments in ``file_args`` so that the cached value
+       gets thrown out when the file changes.
     3. TODO: the two arguments are poorly named--that should get fixed.
 
     :arg scope: string defining the scope. e.g. 'pycategories'.
     :arg instance: whether or not the function being decorated is
         bound to an instance (i.e. is the first argument "self" or
         "cls"?)
+    :arg file_args: positions of arguments (not counting "self" or
+        "cls") that are filenames whose mtime and size should be part
+        of the cache key
+    :arg shared: whether (True) or not (False) the results can be
+        shared with other processes; results that hold on to
+        per-process state like caches should not be
 
     """
+    if not shared:
+        local_scopes.add(scope)
+
     def _memcache(fun):
         def _memcache_decorated(*args, **kwargs):
             if not usecache:
                 return fun(*args, **kwargs)
 
-            try:
-                if instance:
-                    mem = args[1:]
-                else:
-                    mem = args
+            if instance:
+                mem = args[1:]
+            else:
+                mem = args
 
-                hash_key = hash((mem, frozenset(sorted(kwargs.items()))))
+            sigs = tuple(file_signature(mem[i])
+                         for i in file_args if i < len(mem))
+            key = (mem, frozenset(kwargs.items()), sigs)
+            try:
+                hash(key)
             except TypeError:
                 print repr((args, kwargs))
-                hash_key = None
-
-            if not hash_key:
                 return fun(*args, **kwargs)
 
             try:
-                ret = get_cache(scope, hash_key)
+                ret = get_cache(scope, key)
             except KeyError:
                 ret = fun(*args, **kwargs)
-                set_cache(scope, hash_key, ret)
+                set_cache(scope, key, ret)
             return ret
         return _memcache_decorated
     return _memcache
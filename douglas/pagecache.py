@@ -0,0 +1,123 @@
+"""
+The page cache keeps rendered pages around so that the WSGI
+application can serve them without running Douglas.
+
+Pages are keyed on ``PATH_INFO``, ``QUERY_STRING`` and a generation
+that covers the entries in the datadir, the files in the themedir and
+the config.  The generation gets recomputed at most every
+``pagecache_check_interval`` seconds, so in between, cached pages get
+served without touching the filesystem.
+
+Only successful GET requests get cached.  Plugins that render things
+that shouldn't be cached can set ``no_pagecache`` to True in the data
+dict.
+"""
+
+import hashlib
+import os
+import os.path
+import time
+
+from douglas import entryindex
+from douglas import incremental
+from douglas.memcache import DiskBackend, LRUBackend
+
+
+SCOPE = 'pagecache'
+
+
+def build_pagecache(cfg):
+    """Returns a PageCache for this config or ``None`` if the page
+    cache is turned off.
+
+    :arg cfg: config dict
+    """
+    name = cfg.get('pagecache_backend', '')
+    if not name:
+        return None
+
+    max_entries = cfg.get('pagecache_max_entries', 1000)
+    if name == 'memory':
+        backend = LRUBackend(max_entries)
+    elif name == 'disk':
+        directory = cfg.get('pagecache_dir', '')
+        if not directory:
+            raise ValueError('pagecache_dir must be set to use the "disk" '
+                             'page cache backend.')
+        backend = DiskBackend(directory, max_entries)
+    else:
+        raise ValueError('Unknown page cache backend "{0}".'.format(name))
+
+    return PageCache(cfg, backend)
+
+
+def get_themedir_signature(themedir):
+    """Returns a signature for all the files in the themedir."""
+    sig = []
+    for root, dirs, files in os.walk(themedir):
+        dirs.sort()
+        for name in sorted(files):
+            fn = os.path.join(root, name)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            sig.append((fn, st.st_mtime, st.st_size))
+    return sig
+
+
+class PageCache(object):
+    def __init__(self, cfg, backend):
+        self.cfg = cfg
+        self.backend = backend
+        self.check_interval = cfg.get('pagecache_check_interval', 5)
+        self.generation = None
+        self.last_checked = 0
+
+    def get_generation(self):
+        """Returns the generation which changes whenever entries,
+        themes or the config change.
+        """
+        now = time.time()
+        if ((self.generation is None
+             or now - self.last_checked >= self.check_interval)):
+            self.last_checked = now
+
+            index = entryindex.get_index(self.cfg)
+            index.update(force=True)
+            digest, latest = index.get_summary()
+
+            self.generation = hashlib.md5(repr((
+                digest,
+                get_themedir_signature(self.cfg['themedir']),
+                incremental.config_signature(self.cfg)
+            ))).hexdigest()
+        return self.generation
+
+    def get_key(self, env):
+        return (env.get('PATH_INFO', ''), env.get('QUERY_STRING', ''),
+                self.get_generation())
+
+    def get(self, env):
+        """Returns the cached ``(status, headers, body)`` for this
+        request or ``None`` if there isn't one.
+        """
+        if env.get('REQUEST_METHOD', 'GET') != 'GET':
+            return None
+        try:
+            return self.backend.get(SCOPE, self.get_key(env))
+        except KeyError:
+            return None
+
+    def set(self, env, status, headers, body):
+        """Caches the response for this request if it's cacheable.
+
+        :arg env: the WSGI environment
+        :arg status: the status string
+        :arg headers: list of ``(key, value)`` tuples
+        :arg body: the body string
+        """
+        if ((env.get('REQUEST_METHOD', 'GET') != 'GET'
+             or not status.startswith('200'))):
+            return
+        self.backend.set(SCOPE, self.get_key(env), (status, headers, body))
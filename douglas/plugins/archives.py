@@ -98,8 +98,9 @@ class PyblArchives(object):
 
         template = config.get('archive_template',
                     '<a href="%(base_url)s/%(Y)s/%(b)s">%(Y)s-%(b)s</a><br />')
+        timetuples = tools.filestat_many(config, archive_list)
         for mem in archive_list:
-            timetuple = tools.filestat(self._request, mem)
+            timetuple = timetuples[mem]
             timedict = {}
             for x in ["B", "b", "m", "Y", "y"]:
                 timedict[x] = time.strftime("%" + x, timetuple)
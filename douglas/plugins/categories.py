@@ -38,6 +38,13 @@ Alternatively, you can build the categories HTML yourself::
         ....
     {% endfor %}
 
+``categories.latest_mtime(cat)`` returns the published time of the
+most recent entry in a category.
+
+The counts come from the entry index and only get figured out again
+when entries change.  The HTML from ``as_list()`` gets cached with
+them.
+
 """
 
 __description__ = "Builds a list of categories."
@@ -46,6 +53,10 @@ __license__ = "MIT"
 
 import os
 
+from douglas import entryindex
+from douglas import incremental
+from douglas import plugin_utils
+from douglas import session
 from douglas import tools
 
 
@@ -55,37 +66,92 @@ def parents(category):
         yield '/'.join(category[:i])
 
 
+class CategoryTree(object):
+    """Holds the categories for all the entries and caches HTML
+    rendered from them.
+
+    :arg categories: dict of category -> ``(count, latest mtime)``
+    """
+    def __init__(self, categories):
+        self.categories = categories
+        self.categorydata = sorted(
+            (category, count)
+            for category, (count, latest) in categories.items())
+        # Maps (theme, base_url) -> as_list HTML
+        self.html = {}
+
+
+def build_categorytree(cfg):
+    """Returns a CategoryTree for all the categories in the datadir.
+
+    If no plugins change which entries there are with the ``entries``
+    callback, this comes from the category counts in the entry index
+    which get updated as entries change.  Otherwise it gets figured
+    out from the list of entries.
+    """
+    root = cfg["datadir"]
+
+    if not plugin_utils.get_callback_chain('entries'):
+        index = entryindex.get_index(cfg)
+        index.update()
+        incremental.record_listing(cfg, root, 0, index.entries.keys())
+        return CategoryTree(dict(
+            (category, tuple(node))
+            for category, node in index.get_categories().items()))
+
+    # Build the list of all entries in the datadir
+    entry_list = tools.get_entries(cfg, root)
+    mtimes = tools.get_mtimes(cfg, entry_list, check=False)
+
+    # Map categories to counts and latest mtimes.
+    category_map = {}
+    for mem in entry_list:
+        category = os.path.dirname(mem[len(root) + 1:])
+        for par in parents(category):
+            count, latest = category_map.get(par, (0, 0))
+            category_map[par] = (count + 1, max(latest, mtimes[mem]))
+
+    return CategoryTree(category_map)
+
+
 class CategoryManager(object):
     def __init__(self, request):
         self.request = request
-        self._categorydata = None
-
+        self._categorytree = None
 
     @property
-    def categorydata(self):
-        if self._categorydata is None:
+    def categorytree(self):
+        if self._categorytree is None:
             config = self.request.get_configuration()
-            root = config["datadir"]
-
-            # Build the list of all entries in the datadir
-            entry_list = tools.get_entries(config, root)
+            self._categorytree = session.get_aggregate(
+                config, 'categories', build_categorytree)
+        return self._categorytree
 
-            # Peel off the root dir from the list of entries
-            entry_list = [mem[len(root) + 1:] for mem in entry_list]
-
-            # Map categories to counts.
-            category_map = {}
-            for mem in entry_list:
-                mem = os.path.dirname(mem)
-                for par in parents(mem):
-                    category_map[par] = category_map.get(par, 0) + 1
+    @property
+    def categorydata(self):
+        """Sorted list of (category, count) tuples."""
+        return self.categorytree.categorydata
 
-            self._categorydata = sorted(category_map.items())
-        return self._categorydata
+    def latest_mtime(self, category):
+        """Returns the published time of the most recent entry in the
+        category (including subcategories) or 0 if there are no
+        entries in it.
+        """
+        return self.categorytree.categories.get(category, (0, 0))[1]
 
     def as_list(self):
         config = self.request.get_configuration()
         baseurl = config['base_url']
+        theme = self.request.get_theme()
+
+        # This only changes when the categories change, so it's
+        # cached with them.
+        html = self.categorytree.html
+        if (theme, baseurl) not in html:
+            html[(theme, baseurl)] = self.build_list(baseurl, theme)
+        return html[(theme, baseurl)]
+
+    def build_list(self, baseurl, theme):
 
         start_t = '<ul class="categorygroup">'
         begin_t = '<li><ul class="categorygroup">'
@@ -98,8 +164,6 @@ class CategoryManager(object):
         end_t = '</ul></li>'
         finish_t = '</ul>'
 
-        theme = self.request.get_theme()
-
         categorydata = self.categorydata
 
         output = []
@@ -20,24 +20,20 @@ __license__ = "MIT"
 
 import time
 
-from douglas.tools import filestat
+from douglas.tools import filestat_many
 
 
 def cb_entries(args):
-    # FIXME - This can be expensive depending on how filestat is
-    # implemented and should cache the data in a file like the tags
-    # plugin does.
     cfg = args['config']
     entry_files = args['entry_files']
 
     now = time.time()
 
-    def check_mtime(cfg, now, path):
-        mtime = time.mktime(filestat(cfg, path))
-        return mtime < now
-
+    # The entry index was just updated when the listing was built, so
+    # there's no need to stat the entries again.
+    timetuples = filestat_many(cfg, entry_files, check=False)
     entry_files = [path for path in entry_files
-                   if check_mtime(cfg, now, path)]
+                   if time.mktime(timetuples[path]) < now]
     args['entry_files'] = entry_files
 
     return args
@@ -85,6 +85,10 @@ pages of entries. Then the urls would look like this::
     /index_page3.html     third page
     ...
 
+When the first page gets compiled, the rest of the pages get rendered
+from the same sorted entry list.  They don't walk the datadir or sort
+the entries again.
+
 """
 
 __description__ = (
@@ -95,6 +99,7 @@ __license__ = 'MIT'
 
 import os
 
+from douglas.entries.entrylist import EntryList
 from douglas.tools import pwrap_error, render_url_statically
 
 
@@ -181,6 +186,12 @@ class Paginator(object):
         return ' '.join(output)
 
 
+# Data variables that are specific to a page and don't get passed on
+# to the other pages when compiling.
+PAGE_KEYS = ('entry_list', 'pager', 'renderer', 'paginate_page',
+             'paginate_entry_list', 'paginate_data')
+
+
 def page(request, num_entries, entry_list):
     http = request.get_http()
     config = request.get_configuration()
@@ -287,16 +298,48 @@ def page(request, num_entries, entry_list):
         if ext:
             template = template + ext
 
+        # The rest of the pages get the entry list and the data from
+        # this page so that they don't have to build and sort the
+        # entry list again.  See cb_filelist.
+        page_data = dict((key, val) for key, val in data.items()
+                         if key not in PAGE_KEYS)
+
         for i in range(count_from + 1, max_pages):
             print '   rendering page %s ...' % (template % i)
-            render_url_statically(dict(config), template % i, '')
+            render_url_statically(dict(config), template % i, '', {
+                'paginate_entry_list': entry_list,
+                'paginate_data': page_data
+            })
+
+
+def cb_filelist(args):
+    request = args['request']
+    data = request.get_data()
+
+    # When compiling, the first page renders the rest of the pages
+    # and passes along its entry list.
+    entry_list = data.get('paginate_entry_list')
+    if entry_list is None:
+        return
+
+    for key, val in data['paginate_data'].items():
+        data.setdefault(key, val)
+
+    if isinstance(entry_list, EntryList):
+        entry_list = entry_list.copy(request)
+
+    page(request, request.config['num_entries'], entry_list)
+    entry_list = data['entry_list']
+    if isinstance(entry_list, EntryList):
+        entry_list = list(entry_list)
+    return entry_list
 
 
 def cb_truncatelist(args):
     request = args['request']
     entry_list = args['entry_list']
 
-    if not isinstance(entry_list, (tuple, list)):
+    if not isinstance(entry_list, (tuple, list, EntryList)):
         return entry_list
 
     page(request, request.config['num_entries'], entry_list)
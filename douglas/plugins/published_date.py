@@ -29,9 +29,11 @@ __description__ = "Maintain published date in file metadata."
 __category__ = "metadata"
 __license__ = 'MIT'
 
+import os
 import stat
 import time
 
+from douglas import entryindex
 from douglas.memcache import memcache_decorator
 
 
@@ -47,26 +49,32 @@ def parse_date(d):
     raise ValueError('time data {0} format is not recognized'.format(d))
 
 
-@memcache_decorator('published_date')
+@memcache_decorator('published_date', file_args=(0,))
 def get_date(fn):
-    """Returns time tuple or None for published time of file."""
+    """Returns time tuple or None for published time of file.
+
+    This only reads the title and metadata lines at the top of the
+    file.
+    """
     try:
         with open(fn, 'r') as fp:
-            lines = fp.readlines()
+            # Skip the title.
+            fp.readline()
+            for line in fp:
+                if not line.startswith('#'):
+                    break
+                if line.startswith('#published'):
+                    try:
+                        d = line.split(' ', 1)[1].strip()
+                        d = parse_date(d)
+                        return tuple(d)
+                    except IndexError:
+                        # An IndexError indicates that there is no
+                        # actual date after the #published keyword.
+                        return None
     except IOError:
         return None
 
-    for line in lines:
-        if line.startswith('#published'):
-            try:
-                d = line.split(' ', 1)[1].strip()
-                d = parse_date(d)
-                return tuple(d)
-            except IndexError:
-                # An IndexError indicates that there is no actual date
-                # after the #published keyword.
-                return None
-
     return None
 
 
@@ -85,6 +93,32 @@ def cb_filestat(args):
     return args
 
 
+def cb_filestat_many(args):
+    mtimes = args['mtimes']
+    index = entryindex.get_index(args['config'])
+
+    for fn in args['filenames']:
+        if fn in mtimes:
+            continue
+
+        # Entries that haven't changed since they were indexed already
+        # have their published time in the entry index.
+        record = index.entries.get(os.path.normpath(fn))
+        if record is not None:
+            try:
+                if not index.is_stale(record, os.stat(fn)):
+                    mtimes[fn] = record['published']
+                    continue
+            except OSError:
+                pass
+
+        d = get_date(fn)
+        if d and len(d) == 9:
+            mtimes[fn] = time.mktime(d)
+
+    return args
+
+
 def get_metadata(lines):
     lines = list(lines)
     metadata = {}
@@ -43,6 +43,33 @@ control over the rendered HTML::
    changing the ``reST_initial_header_level`` property to 0.
 
 
+Caching
+=======
+
+Running docutils is slow.  If you set ``reST_cache_dir``, rendered
+bodies get kept in files in that directory and an entry only gets run
+through docutils again when its text, the configuration above or the
+version of docutils changes::
+
+   # Directory to keep rendered bodies in. Defaults to '' which means
+   # rendered bodies don't get cached.
+   py['reST_cache_dir'] = '/home/joe/blog/rstcache'
+
+   # The maximum number of rendered bodies to keep. When there are
+   # more, the least recently used ones get thrown out. Set this
+   # higher than the number of reST entries you have or they'll get
+   # run through docutils again on every compile. Defaults to 5000.
+   # Set to 0 for no limit.
+   py['reST_cache_max_entries'] = 10000
+
+The directory needs to be writable by whatever renders your blog.
+
+To throw out rendered bodies for entries that changed or were
+deleted, run::
+
+   douglas-cmd prunerstcache
+
+
 Usage
 =====
 
@@ -78,16 +105,26 @@ __category__ = "text"
 __license__ = "MIT"
 
 
+import hashlib
+import os
+import os.path
+
+import docutils
 from docutils import nodes
 from docutils.core import publish_parts
 from docutils.parsers.rst import directives, Directive
 
 from douglas import tools
-from douglas.memcache import memcache_decorator
+from douglas.memcache import DiskBackend, memcache_decorator
 
 
 FILE_EXT = 'rst'
 
+CACHE_SCOPE = 'rst'
+
+# Maps (reST_cache_dir, reST_cache_max_entries) -> DiskBackend
+_caches = {}
+
 
 # READMORE_BREAKPOINT = 'BREAKLIKEYOUMEANIT!'
 # class Break(Directive):
@@ -121,12 +158,60 @@ def _parse(initial_header_level, transform_doctitle, story):
     return parts['body']
 
 
+def get_cache(cfg):
+    """Returns the DiskBackend for rendered bodies or ``None`` if
+    ``reST_cache_dir`` isn't set.
+    """
+    cachedir = cfg.get('reST_cache_dir', '')
+    if not cachedir:
+        return None
+
+    key = (cachedir, cfg.get('reST_cache_max_entries', 5000))
+    if key not in _caches:
+        _caches[key] = DiskBackend(*key)
+    return _caches[key]
+
+
+def get_cache_key(initial_header_level, transform_doctitle, story):
+    """Returns the cache key for a rendered body.
+
+    This covers the text and everything else that affects how
+    docutils renders it.
+    """
+    if isinstance(story, unicode):
+        story = story.encode('utf-8')
+    sha = hashlib.sha1(story)
+    sha.update(repr((initial_header_level, transform_doctitle,
+                     docutils.__version__)))
+    return sha.hexdigest()
+
+
 def parse(body, request):
     cfg = request.get_configuration()
     initial_header_level = cfg.get('reST_initial_header_level', 1)
     transform_doctitle = cfg.get('reST_transform_doctitle', 0)
 
-    return _parse(initial_header_level, transform_doctitle, body)
+    cache = get_cache(cfg)
+    if cache is None:
+        return _parse(initial_header_level, transform_doctitle, body)
+
+    key = get_cache_key(initial_header_level, transform_doctitle, body)
+    try:
+        return cache.get(CACHE_SCOPE, key)
+    except KeyError:
+        pass
+
+    html = _parse(initial_header_level, transform_doctitle, body)
+    cache.set(CACHE_SCOPE, key, html)
+    return html
+
+
+def get_stories(body):
+    """Returns the reST text that gets rendered for an entry body."""
+    if '.. break::' in body:
+        return [body.replace('.. break::', ''),
+                body[:body.find('.. break::')]]
+    return [body]
 
 
 def parse_rst_file(filename, request):
@@ -134,15 +219,70 @@ def parse_rst_file(filename, request):
     entry_data = dict(tools.parse_entry_file(filename, cfg['blog_encoding']))
     body = entry_data['body']
 
-    if '.. break::' in body:
-        entry_data['body'] = parse(body.replace('.. break::', ''), request)
-        entry_data['summary'] = parse(body[:body.find('.. break::')], request)
-    else:
-        entry_data['body'] = parse(body, request)
+    stories = get_stories(body)
+    entry_data['body'] = parse(stories[0], request)
+    if len(stories) > 1:
+        entry_data['summary'] = parse(stories[1], request)
 
     return entry_data
 
+# The title and metadata lines can be read without parsing the whole
+# entry.  See ``FileEntry``.
+parse_rst_file.entry_header = True
+
+
+def cmd_prunerstcache(command, argv):
+    """Throws out rendered bodies for entries that changed or were
+    deleted and bodies over ``reST_cache_max_entries``.
+    """
+    from douglas.app import initialize
+    from douglas.settings import import_config
+    cfg = import_config()
+    initialize(cfg)
+
+    cache = get_cache(cfg)
+    if cache is None:
+        print 'reST_cache_dir is not set.'
+        return 0
+
+    initial_header_level = cfg.get('reST_initial_header_level', 1)
+    transform_doctitle = cfg.get('reST_transform_doctitle', 0)
+
+    # Figure out the files for all the rendered bodies we want to keep.
+    keep = set()
+    for fn in tools.get_entries(cfg, cfg['datadir']):
+        if not fn.endswith('.' + FILE_EXT):
+            continue
+        body = tools.parse_entry_file(fn, cfg['blog_encoding'])['body']
+        for story in get_stories(body):
+            key = get_cache_key(initial_header_level, transform_doctitle,
+                                story)
+            keep.add(cache.get_path(CACHE_SCOPE, key))
+
+    scopedir = os.path.join(cache.directory, CACHE_SCOPE)
+    if not os.path.isdir(scopedir):
+        return 0
+
+    removed = 0
+    for name in os.listdir(scopedir):
+        fn = os.path.join(scopedir, name)
+        if fn not in keep:
+            os.remove(fn)
+            removed += 1
+
+    if cache.max_entries:
+        cache.prune(CACHE_SCOPE)
+
+    print 'Removed {0} rendered bodies.'.format(removed)
+    return 0
+
 
 def cb_entryparser(args):
     args[FILE_EXT] = parse_rst_file
     return args
+
+
+def cb_commandline(args):
+    args['prunerstcache'] = (
+        cmd_prunerstcache, 'throws out stale rendered reST bodies')
+    return args
@@ -59,18 +59,45 @@ how tag metadata is formatted, and how tag lists triggered.
 
 ``tags_filename``
 
-    This is the file that holds indexed tags data.  Defaults to
-    datadir + os.pardir + ``tags.index``.
+    This is the file that holds indexed tags data.  It's a SQLite
+    database.  Defaults to datadir + os.pardir + ``tags.index``.
 
     This file needs to be readable by the process that runs your blog.
     This file needs to be writable by the process that creates the
     index.
 
+``tags_auto_update``
+
+    If this is True, then the tags index gets updated automatically
+    when entries were added, changed or removed since it was last
+    updated.  This happens when a tag page or a template that uses
+    tags gets rendered and when compiling.
+
+    The process that runs your blog needs to be able to write to the
+    tags index file for this to work.
+
+    Example::
+
+        py["tags_auto_update"] = True
+
+    Defaults to False.
+
 ``tags_trigger``
 
     This is the url trigger to indicate that the tags plugin should
     handle the file list based on the tag.  Defaults to ``tag``.
 
+``tags_compile_queries``
+
+    List of tag combinations to compile pages for when compiling.
+    See `Tag combinations`_.
+
+    Example::
+
+        py["tags_compile_queries"] = ["python+douglas", "cats,dogs"]
+
+    Defaults to ``[]``.
+
 ``truncate_tags``
 
     If this is True, then tags index listings will get passed through
@@ -87,6 +114,28 @@ how tag metadata is formatted, and how tag lists triggered.
     Defaults to True.
 
 
+Tag combinations
+================
+
+Besides ``/tag/python`` which shows entries tagged ``python``, you can
+combine tags:
+
+``/tag/python+douglas``
+    Shows entries tagged both ``python`` and ``douglas``.
+
+``/tag/cats,dogs``
+    Shows entries tagged ``cats`` or ``dogs`` or both.
+
+You can't mix ``+`` and ``,`` in one combination.  Something like
+``/tag/a+b,c`` returns a 404.
+
+These get figured out by merging the lists of entries for each tag,
+so they don't look at any entries that don't have those tags.
+
+If you're compiling your blog, list the combinations you want pages
+for in ``tags_compile_queries``.
+
+
 Usage in templates
 ==================
 
@@ -168,15 +217,28 @@ from anywhere.
 This builds the tags index file that the tags plugin requires to
 generate tags-based bits for the request.
 
-Until you rebuild the tags index file, the entry will not have its
-tags indexed.  Thus you should either rebuild the tags file after writing
-or updating an entry or you should rebuild the tags file as a cron job.
+The tags index keeps track of which entries it read tags from.  When
+you run ``buildtags`` again, it only reads tags for entries that were
+added or changed since the last time.  To rebuild the tags index from
+scratch, do::
+
+    douglas-cmd buildtags --full
+
+Until you update the tags index file, the entry will not have its
+tags indexed.  Thus you should either update the tags file after writing
+or updating an entry, update the tags file as a cron job or set
+``tags_auto_update`` to True.
 
 .. Note::
 
    If you're compiling your blog, you need to build the tags index
    before you compile.
 
+.. Note::
+
+   Tags index files from before the tags index was a SQLite database
+   don't work anymore.  Run ``douglas-cmd buildtags`` to replace it.
+
 
 Converting from categories to tags
 ==================================
@@ -211,29 +273,332 @@ __category__ = "tags"
 __license__ = "MIT"
 
 
-import cPickle as pickle
+import hashlib
+import heapq
+import itertools
+import logging
 import os
-import shutil
+import sqlite3
+import threading
+from collections import Mapping
 
-from douglas.memcache import memcache_decorator
+from douglas import entryindex
+from douglas import incremental
+from douglas import session
 from douglas.settings import import_config
 
 
-def savefile(path, tagdata):
-    """Saves tagdata to file at path."""
-    with open(path + '.new', 'w') as fp:
-        pickle.dump(tagdata, fp)
-    shutil.move(path + '.new', path)
+# Bump this when the format of the tags index file changes.
+TAGS_INDEX_VERSION = 2
+
+SQLITE_HEADER = 'SQLite format 3\x00'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS meta ('
+    'key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS files ('
+    'filename TEXT PRIMARY KEY, mtime REAL, hash TEXT, published REAL, '
+    'tags TEXT)',
+    'CREATE TABLE IF NOT EXISTS postings ('
+    'tag TEXT, published REAL, filename TEXT, '
+    'PRIMARY KEY (tag, filename))',
+    'CREATE INDEX IF NOT EXISTS postings_published '
+    'ON postings (tag, published DESC, filename)',
+    'CREATE TABLE IF NOT EXISTS counts ('
+    'tag TEXT PRIMARY KEY, count INTEGER)',
+)
+
+
+class TagsIndex(object):
+    """The tags index is a SQLite database with:
+
+    * ``postings`` -- a row for each (tag, entry file) with the
+      entry's published time; these are read newest first
+    * ``counts`` -- the number of entries for each tag
+    * ``files`` -- each entry's mtime, hash, published time and tags
+      so updates only re-read entries that changed
+    * ``meta`` -- the version, the ``tags_separator`` and the entry
+      index digest the tags index was last updated against
+
+    Tags files that aren't SQLite databases (e.g. from older versions)
+    are treated as empty and get replaced the next time the tags
+    index is updated.
+
+    :arg filename: the tags index file
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._conns = threading.local()
+
+    def is_valid(self):
+        try:
+            with open(self.filename, 'rb') as fp:
+                return fp.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+        except IOError:
+            return False
+
+    def get_connection(self, create=False):
+        """Returns the connection to the tags index or ``None`` if
+        there's no usable tags index and ``create`` is False.
+        """
+        # Connections can't be shared across threads or forks, so
+        # there's one per thread per process.  If the file got
+        # replaced, the connection has to be re-opened.
+        try:
+            ino = os.stat(self.filename).st_ino
+        except OSError:
+            ino = None
+        conn = getattr(self._conns, 'conn', None)
+        if ((conn is not None and self._conns.pid == os.getpid()
+             and self._conns.ino == ino)):
+            return conn
+
+        if not self.is_valid():
+            if not create:
+                return None
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+
+        conn = sqlite3.connect(self.filename, timeout=10)
+        conn.text_factory = str
+        if create:
+            with conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+                conn.execute('INSERT OR IGNORE INTO meta VALUES (?, ?)',
+                             ('version', str(TAGS_INDEX_VERSION)))
+        self._conns.conn = conn
+        self._conns.pid = os.getpid()
+        self._conns.ino = os.stat(self.filename).st_ino
+        return conn
+
+    def query(self, sql, params=()):
+        conn = self.get_connection()
+        if conn is None:
+            return []
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.Error as exc:
+            logging.getLogger().warning('tags index query failed: %s', exc)
+            return []
+
+    def get_meta(self):
+        """Returns dict of meta key -> value."""
+        return dict(self.query('SELECT key, value FROM meta'))
+
+    def get_counts(self):
+        """Returns dict of tag -> number of entries."""
+        return dict(self.query('SELECT tag, count FROM counts'))
+
+    def get_postings(self, tag, limit=None):
+        """Returns list of ``(filename, published)`` tuples for the
+        entries with this tag newest first.
+
+        :arg tag: the tag
+        :arg limit: the maximum number of entries to return or
+            ``None`` for all of them
+        """
+        sql = ('SELECT filename, published FROM postings WHERE tag=? '
+               'ORDER BY published DESC, filename')
+        params = (tag,)
+        if limit:
+            sql += ' LIMIT ?'
+            params += (limit,)
+        return self.query(sql, params)
+
+    def get_files(self):
+        """Returns dict of entry file -> ``(mtime, hash)``."""
+        return dict((fn, (mtime, digest)) for fn, mtime, digest
+                    in self.query('SELECT filename, mtime, hash FROM files'))
+
+    def get_file_tags(self, filenames):
+        """Returns the set of tags the given files had."""
+        tags = set()
+        for fn in filenames:
+            for row in self.query('SELECT tags FROM files WHERE filename=?',
+                                  (fn,)):
+                tags.update(t for t in row[0].split('\n') if t)
+        return tags
+
+    def update(self, changed, removed, meta, full=False):
+        """Updates the tags index in one transaction.
+
+        :arg changed: dict of entry file -> ``(mtime, hash, published,
+            tags)`` for entries that were added or changed
+        :arg removed: list of entry files that were removed
+        :arg meta: dict of meta values to set
+        :arg full: whether to throw out everything first
+        """
+        conn = self.get_connection(create=True)
+        stale_files = list(changed) + list(removed)
+        with conn:
+            if full:
+                conn.execute('DELETE FROM files')
+                conn.execute('DELETE FROM postings')
+                conn.execute('DELETE FROM counts')
+                affected = set()
+            else:
+                affected = self.get_file_tags(stale_files)
+
+            for fn in stale_files:
+                conn.execute('DELETE FROM files WHERE filename=?', (fn,))
+                conn.execute('DELETE FROM postings WHERE filename=?', (fn,))
+
+            for fn, (mtime, digest, published, tags) in changed.items():
+                conn.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?)',
+                             (fn, mtime, digest, published, '\n'.join(tags)))
+                conn.executemany('INSERT INTO postings VALUES (?, ?, ?)',
+                                 [(tag, published, fn) for tag in tags])
+                affected.update(tags)
+
+            for tag in affected:
+                count = conn.execute(
+                    'SELECT COUNT(*) FROM postings WHERE tag=?',
+                    (tag,)).fetchone()[0]
+                if count:
+                    conn.execute('INSERT OR REPLACE INTO counts VALUES (?, ?)',
+                                 (tag, count))
+                else:
+                    conn.execute('DELETE FROM counts WHERE tag=?', (tag,))
+
+            conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                             meta.items())
+
+
+# Maps filename -> TagsIndex for this process.
+_tagsindexes = {}
+
+
+def get_tagsindex(cfg):
+    """Returns the TagsIndex for this config."""
+    tagsfile = get_tagsfile(cfg)
+    tagsindex = _tagsindexes.get(tagsfile)
+    if tagsindex is None:
+        tagsindex = _tagsindexes[tagsfile] = TagsIndex(tagsfile)
+    return tagsindex
+
+
+class TagsData(Mapping):
+    """Read-only mapping of tag -> list of entry files newest first.
+
+    Counts get read once.  Postings only get read for tags that get
+    looked up.
+
+    :arg tagsindex: the TagsIndex
+    """
+    def __init__(self, tagsindex):
+        self.tagsindex = tagsindex
+        self._counts = None
+        self._postings = {}
+
+    def counts(self):
+        """Returns dict of tag -> number of entries."""
+        if self._counts is None:
+            self._counts = self.tagsindex.get_counts()
+        return self._counts
+
+    def __getitem__(self, tag):
+        if tag not in self.counts():
+            raise KeyError(tag)
+        if tag not in self._postings:
+            self._postings[tag] = [
+                fn for fn, published in self.tagsindex.get_postings(tag)]
+        return self._postings[tag]
+
+    def __contains__(self, tag):
+        # Mapping.__contains__ would read all the postings for the tag.
+        return tag in self.counts()
+
+    def __iter__(self):
+        return iter(self.counts())
+
+    def __len__(self):
+        return len(self.counts())
+
+
+def get_counts(tagsdata):
+    """Returns dict of tag -> number of entries for a tagsdata
+    mapping.
+    """
+    if isinstance(tagsdata, TagsData):
+        return tagsdata.counts()
+    return dict((tag, len(files)) for tag, files in tagsdata.items())
+
+
+def merge_postings(postings_lists, intersect=False):
+    """Merges lists of ``(filename, published)`` postings that are
+    sorted newest first and yields the merged postings newest first.
+
+    :arg postings_lists: list of postings lists
+    :arg intersect: whether to yield postings that are in all the
+        lists (True) or postings that are in any of them (False)
+    """
+    # Postings sort by published time descending and then filename,
+    # so (-published, filename) keys sort the same way ascending.
+    keyed = [[(-published, fn) for fn, published in postings]
+             for postings in postings_lists]
+
+    last = None
+    count = 0
+    for key in heapq.merge(*keyed):
+        if key == last:
+            count += 1
+            continue
+        if last is not None and (count == len(keyed) or not intersect):
+            yield (last[1], -last[0])
+        last = key
+        count = 1
+    if last is not None and (count == len(keyed) or not intersect):
+        yield (last[1], -last[0])
+
+
+def parse_tag_query(query):
+    """Parses a tag query into a ``(tags, intersect)`` tuple.
+
+    ``a+b`` is entries with tag ``a`` and tag ``b``.  ``a,b`` is
+    entries with tag ``a`` or tag ``b``.  Queries that mix ``+`` and
+    ``,`` aren't supported and return no tags.  Anything else is a
+    single tag.
+    """
+    if '+' in query and ',' in query:
+        return [], False
+    if '+' in query:
+        return [tag for tag in query.split('+') if tag], True
+    if ',' in query:
+        return [tag for tag in query.split(',') if tag], False
+    return [query], False
+
+
+def get_query_postings(tagsindex, tagsdata, query, limit=None):
+    """Returns the ``(filename, published)`` postings newest first for
+    a tag or a combination of tags or ``None`` if there's no such
+    tag or combination.
+
+    :arg tagsindex: the TagsIndex
+    :arg tagsdata: mapping of known tags to look tags up in
+    :arg query: a tag, ``tag1+tag2`` (and) or ``tag1,tag2`` (or)
+    :arg limit: the maximum number of postings to return or ``None``
+        for all of them
+    """
+    if query in tagsdata:
+        return tagsindex.get_postings(query, limit)
+
+    # All the tags have to exist.  Otherwise ``/tag/a,b.rss`` would be
+    # the entries tagged ``a`` or ``b.rss`` rather than the rss theme
+    # for ``a,b``.
+    tags, intersect = parse_tag_query(query)
+    if not tags or [tag for tag in tags if tag not in tagsdata]:
+        return None
+
+    postings = merge_postings(
+        [tagsindex.get_postings(tag) for tag in tags], intersect)
+    return list(itertools.islice(postings, limit))
 
 
-@memcache_decorator('tags')
 def loadfile(path):
-    """Loads tagdata from file at path."""
-    if not os.path.exists(path):
-        return {}
-    with open(path, 'r') as fp:
-        tagdata = pickle.load(fp)
-    return tagdata
+    """Returns a TagsData mapping of tag -> list of entry files for the
+    tags index at path."""
+    return TagsData(TagsIndex(path))
 
 
 def get_tagsfile(cfg):
@@ -243,40 +608,105 @@ def get_tagsfile(cfg):
     return tagsfile
 
 
+def parse_tags(tagsline, sep):
+    return sorted(set(t.strip() for t in tagsline.split(sep) if t.strip()))
+
+
+def is_stale(cfg):
+    """Returns whether entries were added, changed or removed since
+    the tags index was last updated.
+    """
+    index = entryindex.get_index(cfg)
+    index.update()
+    meta = get_tagsindex(cfg).get_meta()
+    return meta.get('digest') != index.get_summary()[0]
+
+
+def update_tagsindex(cfg, full=False):
+    """Updates the tags index re-reading tags only for entries that
+    were added or changed since the last update.
+
+    Tags come from the entry index which only reads entry headers.
+
+    :arg cfg: config dict
+    :arg full: whether to rebuild the tags index from scratch
+
+    :returns: True if the tags index changed and False otherwise
+    """
+    from douglas import tools
+
+    tagsindex = get_tagsindex(cfg)
+    sep = cfg.get('tags_separator', ',')
+
+    meta = tagsindex.get_meta()
+    if meta.get('version') != str(TAGS_INDEX_VERSION):
+        full = True
+    if meta.get('separator') != sep:
+        full = True
+    old_files = {} if full else tagsindex.get_files()
+
+    index = entryindex.get_index(cfg)
+    entry_files = tools.get_entries(cfg, cfg['datadir'])
+    records = index.get_records(entry_files, check=False)
+
+    changed = {}
+    for fn in entry_files:
+        record = records.get(fn)
+        if record is None:
+            # This isn't in the datadir, so it's not in the entry
+            # index.
+            header = tools.read_entry_header(fn, cfg['blog_encoding'])
+            st = os.stat(fn)
+            with open(fn, 'rb') as fp:
+                digest = hashlib.md5(fp.read()).hexdigest()
+            record = {'mtime': st.st_mtime, 'hash': digest,
+                      'published': tools.filestat_mtime(cfg, fn),
+                      'tags': header.get('tags', '')}
+
+        if old_files.get(fn) == (record['mtime'], record['hash']):
+            continue
+        changed[fn] = (record['mtime'], record['hash'], record['published'],
+                       parse_tags(record['tags'], sep))
+
+    entry_files = set(entry_files)
+    removed = [fn for fn in old_files if fn not in entry_files]
+
+    digest = index.get_summary()[0]
+    if ((not full and not changed and not removed
+         and meta.get('digest') == digest)):
+        return False
+
+    tagsindex.update(changed, removed,
+                     {'digest': digest, 'separator': sep}, full=full)
+    return True
+
+
+def auto_update(cfg):
+    """Updates the tags index if ``tags_auto_update`` is on and it's
+    stale.
+    """
+    if cfg.get('tags_auto_update', False) and is_stale(cfg):
+        update_tagsindex(cfg)
+
+
 def cmd_buildtags(command, argv):
     """Command for building the tags index."""
-    cfg = import_config()
-    datadir = cfg['datadir']
-    sep = cfg.get('tags_separator', ',')
-    tagsfile = get_tagsfile(cfg)
+    from douglas.app import initialize
+    from douglas.cmdline import build_parser
 
-    from douglas import tools
-    from douglas.app import Douglas, initialize
-    from douglas.entries import fileentry
+    parser = build_parser('%prog buildtags [options]')
+    parser.add_option('--full',
+                      action='store_true', dest='full', default=False,
+                      help='Rebuild the tags index from scratch.')
+    (options, args) = parser.parse_args(argv)
+
+    cfg = import_config()
 
-    # Build a douglas object, initialize it, and run the start
-    # callback.  This gives entry parsing related plugins a chance to
-    # get their stuff together so that they work correctly.
+    # This loads the plugins so that entries with extensions from
+    # entryparser plugins get picked up.
     initialize(cfg)
-    p = Douglas(cfg, {})
-    p.initialize()
-    req = p.get_request()
-    tools.run_callback("start", {"request": req})
-
-    # Grab all the entries in the datadir
-    entrylist = [fileentry.FileEntry(req, e, datadir)
-                 for e in tools.get_entries(cfg, datadir)]
-
-    tags_to_files = {}
-    for mem in entrylist:
-        tagsline = mem["tags"]
-        if not tagsline:
-            continue
-        tagsline = [t.strip() for t in tagsline.split(sep)]
-        for t in tagsline:
-            tags_to_files.setdefault(t, []).append(mem["filename"])
 
-    savefile(tagsfile, tags_to_files)
+    update_tagsindex(cfg, full=options.full)
     return 0
 
 
@@ -345,8 +775,9 @@ def cb_pathinfo(args):
 
 
 def cb_filelist(args):
-    from douglas import tools
+    from douglas import plugin_utils, tools
     from douglas.app import blosxom_truncate_list_handler
+    from douglas.entries.entrylist import EntryList
 
     # Handles /trigger/tag to show all the entries tagged that way
     req = args['request']
@@ -360,24 +791,32 @@ def cb_filelist(args):
         return
 
     datadir = config['datadir']
-    tagsfile = get_tagsfile(config)
-    tagsdata = loadfile(tagsfile)
-
-    tag = pyhttp['PATH_INFO'][len(trigger)+1:]
-    filelist = tagsdata.get(tag, [])
-    if not filelist:
-        tag, ext = os.path.splitext(tag)
-        filelist = tagsdata.get(tag, [])
-        if filelist:
-            data['theme'] = ext[1:]
+    tagsdata = TagManager(req).tagsdata
 
-    from douglas.entries import fileentry
-    entrylist = [fileentry.FileEntry(req, e, datadir) for e in filelist]
+    data['truncate'] = config.get('truncate_tags', True)
 
-    # sort the list by mtime
-    entrylist.sort(key=lambda entry: entry._mtime, reverse=True)
+    # Postings are sorted newest first, so if no plugins change how
+    # the list gets truncated, this only reads the entries that get
+    # shown.
+    limit = None
+    num_entries = config['num_entries']
+    if ((data['truncate'] and num_entries
+         and not plugin_utils.get_callback_chain('truncatelist'))):
+        limit = num_entries
+
+    tagsindex = get_tagsindex(config)
+    query = pyhttp['PATH_INFO'][len(trigger)+1:]
+    postings = get_query_postings(tagsindex, tagsdata, query, limit)
+    if postings is None:
+        query, ext = os.path.splitext(query)
+        postings = get_query_postings(tagsindex, tagsdata, query, limit)
+        if postings is not None:
+            data['theme'] = ext[1:]
+        else:
+            postings = []
 
-    data['truncate'] = config.get('truncate_tags', True)
+    entrylist = EntryList(req, [fn for fn, published in postings],
+                          dict(postings), datadir, sorted=True)
 
     args = {'request': req, 'entry_list': entrylist}
     entrylist = tools.run_callback('truncatelist',
@@ -385,9 +824,21 @@ def cb_filelist(args):
                                    donefunc=lambda x: x != None,
                                    defaultfunc=blosxom_truncate_list_handler)
 
+    # Everything after this expects a list.
+    if isinstance(entrylist, EntryList):
+        entrylist = list(entrylist)
     return entrylist
 
 
+def build_tagsdata(cfg):
+    """Returns the TagsData mapping of tag -> list of entry files for
+    the tags index.
+    """
+    auto_update(cfg)
+    incremental.record_file(cfg, get_tagsfile(cfg))
+    return TagsData(get_tagsindex(cfg))
+
+
 class TagManager(object):
     def __init__(self, request):
         self.request = request
@@ -396,15 +847,9 @@ class TagManager(object):
     @property
     def tagsdata(self):
         if self._tagsdata is None:
-            tagsfile = get_tagsfile(self.request.get_configuration())
-            if os.path.exists(tagsfile):
-                try:
-                    tagsdata = loadfile(tagsfile)
-                except IOError:
-                    tagsdata = {}
-            else:
-                tagsdata = {}
-            self._tagsdata = tagsdata
+            cfg = self.request.get_configuration()
+            self._tagsdata = session.get_aggregate(
+                cfg, 'tags', build_tagsdata, files=(get_tagsfile(cfg),))
         return self._tagsdata
 
     def all_tags(self):
@@ -417,8 +862,8 @@ class TagManager(object):
         tags = [
             (tag,
              '/'.join([baseurl.rstrip('/'), trigger, tag]) + '.' + theme,
-             len(entries))
-            for tag, entries in self.tagsdata.items()]
+             count)
+            for tag, count in get_counts(self.tagsdata).items()]
 
         return tags
 
@@ -514,11 +959,14 @@ def cb_compile_filelist(args):
     config = req.get_configuration()
     filelist = args["filelist"]
 
-    tagsdata = loadfile(get_tagsfile(config))
+    auto_update(config)
+    tagsdata = get_tagsindex(config).get_counts()
     index_themes = config['compile_index_themes']
     trigger = "/" + config.get("tags_trigger", "tag")
 
-    # Go through and add an index for each index_theme for each tag.
-    for tag in tagsdata.keys():
+    # Go through and add an index for each index_theme for each tag
+    # and each tag combination.
+    tags = tagsdata.keys() + list(config.get('tags_compile_queries', []))
+    for tag in tags:
         for theme in index_themes:
             filelist.append((trigger + "/" + tag + "." + theme, ""))
@@ -37,6 +37,10 @@ When the user clicks on one of the year links (e.g.
 ``http://example.com/2004/``), then yeararchives will display a
 summary page for that year.
 
+Titles and paths for the summary page come from the entry index, so
+entries don't get parsed.  If ``use_memcache`` is on, the tables for
+years that are over get cached until an entry changes.
+
 """
 
 __description__ = "Builds year-based archives listing."
@@ -44,12 +48,33 @@ __category__ = "archives"
 __license__ = "MIT"
 
 
+import os
 import re
 import time
 
+from douglas import entryindex
+from douglas import incremental
+from douglas import memcache
+from douglas import session
 from douglas import tools
 from douglas.entries.base import EntryBase
-from douglas.entries.fileentry import FileEntry
+
+
+def build_entries(cfg):
+    """Returns a list of (year, month, day, filename) tuples for all
+    the entries in the datadir.
+    """
+    entry_list = tools.get_entries(cfg, cfg['datadir'])
+    timetuples = tools.filestat_many(cfg, entry_list)
+    entries = []
+    for mem in entry_list:
+        timetuple = timetuples[mem]
+        entries.append(
+            (time.strftime('%Y', timetuple),
+             time.strftime('%Y-%m', timetuple),
+             time.strftime('%Y-%m-%d', timetuple),
+             mem))
+    return entries
 
 
 class YearArchivesManager(object):
@@ -59,20 +84,11 @@ class YearArchivesManager(object):
 
     @property
     def entries(self):
-        """List of (year, entry) tuples"""
+        """List of (year, month, day, filename) tuples"""
         if self._entries is None:
-            # FIXME - probably good to memoize this
             cfg = self.request.get_configuration()
-            entry_list = tools.get_entries(cfg, cfg['datadir'])
-            self._entries = []
-            for mem in entry_list:
-                timetuple = tools.filestat(self.request, mem)
-                self._entries.append(
-                    (time.strftime('%Y', timetuple),
-                     time.strftime('%Y-%m', timetuple),
-                     time.strftime('%Y-%m-%d', timetuple),
-                     mem))
-
+            self._entries = session.get_aggregate(
+                cfg, 'yeararchives', build_entries)
         return self._entries
 
     def as_list(self):
@@ -170,6 +186,123 @@ def cb_pathinfo(args):
         return data
 
 
+def get_items(cfg, entries):
+    """Returns the list of ``(month, day, path, file_path, title)``
+    tuples for the given ``(year, month, day, filename)`` entries.
+
+    Titles and paths come from the entry index, so entries don't get
+    read or parsed.
+    """
+    index = entryindex.get_index(cfg)
+    records = index.get_records([mem[3] for mem in entries], check=False)
+
+    datadir = index.datadir
+    items = []
+    for year, month, day, fn in entries:
+        record = records.get(fn)
+        if record is not None:
+            path = record['category']
+            title = record['title']
+        else:
+            path = os.path.dirname(fn)[len(datadir) + 1:]
+            title = tools.read_entry_header(
+                fn, cfg['blog_encoding']).get('title', '')
+
+        path = path.replace('/', os.sep)
+        basename = os.path.splitext(os.path.basename(fn))[0]
+        if path:
+            file_path = '/'.join((path, basename))
+        else:
+            file_path = basename
+        items.append((month, day, path, file_path, title))
+    return items
+
+
+def build_tables(year, baseurl, theme, items):
+    """Returns a list of ``(month, table html)`` tuples for a year
+    newest month first.
+
+    :arg year: the year
+    :arg baseurl: the base url
+    :arg theme: the theme for permalinks
+    :arg items: list of ``(month, day, path, file_path, title)``
+        tuples sorted newest first
+    """
+    item_t = '({path}) <a href="{baseurl}/{file_path}.{theme}">{title}</a><br>'
+    e = "<tr>\n<td valign=\"top\" align=\"left\">%s</td>\n<td>%s</td></tr>\n"
+
+    if not items:
+        return []
+
+    current_month = items[0][0]
+    current_day = items[0][1]
+
+    day = []
+    month = []
+    tables = []
+
+    for mem in items:
+        if current_month != mem[0]:
+            month.append(e % (current_day, '\n'.join(day)))
+            tables.append(
+                (current_month, '<table>' + '\n'.join(month) + '</table>'))
+            current_month = mem[0]
+            current_day = mem[1]
+            day = []
+            month = []
+
+        elif current_day != mem[1]:
+            month.append(e % (current_day, '\n'.join(day)))
+            current_day = mem[1]
+            day = []
+
+        day.append(item_t.format(
+            path=mem[2],
+            file_path=mem[3],
+            title=mem[4],
+            baseurl=baseurl,
+            theme=theme))
+
+    if day:
+        month.append(e % (current_day, '\n'.join(day)))
+
+    if month:
+        tables.append(
+            (current_month, '<table>' + '\n'.join(month) + '</table>'))
+
+    return tables
+
+
+def build_past_tables(cfg, year, baseurl, theme, entries):
+    """Returns the tables for a year that's over.
+
+    Years that are over don't get new entries, so their tables get
+    cached.  The key has the entry index digest in it, so the tables
+    get built again when any entry changes.  Otherwise the titles and
+    paths for the entries don't get looked up at all.
+
+    :arg cfg: config dict
+    :arg year: the year
+    :arg baseurl: the base url
+    :arg theme: the theme for permalinks
+    :arg entries: list of ``(year, month, day, filename)`` tuples
+        sorted newest first
+    """
+    if not memcache.usecache:
+        return build_tables(year, baseurl, theme, get_items(cfg, entries))
+
+    index = entryindex.get_index(cfg)
+    key = (index.datadir, year, baseurl, theme, index.get_summary()[0])
+    try:
+        return memcache.get_cache('yeararchives', key)
+    except KeyError:
+        pass
+
+    tables = build_tables(year, baseurl, theme, get_items(cfg, entries))
+    memcache.set_cache('yeararchives', key, tables)
+    return tables
+
+
 def cb_filelist(args):
     request = args['request']
     pyhttp = request.get_http()
@@ -188,8 +321,8 @@ def cb_filelist(args):
 
     # Get all the entries for this year
     yeararchives = YearArchivesManager(request)
-    items = sorted([mem for mem in yeararchives.entries
-                    if mem[0] == year], reverse=True)
+    entries = sorted([mem for mem in yeararchives.entries
+                      if mem[0] == year], reverse=True)
 
     # Set and use current (or default) theme for permalinks
     if not theme:
@@ -197,50 +330,13 @@ def cb_filelist(args):
 
     data['theme'] = theme
 
-    item_t = '({path}) <a href="{baseurl}/{file_path}.{theme}">{title}</a><br>'
-    e = "<tr>\n<td valign=\"top\" align=\"left\">%s</td>\n<td>%s</td></tr>\n"
-
-    current_month = items[0][1]
-    current_day = items[0][2]
-
-    day = []
-    month = []
-    entrylist = []
+    # Year pages depend on the titles of the entries on them.
+    for mem in entries:
+        incremental.record_file(cfg, mem[3])
 
-    for mem in items:
-        if current_month != mem[1]:
-            month.append(e % (current_day, '\n'.join(day)))
-            entrylist.append(
-                new_entry(
-                    request,
-                    current_month,
-                    '<table>' + '\n'.join(month) + '</table>'))
-            current_month = mem[1]
-            current_day = mem[2]
-            day = []
-            month = []
-
-        elif current_day != mem[2]:
-            month.append(e % (current_day, '\n'.join(day)))
-            current_day = mem[2]
-            day = []
-
-        entry = FileEntry(request, mem[3], cfg['datadir'])
-        entry.update({
-            'baseurl': baseurl,
-            'theme': theme
-        })
-
-        day.append(item_t.format(**entry))
-
-    if day:
-        month.append(e % (current_day, '\n'.join(day)))
-
-    if month:
-        entrylist.append(
-            new_entry(
-                request,
-                current_month,
-                '<table>' + '\n'.join(month) + '</table>'))
+    if int(year) < time.localtime().tm_year:
+        tables = build_past_tables(cfg, year, baseurl, theme, entries)
+    else:
+        tables = build_tables(year, baseurl, theme, get_items(cfg, entries))
 
-    return entrylist
+    return [new_entry(request, month, table) for month, table in tables]
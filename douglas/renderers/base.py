@@ -78,6 +78,38 @@ class RendererBase(object):
         """
         self._out.write(data)
 
+    def write_stream(self, iterable):
+        """
+        Writes an iterable of strings to the output.
+
+        If the output is a ``Response<douglas.app.Response>``, the
+        iterable doesn't get consumed until the response body is sent,
+        so the WSGI server can send the first chunks to the client
+        while the rest are still being rendered.  Otherwise this
+        writes all the chunks right away.
+
+        :param iterable: iterable of strings
+        """
+        if hasattr(self._out, 'write_stream'):
+            self._out.write_stream(iterable)
+        else:
+            for chunk in iterable:
+                self._out.write(chunk)
+
+    def should_stream(self):
+        """
+        Returns whether the body should be streamed.
+
+        It should be if ``wsgi_streaming`` is turned on, we're not
+        compiling and no plugin set ``buffer_response`` in the data
+        dict because it needs to post-process the body.
+        """
+        config = self._request.get_configuration()
+        data = self._request.get_data()
+        return bool(config.get('wsgi_streaming')
+                    and not data.get('COMPILING')
+                    and not data.get('buffer_response'))
+
     def add_header(self, *args):
         """
         Populates the HTTP header with lines of text
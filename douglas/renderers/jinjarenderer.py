@@ -1,12 +1,27 @@
+import cPickle as pickle
+import os
 import os.path
+import shutil
+import time
 
-from jinja2 import BaseLoader, Environment, TemplateNotFound
+from jinja2 import (BaseLoader, Environment, FileSystemBytecodeCache,
+                    ModuleLoader, TemplateNotFound)
 
-from douglas.memcache import memcache_decorator
+from douglas import dates
+from douglas import incremental
+from douglas.memcache import file_signature
 from douglas.renderers.base import RendererBase
 from douglas.tools import run_callback
 
 
+# Name of the file in a precompiled theme directory that has the
+# signatures of the template files when they were compiled.
+SIGNATURES_FILE = 'signatures.pickle'
+
+# Maps (themedir, theme, theme_cache_dir) -> Theme
+_themes = {}
+
+
 class ThemeLoader(BaseLoader):
     def __init__(self, themepath):
         self.path = themepath
@@ -20,6 +35,61 @@ class ThemeLoader(BaseLoader):
             source = f.read().decode('utf-8')
         return source, path, lambda: mtime == os.path.getmtime(path)
 
+    def list_templates(self):
+        try:
+            names = sorted(os.listdir(self.path))
+        except OSError:
+            return []
+        return [name for name in names
+                if not name.startswith('.')
+                and name != 'content_type'
+                and os.path.isfile(os.path.join(self.path, name))]
+
+
+class PrecompiledLoader(BaseLoader):
+    """Loads templates from modules ``precompile_theme`` wrote.
+
+    Templates that changed since they were precompiled get loaded
+    from the theme with the ThemeLoader.
+
+    :arg compiledpath: the directory the theme was precompiled to
+    :arg themeloader: the ThemeLoader for the theme
+    """
+    def __init__(self, compiledpath, themeloader):
+        self.themeloader = themeloader
+        self.modules = ModuleLoader(compiledpath)
+        with open(os.path.join(compiledpath, SIGNATURES_FILE), 'rb') as fp:
+            self.signatures = pickle.load(fp)
+
+    def get_source(self, environment, template):
+        return self.themeloader.get_source(environment, template)
+
+    def list_templates(self):
+        return self.themeloader.list_templates()
+
+    def load(self, environment, name, globals=None):
+        path = os.path.join(self.themeloader.path, name)
+        sig = file_signature(path)
+        if sig is None or self.signatures.get(name) != sig:
+            return self.themeloader.load(environment, name, globals)
+
+        template = self.modules.load(environment, name, globals)
+        template._uptodate = lambda: file_signature(path) == sig
+        return template
+
+
+class ThemeEnvironment(Environment):
+    def __init__(self, themepath, **kwargs):
+        Environment.__init__(self, **kwargs)
+        self.themepath = themepath
+
+    def get_template(self, name, parent=None, globals=None):
+        # This gets called for the template being rendered as well as
+        # any templates it extends or includes, so it's where we find
+        # out which templates a compiled url depends on.
+        incremental.record_file(None, os.path.join(self.themepath, name))
+        return Environment.get_template(self, name, parent, globals)
+
 
 def guess_autoescape(template_name):
     if template_name is None or '.' not in template_name:
@@ -27,13 +97,186 @@ def guess_autoescape(template_name):
     return template_name.endswith(('.html', '.htm', 'xml', 'rss'))
 
 
-@memcache_decorator('jinja_env')
-def build_environment(themedir, theme):
-    return Environment(
+def get_precompiled_path(cachedir, theme):
+    return os.path.join(cachedir, 'precompiled', theme)
+
+
+def get_theme_signature(themedir, theme):
+    """Returns a ``(signature, latest mtime)`` tuple for the files in
+    the theme directory and its subdirectories.
+    """
+    path = os.path.join(themedir, theme)
+    sig = []
+    latest = 0
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            fn = os.path.join(root, name)
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            sig.append((os.path.relpath(fn, path), st.st_mtime, st.st_size))
+            latest = max(latest, st.st_mtime)
+    return sig, latest
+
+
+def build_environment(themedir, theme, cachedir='', precompiled=True,
+                      auto_reload=True):
+    """Returns a Jinja2 environment for a theme.
+
+    :arg themedir: the directory themes are in
+    :arg theme: the name of the theme
+    :arg cachedir: the ``theme_cache_dir``; if set, compiled
+        templates get cached in it and templates ``precompile_theme``
+        compiled get loaded from it
+    :arg precompiled: whether to load precompiled templates
+    :arg auto_reload: whether to check template files for changes
+        every time templates are used
+    """
+    themepath = os.path.join(themedir, theme)
+    loader = ThemeLoader(themepath)
+    bytecode_cache = None
+
+    if cachedir:
+        bytecodepath = os.path.join(cachedir, 'bytecode')
+        if not os.path.isdir(bytecodepath):
+            try:
+                os.makedirs(bytecodepath)
+            except OSError:
+                # Another process may have created it in the meantime.
+                if not os.path.isdir(bytecodepath):
+                    raise
+        bytecode_cache = FileSystemBytecodeCache(bytecodepath)
+
+        compiledpath = get_precompiled_path(cachedir, theme)
+        if precompiled and os.path.exists(
+                os.path.join(compiledpath, SIGNATURES_FILE)):
+            loader = PrecompiledLoader(compiledpath, loader)
+
+    env = ThemeEnvironment(
+        themepath,
         autoescape=guess_autoescape,
-        loader=ThemeLoader(os.path.join(themedir, theme)),
+        loader=loader,
+        bytecode_cache=bytecode_cache,
+        auto_reload=auto_reload,
         extensions=['jinja2.ext.autoescape']
     )
+    env.filters.update({
+        'rfc822date': dates.rfc822date,
+        'w3cdate': dates.w3cdate
+    })
+    return env
+
+
+class Theme(object):
+    """The Jinja2 environment and content type for a theme.
+
+    Templates get compiled once and the content type gets read once.
+    Rather than checking template files every time they're used, the
+    files in the theme directory get checked at most every
+    ``theme_check_interval`` seconds and the theme gets loaded again
+    if any of them changed.
+
+    :arg cfg: config dict
+    :arg theme: the name of the theme
+    """
+    def __init__(self, cfg, theme):
+        self.themedir = cfg['themedir']
+        self.theme = theme
+        self.cachedir = cfg.get('theme_cache_dir', '')
+        self.check_interval = cfg.get('theme_check_interval', 5)
+        self.path = os.path.join(self.themedir, theme)
+
+        self.signature = None
+        self.last_checked = 0
+        self.env = None
+        self.content_type = None
+
+    def update(self):
+        """Loads the theme again if files in the theme directory
+        changed.
+
+        :returns: True if the theme was loaded again and False
+            otherwise
+        """
+        now = time.time()
+        if ((self.signature is not None and self.check_interval
+             and now - self.last_checked < self.check_interval)):
+            return False
+        self.last_checked = now
+
+        signature, latest = get_theme_signature(self.themedir, self.theme)
+        if signature == self.signature:
+            return False
+
+        path = os.path.join(self.path, 'content_type')
+        if os.path.exists(path):
+            with open(path, 'r') as fp:
+                content_type = fp.read().strip()
+        else:
+            content_type = 'text/html'
+
+        self.env = build_environment(self.themedir, self.theme,
+                                     self.cachedir, auto_reload=False)
+        self.content_type = content_type
+        self.signature = signature
+        return True
+
+
+def get_theme(cfg, theme):
+    """Returns the Theme for this config and theme name.
+
+    Themes live for the lifetime of the process.
+
+    :arg cfg: config dict
+    :arg theme: the name of the theme
+    """
+    key = (cfg['themedir'], theme, cfg.get('theme_cache_dir', ''))
+    theme_ = _themes.get(key)
+    if theme_ is None:
+        theme_ = _themes[key] = Theme(cfg, theme)
+    theme_.update()
+    return theme_
+
+
+def precompile_theme(themedir, theme, cachedir):
+    """Compiles all the templates in a theme to Python modules in
+    ``cachedir`` and returns the number of templates compiled.
+
+    Templates that fail to compile are skipped.  They get compiled
+    from the theme when they're used like they would without
+    precompiling.
+
+    :arg themedir: the directory themes are in
+    :arg theme: the name of the theme
+    :arg cachedir: the ``theme_cache_dir``
+    """
+    env = build_environment(themedir, theme, cachedir, precompiled=False)
+    names = env.loader.list_templates()
+    signatures = dict(
+        (name, file_signature(os.path.join(env.themepath, name)))
+        for name in names)
+
+    compiledpath = get_precompiled_path(cachedir, theme)
+    if os.path.exists(compiledpath):
+        shutil.rmtree(compiledpath)
+    os.makedirs(compiledpath)
+
+    env.compile_templates(compiledpath, filter_func=signatures.__contains__,
+                          zip=None)
+
+    compiled = [name for name in names if os.path.exists(
+        os.path.join(compiledpath, ModuleLoader.get_module_filename(name)))]
+
+    # The signatures file goes last so the PrecompiledLoader doesn't
+    # get used until all the modules are there.
+    path = os.path.join(compiledpath, SIGNATURES_FILE)
+    with open(path + '.tmp', 'wb') as fp:
+        pickle.dump(dict((name, signatures[name]) for name in compiled),
+                    fp, pickle.HIGHEST_PROTOCOL)
+    os.rename(path + '.tmp', path)
+    return len(compiled)
 
 
 class Renderer(RendererBase):
@@ -44,12 +287,6 @@ class Renderer(RendererBase):
         parsevars.update(self._request.data)
         return parsevars
 
-    def get_content_type(self, themedir, theme):
-        path = os.path.join(themedir, theme, 'content_type')
-        if os.path.exists(path):
-            return open(path, 'r').read().strip()
-        return 'text/html'
-
     def render(self, render_headers=True):
         """
         Do final rendering.
@@ -67,7 +304,10 @@ class Renderer(RendererBase):
         themedir = config['themedir']
         theme = data.get("theme") or "html"
 
-        data['content-type'] = self.get_content_type(themedir, theme)
+        theme_ = get_theme(config, theme)
+        incremental.record_file(
+            None, os.path.join(themedir, theme, 'content_type'))
+        data['content-type'] = theme_.content_type
 
         if render_headers:
             self.add_header('Content-type', data['content-type'])
@@ -94,11 +334,16 @@ class Renderer(RendererBase):
                 defaultfunc=lambda x:x)
 
             context = args['context']
-            env = build_environment(themedir, theme)
+            env = theme_.env
 
             template_name = context.get('bl_type', 'entry') + '.' + theme
             template = env.get_template(template_name)
-            output = template.render(context)
-            self.write(output.encode(config['blog_encoding']))
+            encoding = config['blog_encoding']
+            if self.should_stream():
+                self.write_stream(chunk.encode(encoding)
+                                  for chunk in template.generate(context))
+            else:
+                output = template.render(context)
+                self.write(output.encode(encoding))
 
         self.rendered = 1
@@ -0,0 +1,95 @@
+"""
+The session keeps site-wide aggregates like category counts, tags and
+year archive counts around for the lifetime of the process.
+
+Every page shows these, but they only change when entries change.
+Rather than figuring them out for every url that gets rendered,
+plugins get them with ``get_aggregate`` which computes them once and
+hands back the same value until the entry index generation changes
+(i.e. until an entry is added, changed or removed) or one of the
+other files the aggregate was built from changes.
+
+Plugins implementing the ``entries`` callback can filter entries on
+things other than the entries themselves (e.g. ignore_future filters
+on the current time).  If there are any, aggregates also get computed
+again when the filtered list of entries changes.
+
+Aggregates are shared between requests, so don't change them.
+
+When compiling incrementally, the dependencies recorded while
+computing an aggregate get recorded again for every url that uses it.
+"""
+
+from douglas import entryindex
+from douglas import incremental
+from douglas import plugin_utils
+from douglas import tools
+from douglas.memcache import file_signature
+
+
+# Maps (datadir, name) -> Aggregate
+_aggregates = {}
+
+
+class Aggregate(object):
+    def __init__(self, index, generation, files, listing, value, deps):
+        self.index = index
+        self.generation = generation
+        self.files = files
+        self.listing = listing
+        self.value = value
+        self.deps = deps
+
+    def is_current(self, index, files, listing):
+        return (self.index is index
+                and self.generation == index.generation
+                and self.files == files
+                and self.listing == listing)
+
+
+def get_aggregate(cfg, name, fun, files=()):
+    """Returns ``fun(cfg)`` computing it only if entries or ``files``
+    changed since the last time.
+
+    :arg cfg: config dict
+    :arg name: the name of the aggregate; e.g. ``'categories'``
+    :arg fun: function that takes the config and computes the
+        aggregate
+    :arg files: filenames other than entries that the aggregate is
+        built from; e.g. the tags file
+
+    :returns: the aggregate
+    """
+    # This only walks the datadir if it wasn't walked yet for this
+    # request.
+    index = entryindex.get_index(cfg)
+    index.update()
+
+    files = tuple((fn, file_signature(fn)) for fn in files)
+    if plugin_utils.get_callback_chain('entries'):
+        listing = tuple(tools.get_entries(cfg, cfg['datadir']))
+    else:
+        listing = None
+    key = (index.datadir, name)
+
+    aggregate = _aggregates.get(key)
+    if aggregate is not None and aggregate.is_current(index, files, listing):
+        incremental.record_dependencies(aggregate.deps)
+        return aggregate.value
+
+    incremental.start_recording()
+    try:
+        value = fun(cfg)
+    finally:
+        deps = incremental.stop_recording()
+
+    # The value may have updated the index, so it's the generation
+    # after computing that the value goes with.
+    _aggregates[key] = Aggregate(index, index.generation, files, listing,
+                                 value, deps)
+    return value
+
+
+def clear():
+    """Throws out all the aggregates."""
+    _aggregates.clear()
@@ -209,8 +209,215 @@ class Config(object):
     #: * *n* - *n* levels deep
     depth = Optional(0, lambda x: isinstance(x, int))
 
+    #: This is the file Douglas keeps the entry index in.  The entry
+    #: index holds metadata (mtime, published date, title, tags,
+    #: category and a hash of the contents) for every entry in your
+    #: datadir so that Douglas doesn't have to re-read every entry to
+    #: figure out which entries to show.  It's updated incrementally as
+    #: entries are added, changed and removed.
+    #:
+    #: If this is empty, then the index is only kept in memory and gets
+    #: rebuilt every time Douglas starts up.
+    #:
+    #: For example:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["entryindex_filename"] = "/home/joe/blog/entries.index"
+    #:
+    #: .. Note::
+    #:
+    #:    The process that runs your blog needs to be able to write to
+    #:    this file.
+    entryindex_filename = Optional('')
+    #: The number of seconds to wait between checking the datadir for
+    #: new, changed and removed entries when listing entries.
+    #:
+    #: Defaults to 5, so a long-running WSGI application walks your
+    #: datadir at most every 5 seconds rather than on every request.
+    #: Compiling always checks the datadir once at the start.  Set
+    #: this to 0 to check once per request:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["entryindex_check_interval"] = 0
+    entryindex_check_interval = Optional(5, lambda x: isinstance(x, int))
+    #: Whether or not to cache things like parsed entries and loaded
+    #: indexes in memory between requests.
+    #:
+    #: Defaults to False.  ``douglas-cmd compile`` always caches.  If
+    #: you're running Douglas as a long-running WSGI application, you
+    #: can turn this on, but you should use the ``"lru"`` memcache
+    #: backend so the cache doesn't grow without bound:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["use_memcache"] = True
+    #:    py["memcache_backend"] = "lru"
+    use_memcache = Optional(False, lambda x: isinstance(x, bool))
+    #: The memcache backend to use.
+    #:
+    #: ``"dict"``
+    #:     Keeps everything in memory forever.  This is the default.
+    #:
+    #: ``"lru"``
+    #:     Keeps at most ``memcache_max_entries`` items per cache scope
+    #:     evicting the least recently used ones and expires items
+    #:     after ``memcache_ttl`` seconds.
+    #:
+    #: ``"sqlite"``
+    #:     Keeps items in the SQLite database at
+    #:     ``memcache_sqlite_filename`` so that all the WSGI processes
+    #:     running your blog on a host share them.  Things like parsed
+    #:     reST bodies get computed once rather than once per process.
+    #:     ``memcache_max_entries`` and ``memcache_ttl`` apply here,
+    #:     too.
+    memcache_backend = Optional('dict',
+                                lambda x: x in ('dict', 'lru', 'sqlite'))
+    #: The maximum number of items to keep per cache scope with the
+    #: ``"lru"`` and ``"sqlite"`` memcache backends.  0 means no limit.
+    #:
+    #: Defaults to 1000.
+    memcache_max_entries = Optional(1000, lambda x: isinstance(x, int))
+    #: The SQLite database file for the ``"sqlite"`` memcache backend.
+    #:
+    #: For example:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["memcache_sqlite_filename"] = "/home/joe/blog/cache.db"
+    #:
+    #: .. Note::
+    #:
+    #:    All the processes that run your blog need to be able to
+    #:    write to this file and the directory it's in.
+    memcache_sqlite_filename = Optional('')
+    #: The number of seconds items live in the cache with the ``"lru"``
+    #: and ``"sqlite"`` memcache backends.  0 means they live until
+    #: they're evicted.
+    #:
+    #: Defaults to 0.
+    #:
+    #: Entries, tags indexes and the like are thrown out when the files
+    #: they came from change, so this is for things that aren't tied
+    #: to a single file like archive lists.
+    memcache_ttl = Optional(0, lambda x: isinstance(x, int))
+    #: Whether or not to handle conditional GET requests when running
+    #: as a WSGI application.
+    #:
+    #: Defaults to True.  Douglas adds ``ETag`` and ``Last-Modified``
+    #: headers to pages and responds with ``304 Not Modified`` without
+    #: rendering anything if the client sends an ``If-None-Match`` or
+    #: ``If-Modified-Since`` header that shows it already has the
+    #: current version of the page.
+    #:
+    #: If you use plugins that show things on pages that don't come
+    #: from entries, themes or the config, you might want to turn this
+    #: off:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["conditional_get"] = False
+    conditional_get = Optional(True, lambda x: isinstance(x, bool))
+    #: The page cache keeps rendered pages around so that the WSGI
+    #: application can serve them without running Douglas.
+    #:
+    #: Defaults to ``""`` which turns the page cache off.
+    #:
+    #: ``"memory"``
+    #:     Keeps pages in memory in each process.
+    #:
+    #: ``"disk"``
+    #:     Keeps pages in files in ``pagecache_dir`` where all the
+    #:     processes running your blog can get at them.
+    #:
+    #: Cached pages get thrown out when entries, files in the
+    #: ``themedir`` or the config change.  Only successful GET
+    #: requests get cached.
+    #:
+    #: .. Note::
+    #:
+    #:    Changes to files outside of the datadir and themedir (e.g.
+    #:    the pages plugin's ``pagesdir``) don't throw out cached
+    #:    pages.  Restart the WSGI application after changing them.
+    #:
+    #: For example:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["pagecache_backend"] = "memory"
+    pagecache_backend = Optional('', lambda x: x in ('', 'memory', 'disk'))
+    #: The directory to keep cached pages in with the ``"disk"`` page
+    #: cache backend.
+    #:
+    #: .. Note::
+    #:
+    #:    All the processes that run your blog need to be able to
+    #:    write to this directory.
+    pagecache_dir = Optional('')
+    #: The maximum number of pages to keep in the page cache.
+    #:
+    #: Defaults to 1000.
+    pagecache_max_entries = Optional(1000, lambda x: isinstance(x, int))
+    #: The number of seconds to wait between checking whether entries,
+    #: themes or the config changed.  Until then, cached pages get
+    #: served without touching the filesystem.
+    #:
+    #: Defaults to 5.
+    pagecache_check_interval = Optional(5, lambda x: isinstance(x, int))
+    #: Whether or not to stream responses when running as a WSGI
+    #: application.
+    #:
+    #: Defaults to False.  If this is True, the status and headers get
+    #: sent first and the body is sent in chunks as the templates
+    #: render rather than after the whole page is rendered.
+    #:
+    #: Plugins that need to post-process the body can set
+    #: ``buffer_response`` to True in the data dict before rendering to
+    #: turn streaming off for that request.
+    #:
+    #: When streaming, the ``end`` callback runs after the whole body
+    #: has been rendered and sent.
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["wsgi_streaming"] = True
+    wsgi_streaming = Optional(False, lambda x: isinstance(x, bool))
     #: The ``renderer`` variable lets you specify which renderer to use.
     renderer = Optional('jinjarenderer')
+    #: The directory the jinjarenderer keeps compiled templates in.
+    #:
+    #: Defaults to ``""`` which compiles templates from source in every
+    #: process.  If this is set, compiled templates get cached in
+    #: files and the templates ``douglas-cmd precompilethemes``
+    #: compiled get loaded from here.  Templates that changed since
+    #: they were precompiled get compiled from source.
+    #:
+    #: .. Note::
+    #:
+    #:    All the processes that run your blog need to be able to
+    #:    write to this directory.
+    #:
+    #: For example:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["theme_cache_dir"] = "/home/joe/blog/themecache/"
+    theme_cache_dir = Optional('')
+    #: The number of seconds to wait between checking whether files in
+    #: a theme changed.  Until then, the jinjarenderer uses the
+    #: templates and content type it already loaded without touching
+    #: the filesystem.
+    #:
+    #: Defaults to 5, so a long-running WSGI application looks at the
+    #: theme files at most every 5 seconds rather than on every
+    #: render.  Set this to 0 to check every time a page gets
+    #: rendered:
+    #:
+    #: .. code-block:: python
+    #:
+    #:    py["theme_check_interval"] = 0
+    theme_check_interval = Optional(5, lambda x: isinstance(x, int))
 
     #: The ``ignore_directories`` variable allows you to specify which
     #: directories in your datadir should be ignored by Douglas.
@@ -0,0 +1,169 @@
+import os
+import shutil
+
+from nose.tools import eq_
+
+from douglas import app, plugin_utils, tools
+from douglas.settings import Config
+from douglas.tests import UnitTestBase
+
+
+THEMEDIR = os.path.join(os.path.dirname(app.__file__), 'data', 'themes')
+
+
+class TestResponse(UnitTestBase):
+    def test_stream(self):
+        response = app.Response(app.Request({}, {}, {}))
+        response.write('a')
+        response.write_stream(iter(['b', 'c']))
+        response.write('d')
+
+        eq_(response.is_streaming(), True)
+        eq_(list(response.iter_body()), ['a', 'b', 'c', 'd'])
+
+    def test_read_buffers(self):
+        response = app.Response(app.Request({}, {}, {}))
+        response.write('a')
+        response.write_stream(iter(['b', 'c']))
+
+        response.seek(0)
+        eq_(response.read(), 'abc')
+        eq_(response.is_streaming(), False)
+
+        # Writing after buffering appends.
+        response.write('d')
+        response.seek(0)
+        eq_(response.read(), 'abcd')
+
+
+class RenderTest(UnitTestBase):
+    def tearDown(self):
+        UnitTestBase.tearDown(self)
+        shutil.rmtree(self.blogdir, ignore_errors=True)
+
+    def render(self, cfg=None, data=None, env=None, callbacks=None):
+        _config = {
+            'datadir': self.datadir,
+            'themedir': THEMEDIR,
+            'base_url': 'http://example.com',
+            'log_file': os.path.join(self.blogdir, 'douglas.log')
+        }
+        if cfg:
+            _config.update(cfg)
+        _config = Config.validate(_config)
+        app.initialize(_config)
+        if callbacks:
+            plugin_utils.callbacks.update(callbacks)
+
+        _env = {
+            'PATH_INFO': '/entry1.html',
+            'QUERY_STRING': '',
+            'REQUEST_METHOD': 'GET',
+            'HTTP_HOST': 'example.com',
+            'wsgi.input': None
+        }
+        if env:
+            _env.update(env)
+        p = app.Douglas(_config, _env, data)
+        p.run(compiling=True)
+        return p.get_response()
+
+
+class TestStreaming(RenderTest):
+    def test_streaming(self):
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Title', {}, '<p>body</p>\n')
+
+        response = self.render()
+        eq_(response.is_streaming(), False)
+        response.seek(0)
+        expected = response.read()
+
+        response = self.render({'wsgi_streaming': True})
+        eq_(response.is_streaming(), True)
+        eq_(''.join(response.iter_body()), expected)
+
+        # The end callback runs after the body has been rendered.
+        calls = []
+        response = self.render(
+            {'wsgi_streaming': True},
+            callbacks={'end': [lambda args: calls.append(args['request'])]})
+        try:
+            eq_(calls, [])
+            eq_(''.join(response.iter_body()), expected)
+            eq_(len(calls), 1)
+        finally:
+            plugin_utils.callbacks.pop('end', None)
+
+        # Plugins can turn streaming off.
+        response = self.render({'wsgi_streaming': True},
+                               {'buffer_response': True})
+        eq_(response.is_streaming(), False)
+
+
+class TestConditionalGet(RenderTest):
+    def test_etag(self):
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Title', {}, '<p>body</p>\n')
+        fn = os.path.join(self.datadir, 'entry1.txt')
+
+        response = self.render()
+        eq_(response.status, '200 OK')
+        etag = response.headers['ETag']
+        assert 'Last-Modified' in response.headers
+
+        response = self.render(env={'HTTP_IF_NONE_MATCH': etag})
+        eq_(response.status, '304 Not Modified')
+        response.seek(0)
+        eq_(response.read(), '')
+
+        # Changing the entry changes the etag.
+        with open(fn, 'a') as fp:
+            fp.write('more body\n')
+        os.utime(fn, (1000000000, 1000000000))
+        response = self.render(env={'HTTP_IF_NONE_MATCH': etag})
+        eq_(response.status, '200 OK')
+        assert response.headers['ETag'] != etag
+
+    def test_if_modified_since(self):
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Title', {}, '<p>body</p>\n')
+
+        # The theme files count, too, so use a date after those.
+        response = self.render(
+            env={'HTTP_IF_MODIFIED_SINCE': 'Fri, 01 Jan 2100 00:00:00 GMT'})
+        eq_(response.status, '304 Not Modified')
+
+        response = self.render(
+            env={'HTTP_IF_MODIFIED_SINCE': 'Sat, 08 Sep 2001 00:00:00 GMT'})
+        eq_(response.status, '200 OK')
+
+    def test_off(self):
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Title', {}, '<p>body</p>\n')
+
+        response = self.render({'conditional_get': False})
+        assert 'ETag' not in response.headers
+
+
+class TestDateArchives(RenderTest):
+    def test_year(self):
+        # 2001-09-09 and 2004-01-10
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Entry one', {}, '<p>body</p>\n')
+        tools.create_entry(self.datadir, 'cat', 'entry2.txt', 1073741824,
+                           'Entry two', {}, '<p>body</p>\n')
+
+        response = self.render({'year_indexes': True},
+                               env={'PATH_INFO': '/2001/index.html'})
+        response.seek(0)
+        body = response.read()
+        assert 'Entry one' in body
+        assert 'Entry two' not in body
+
+        response = self.render({'year_indexes': True},
+                               env={'PATH_INFO': '/2004/index.html'})
+        response.seek(0)
+        body = response.read()
+        assert 'Entry one' not in body
+        assert 'Entry two' in body
@@ -2,6 +2,7 @@ import os
 
 from nose.tools import eq_
 
+from douglas import entryindex
 from douglas.plugins import categories
 from douglas.tests import PluginTest
 
@@ -15,6 +16,7 @@ class Test_categories(PluginTest):
         PluginTest.setUp(self, categories)
         # FIXME - should run initialize here instead
         self.request.get_configuration()['extensions'] = {'txt': parse_text}
+        self.request.get_configuration()['entryindex_check_interval'] = 0
 
     def tearDown(self):
         PluginTest.tearDown(self)
@@ -53,3 +55,21 @@ class Test_categories(PluginTest):
             '</ul></li>'
             '</ul></li>\n'
             '</ul>')
+
+    def test_as_list_cached(self):
+        self.generate_entry('test1.txt')
+        cm = categories.CategoryManager(self.request)
+        html = cm.as_list()
+
+        # The HTML is cached with the categories, so another request
+        # gets the same string without building it again.
+        cm2 = categories.CategoryManager(self.request)
+        assert cm2.as_list() is html
+
+        # Adding an entry changes the categories.
+        self.generate_entry('cat1/test2.txt')
+        entryindex.get_index(self.request.get_configuration()).expire()
+        cm3 = categories.CategoryManager(self.request)
+        assert 'cat1' in cm3.as_list()
+        mtime = os.stat(os.path.join(self.datadir, 'cat1', 'test2.txt'))[8]
+        eq_(cm3.latest_mtime('cat1'), mtime)
@@ -0,0 +1,161 @@
+import os
+import shutil
+
+from nose.tools import eq_
+
+from douglas import app, incremental, tools
+from douglas.settings import Config
+from douglas.tests import UnitTestBase
+
+
+THEMEDIR = os.path.join(os.path.dirname(app.__file__), 'data', 'themes')
+
+
+class CompileTest(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self.compiledir = os.path.join(self.blogdir, 'compiled_site')
+        os.makedirs(self.compiledir)
+
+    def tearDown(self):
+        UnitTestBase.tearDown(self)
+        shutil.rmtree(self.blogdir, ignore_errors=True)
+
+    def build_config(self, cfg=None):
+        _config = {
+            'datadir': self.datadir,
+            'themedir': THEMEDIR,
+            'compiledir': self.compiledir,
+            'base_url': 'http://example.com',
+            'log_file': os.path.join(self.blogdir, 'douglas.log')
+        }
+        if cfg:
+            _config.update(cfg)
+        _config = Config.validate(_config)
+        app.initialize(_config)
+        return _config
+
+    def create_entry(self, filename, mtime, title='Title'):
+        tools.create_entry(self.datadir, os.path.dirname(filename),
+                           os.path.basename(filename), mtime, title, {},
+                           '<p>body</p>\n')
+
+    def compiled_files(self):
+        files = []
+        for root, dirs, names in os.walk(self.compiledir):
+            for name in names:
+                if name == incremental.MANIFEST_FILENAME:
+                    continue
+                fn = os.path.join(root, name)
+                files.append(fn[len(self.compiledir):])
+        return sorted(files)
+
+
+class TestRunCompile(CompileTest):
+    def test_jobs(self):
+        self.create_entry('entry1.txt', 1000000000)
+        self.create_entry('cat1/entry2.txt', 1000003600)
+
+        cfg = self.build_config()
+        eq_(app.Douglas(cfg, {}).run_compile(jobs=2), 0)
+
+        expected = self.compiled_files()
+        eq_(expected, ['/2001/index.html',
+                       '/cat1/entry2.html',
+                       '/cat1/index.html',
+                       '/entry1.html',
+                       '/index.html'])
+
+        # Compiling serially produces the same files.
+        shutil.rmtree(self.compiledir)
+        os.makedirs(self.compiledir)
+        eq_(app.Douglas(cfg, {}).run_compile(jobs=1), 0)
+        eq_(self.compiled_files(), expected)
+
+    def test_errors(self):
+        self.create_entry('entry1.txt', 1000000000)
+
+        cfg = self.build_config({'compile_urls': ['/nothemehere.foo']})
+        eq_(app.Douglas(cfg, {}).run_compile(jobs=2), 1)
+
+        # The other urls still get compiled.
+        assert '/entry1.html' in self.compiled_files()
+
+
+class TestIncrementalCompile(CompileTest):
+    def build_config(self, cfg=None):
+        _config = {'year_indexes': False}
+        if cfg:
+            _config.update(cfg)
+        return CompileTest.build_config(self, _config)
+
+    def compile(self, cfg):
+        eq_(app.Douglas(cfg, {}).run_compile(incremental=True), 0)
+
+    def mark_compiled(self):
+        # Replace the compiled files with a marker so we can tell which
+        # ones get compiled again.
+        for fn in self.compiled_files():
+            with open(self.compiledir + fn, 'w') as fp:
+                fp.write('old')
+
+    def old_files(self):
+        return [fn for fn in self.compiled_files()
+                if open(self.compiledir + fn).read() == 'old']
+
+    def test_nothing_changed(self):
+        self.create_entry('entry1.txt', 1000000000)
+        self.create_entry('cat1/entry2.txt', 1000003600)
+
+        cfg = self.build_config()
+        self.compile(cfg)
+        self.mark_compiled()
+        self.compile(cfg)
+
+        eq_(self.old_files(), self.compiled_files())
+
+    def test_entry_changed(self):
+        self.create_entry('entry1.txt', 1000000000)
+        self.create_entry('cat1/entry2.txt', 1000003600)
+
+        cfg = self.build_config()
+        self.compile(cfg)
+        self.mark_compiled()
+
+        # Changing the body of entry2 recompiles the pages it shows up
+        # on, but not the entry1 page.
+        fn = os.path.join(self.datadir, 'cat1', 'entry2.txt')
+        with open(fn, 'a') as fp:
+            fp.write('more body\n')
+        os.utime(fn, (1000003600, 1000003600))
+        self.compile(cfg)
+
+        eq_(self.old_files(), ['/entry1.html'])
+
+    def test_entry_added(self):
+        self.create_entry('entry1.txt', 1000000000)
+        self.create_entry('cat1/entry2.txt', 1000003600)
+
+        cfg = self.build_config()
+        self.compile(cfg)
+        self.mark_compiled()
+
+        # Adding an entry changes the lists of entries, but not the
+        # other entry pages.
+        self.create_entry('cat1/entry3.txt', 1000007200)
+        self.compile(cfg)
+
+        eq_(self.old_files(), ['/cat1/entry2.html', '/entry1.html'])
+        assert '/cat1/entry3.html' in self.compiled_files()
+
+    def test_config_changed(self):
+        self.create_entry('entry1.txt', 1000000000)
+
+        cfg = self.build_config()
+        self.compile(cfg)
+        self.mark_compiled()
+
+        cfg = self.build_config({'blog_title': 'A new title'})
+        self.compile(cfg)
+
+        eq_(self.old_files(), [])
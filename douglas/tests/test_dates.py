@@ -0,0 +1,33 @@
+import locale
+import time
+
+from nose.tools import eq_
+
+from douglas import dates
+from douglas.tests import UnitTestBase
+
+
+class TestDates(UnitTestBase):
+    def test_formats(self):
+        eq_(dates.rfc822date(1216659107), 'Mon, 21 Jul 2008 16:51 GMT')
+        eq_(dates.httpdate(1216659107), 'Mon, 21 Jul 2008 16:51:47 GMT')
+        eq_(dates.w3cdate(1216659107), '2008-07-21T16:51:47Z')
+
+    def test_same_as_strftime(self):
+        loc = locale.getlocale(locale.LC_ALL)
+        locale.setlocale(locale.LC_ALL, 'C')
+        try:
+            for mtime in range(946684800, 1262304000, 3456789):
+                gmt = time.gmtime(mtime)
+                eq_(dates.rfc822date(mtime),
+                    time.strftime('%a, %d %b %Y %H:%M GMT', gmt))
+                eq_(dates.httpdate(mtime),
+                    time.strftime('%a, %d %b %Y %H:%M:%S GMT', gmt))
+                eq_(dates.w3cdate(mtime),
+                    time.strftime('%Y-%m-%dT%H:%M:%SZ', gmt))
+        finally:
+            locale.setlocale(locale.LC_ALL, loc)
+
+    def test_cache(self):
+        eq_(dates.w3cdate(1000000000), '2001-09-09T01:46:40Z')
+        eq_(dates._cache['w3cdate'][1000000000], '2001-09-09T01:46:40Z')
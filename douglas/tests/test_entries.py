@@ -4,6 +4,7 @@ from os import environ
 from nose.tools import eq_, raises
 
 from douglas.entries.base import EntryBase, generate_entry
+from douglas.entries.fileentry import FileEntry
 from douglas.tests import req_, UnitTestBase
 
 
@@ -57,6 +58,31 @@ class TestEntryBase(UnitTestBase):
         for key, expected in tests:
             eq_(e[key], expected)
 
+    def test_lazy_dates(self):
+        e = EntryBase(req_())
+        e.set_time(TIME1)
+
+        # Date keys don't get computed until they're looked at, but
+        # they act like they're there.
+        assert 'ti' not in e._metadata
+        eq_('ti' in e, True)
+        assert 'rfc822date' in e.keys()
+
+        # Setting and deleting date keys sticks.
+        e['date'] = 'today'
+        del e['yr']
+        eq_(e['date'], 'today')
+        eq_('yr' in e, False)
+
+        # Setting the time again recomputes them.
+        e.set_time(TIME1)
+        eq_(e['date'], 'Mon, 21 Jul 2008')
+        eq_(e['yr'], '2008')
+
+    def test_slots(self):
+        e = EntryBase(req_())
+        assert not hasattr(e, '__dict__')
+
     def test_dictlike(self):
         e = EntryBase(req_())
         e['foo'] = 'bar'
@@ -89,6 +115,11 @@ class TestEntryBase(UnitTestBase):
         del e['foo']
         eq_(e.get('foo'), None)
 
+        eq_(e.pop('faux'), 'pearls')
+        eq_(e.setdefault('foo', 'baz'), 'baz')
+        eq_(len(e), 2)
+        eq_(dict(e.items()), {'foo': 'baz', 'body': 'new body data'})
+
     @raises(KeyError)
     def test_delitem_keyerror(self):
         e = EntryBase(req_())
@@ -118,3 +149,83 @@ class TestEntryBase(UnitTestBase):
         # make sure it doesn't error out.
         e = EntryBase(req_())
         repr(e)
+
+
+class TestFileEntry(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self.request = self.build_request()
+        cfg = self.request.get_configuration()
+
+        # Count how many times the entry gets parsed.
+        self.parsed = []
+        parser = cfg['extensions']['txt']
+
+        def counting_parser(filename, request):
+            self.parsed.append(filename)
+            return parser(filename, request)
+        counting_parser.entry_header = True
+
+        def other_parser(filename, request):
+            self.parsed.append(filename)
+            return {'title': 'Other title', 'body': 'Other body'}
+        cfg['extensions'] = {'txt': counting_parser, 'other': other_parser}
+
+    def test_header_does_not_parse(self):
+        fn = self.create_file('entry1.txt',
+                              'The title\n#tags a,b\n<p>body</p>\n')
+        e = FileEntry(self.request, fn, self.datadir)
+
+        eq_(e['title'], 'The title')
+        eq_(e['tags'], 'a,b')
+        eq_(e['file_path'], 'entry1')
+        eq_(self.parsed, [])
+
+        # The body gets parsed on demand.
+        eq_(e['body'], '<p>body</p>\n')
+        eq_(self.parsed, [fn])
+
+    def test_missing_key_parses(self):
+        fn = self.create_file('entry1.txt', 'The title\n<p>body</p>\n')
+        e = FileEntry(self.request, fn, self.datadir)
+
+        eq_(e.get('tags'), None)
+        eq_('body' in e, True)
+        eq_(self.parsed, [fn])
+
+    def test_changes_before_parsing(self):
+        fn = self.create_file('entry1.txt', 'The title\n<p>body</p>\n')
+        e = FileEntry(self.request, fn, self.datadir)
+
+        e['title'] = 'New title'
+        e['body'] = 'New body'
+        eq_(self.parsed, [])
+
+        # Setting things before the entry gets parsed sticks.
+        eq_(e['summary'] if 'summary' in e else None, None)
+        eq_(self.parsed, [fn])
+        eq_(e['title'], 'New title')
+        eq_(e['body'], 'New body')
+
+    def test_delitem_before_parsing(self):
+        fn = self.create_file('entry1.txt', 'The title\n<p>body</p>\n')
+        e = FileEntry(self.request, fn, self.datadir)
+
+        del e['title']
+        eq_(self.parsed, [])
+
+        # Deleting something that's not in the header parses the
+        # entry.
+        del e['body']
+        eq_(self.parsed, [fn])
+        eq_('title' in e, False)
+        eq_('body' in e, False)
+
+    def test_other_parser(self):
+        # Entry parsers that don't parse the Douglas entry format
+        # don't get the header read.
+        fn = self.create_file('entry1.other', 'Not the title\n')
+        e = FileEntry(self.request, fn, self.datadir)
+
+        eq_(e['title'], 'Other title')
+        eq_(self.parsed, [fn])
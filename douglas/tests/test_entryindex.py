@@ -0,0 +1,192 @@
+import os
+import time
+
+from nose.tools import eq_
+
+from douglas import entryindex, tools
+from douglas.tests import UnitTestBase
+
+
+class EntryIndexTest(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self.indexfile = os.path.join(self.blogdir, 'entries.index')
+        self.cfg = self.build_request(
+            {'entryindex_filename': self.indexfile,
+             'entryindex_check_interval': 0}).get_configuration()
+
+    def create_entry(self, file_path, mtime, data):
+        fn = self.create_file(file_path, data)
+        os.utime(fn, (mtime, mtime))
+        return fn
+
+    def test_records(self):
+        fn = self.create_entry('cat1/entry1.txt', 1000000000,
+                               'The title\n#tags a,b\nbody\n')
+
+        index = entryindex.EntryIndex(self.cfg)
+        eq_(index.update(), True)
+
+        record = index.entries[fn]
+        eq_(record['published'], 1000000000)
+        eq_(record['title'], 'The title')
+        eq_(record['tags'], 'a,b')
+        eq_(record['category'], 'cat1')
+
+        # Nothing changed, so nothing to do.
+        eq_(index.update(), False)
+
+    def test_incremental(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'Title 1\nbody\n')
+        fn2 = self.create_entry('entry2.txt', 1000000000, 'Title 2\nbody\n')
+
+        index = entryindex.EntryIndex(self.cfg)
+        index.update()
+        generation = index.generation
+        eq_(sorted(index.entries), [fn1, fn2])
+
+        os.remove(fn2)
+        fn3 = self.create_entry('entry3.txt', 1000000000, 'Title 3\nbody\n')
+        self.create_entry('entry1.txt', 1000000100, 'New title\nbody\n')
+        index.expire()
+        index.update()
+
+        eq_(sorted(index.entries), [fn1, fn3])
+        eq_(index.entries[fn1]['title'], 'New title')
+        assert index.generation > generation
+
+    def test_expire(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'Title 1\nbody\n')
+
+        index = entryindex.EntryIndex(self.cfg)
+        index.update()
+
+        # The datadir only gets walked again after the index expires.
+        fn2 = self.create_entry('entry2.txt', 1000000000, 'Title 2\nbody\n')
+        eq_(index.update(), False)
+        eq_(sorted(index.entries), [fn1])
+
+        index.expire()
+        eq_(index.update(), True)
+        eq_(sorted(index.entries), [fn1, fn2])
+
+    def test_check_interval(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'Title 1\nbody\n')
+
+        self.cfg['entryindex_check_interval'] = 60
+        index = entryindex.EntryIndex(self.cfg)
+        index.update()
+
+        # Expiring doesn't walk the datadir again until the interval
+        # is up.
+        fn2 = self.create_entry('entry2.txt', 1000000000, 'Title 2\nbody\n')
+        index.expire()
+        eq_(index.update(), False)
+
+        index.last_checked -= 60
+        eq_(index.update(), True)
+        eq_(sorted(index.entries), [fn1, fn2])
+
+    def test_persisted(self):
+        fn = self.create_entry('entry1.txt', 1000000000, 'Title 1\nbody\n')
+
+        index = entryindex.EntryIndex(self.cfg)
+        index.update()
+        assert os.path.exists(self.indexfile)
+
+        index = entryindex.EntryIndex(self.cfg)
+        index.load()
+        eq_(index.entries[fn]['title'], 'Title 1')
+
+    def test_get_entries(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'Title\n')
+        fn2 = self.create_entry('cat1/entry2.txt', 1000000000, 'Title\n')
+        fn3 = self.create_entry('cat1/sub/entry3.txt', 1000000000, 'Title\n')
+
+        eq_(tools.get_entries(self.cfg, self.datadir), [fn2, fn3, fn1])
+        eq_(tools.get_entries(self.cfg, self.datadir, 1), [fn1])
+        eq_(tools.get_entries(self.cfg, os.path.join(self.datadir, 'cat1')),
+            [fn2, fn3])
+
+    def test_filestat(self):
+        fn = self.create_entry('entry1.txt', 1000000000, 'Title 1\nbody\n')
+        eq_(tools.filestat(self.cfg, fn), time.localtime(1000000000))
+
+        # Changes get picked up.
+        os.utime(fn, (1000000100, 1000000100))
+        eq_(tools.filestat(self.cfg, fn), time.localtime(1000000100))
+
+    def test_filestat_many(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'Title 1\nbody\n')
+        fn2 = self.create_entry('entry2.txt', 1000000100, 'Title 2\nbody\n')
+
+        # Files outside the datadir get stat'd.
+        other = os.path.join(self.blogdir, 'other.txt')
+        with open(other, 'w') as fp:
+            fp.write('other')
+        os.utime(other, (1000000200, 1000000200))
+
+        eq_(tools.filestat_many(self.cfg, [fn1, fn2, other]), {
+            fn1: time.localtime(1000000000),
+            fn2: time.localtime(1000000100),
+            other: time.localtime(1000000200)
+        })
+
+    def test_dates(self):
+        mtime1 = time.mktime((2001, 9, 9, 12, 0, 0, 0, 0, -1))
+        mtime2 = time.mktime((2001, 10, 1, 12, 0, 0, 0, 0, -1))
+        fn1 = self.create_entry('entry1.txt', mtime1, 'Title\n')
+        fn2 = self.create_entry('cat1/entry2.txt', mtime2, 'Title\n')
+        fn3 = self.create_entry('cat1/entry3.txt', mtime2, 'Title\n')
+
+        index = entryindex.EntryIndex(self.cfg)
+        index.update()
+        eq_(index.get_dates(),
+            {'2001': {'09': {'09': [fn1]}, '10': {'01': [fn2, fn3]}}})
+
+        eq_(index.get_date_entries('2001'), [fn2, fn3, fn1])
+        eq_(index.get_date_entries('2001', '10'), [fn2, fn3])
+        eq_(index.get_date_entries('2001', '09', '09'), [fn1])
+        eq_(index.get_date_entries('2001', '09', '10'), [])
+        eq_(index.get_date_entries('2002'), [])
+        eq_(index.get_date_entries('2001', recurse=1), [fn1])
+
+        # The buckets get updated when entries change.
+        os.remove(fn1)
+        index.expire()
+        index.update()
+        eq_(index.get_date_entries('2001'), [fn2, fn3])
+
+    def test_categories(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'Title\n')
+        fn2 = self.create_entry('cat1/entry2.txt', 1000000100, 'Title\n')
+        self.create_entry('cat1/sub/entry3.txt', 1000000200, 'Title\n')
+
+        index = entryindex.EntryIndex(self.cfg)
+        index.update()
+        eq_(index.get_categories(),
+            {'': [3, 1000000200], 'cat1': [2, 1000000200],
+             'cat1/sub': [1, 1000000200]})
+
+        # Removing the latest entry in a category figures out the
+        # latest one again.
+        os.remove(os.path.join(self.datadir, 'cat1', 'sub', 'entry3.txt'))
+        index.expire()
+        index.update()
+        eq_(index.get_categories(),
+            {'': [2, 1000000100], 'cat1': [1, 1000000100]})
+
+        # Changing an entry moves its published time.
+        os.utime(fn1, (1000000300, 1000000300))
+        index.expire()
+        index.update()
+        eq_(index.get_categories(),
+            {'': [2, 1000000300], 'cat1': [1, 1000000100]})
+
+        # The categories get persisted with the index.
+        index2 = entryindex.EntryIndex(self.cfg)
+        index2.load()
+        eq_(index2.get_categories(), index.get_categories())
+        os.remove(fn2)
+        index2.update()
+        eq_(index2.get_categories(), {'': [1, 1000000300]})
@@ -0,0 +1,84 @@
+import os
+
+from nose.tools import eq_
+
+from douglas import app
+from douglas.entries.entrylist import EntryList
+from douglas.entries.fileentry import FileEntry
+from douglas.tests import UnitTestBase
+
+
+class TestEntryList(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self.request = self.build_request()
+
+        self.mtimes = {}
+        self.filenames = []
+        for i in range(5):
+            fn = self.create_file('entry{0}.txt'.format(i),
+                                  'Title {0}\nbody\n'.format(i))
+            mtime = 1000000000 + i * 100
+            os.utime(fn, (mtime, mtime))
+            self.mtimes[fn] = mtime
+            self.filenames.insert(0, fn)
+
+    def build_entrylist(self):
+        return EntryList(self.request, self.filenames, self.mtimes,
+                         self.datadir, sorted=True)
+
+    def created(self, entrylist):
+        return len([mem for mem in entrylist._items
+                    if isinstance(mem, FileEntry)])
+
+    def test_lazy(self):
+        entrylist = self.build_entrylist()
+        eq_(len(entrylist), 5)
+        eq_(self.created(entrylist), 0)
+
+        # Slicing doesn't create entries.
+        first = entrylist[:2]
+        eq_(len(first), 2)
+        eq_(self.created(first), 0)
+
+        eq_([mem['title'] for mem in first], ['Title 4', 'Title 3'])
+        eq_(self.created(first), 2)
+        eq_(first[0]._mtime, 1000000400)
+
+    def test_list_operations(self):
+        entrylist = self.build_entrylist()
+        entrylist.sort(key=lambda entry: entry._mtime)
+        eq_(entrylist[0]['title'], 'Title 0')
+        eq_(entrylist.sorted, False)
+
+        entry = entrylist.pop()
+        eq_(entry['title'], 'Title 4')
+        entrylist.insert(0, entry)
+        eq_(entrylist.index(entry), 0)
+        del entrylist[1:]
+        eq_([mem['title'] for mem in entrylist], ['Title 4'])
+
+    def test_find_by_identity(self):
+        entrylist = self.build_entrylist()
+        entry = entrylist[3]
+
+        # Finding an entry that's in the list doesn't create or
+        # compare the entries before it.
+        assert entry in entrylist
+        eq_(entrylist.index(entry), 3)
+        entrylist.remove(entry)
+        eq_(len(entrylist), 4)
+        eq_(self.created(entrylist), 0)
+
+    def test_file_list_handler(self):
+        cfg = self.request.get_configuration()
+        cfg['num_entries'] = 2
+        data = self.request.get_data()
+        data.update({
+            'bl_type': 'entry_list',
+            'root_datadir': self.datadir,
+            'truncate': True
+        })
+
+        entrylist = app.blosxom_file_list_handler({'request': self.request})
+        eq_([mem['title'] for mem in entrylist], ['Title 4', 'Title 3'])
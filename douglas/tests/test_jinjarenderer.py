@@ -0,0 +1,126 @@
+import os
+
+from nose.tools import eq_
+
+from douglas.renderers import jinjarenderer
+from douglas.tests import UnitTestBase
+
+
+class ThemeTestBase(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self.cachedir = os.path.join(self.blogdir, 'themecache')
+        self.create_template('content_type', 'text/html')
+        self.create_template('entry.html', '<p>{{ title }}</p>')
+
+    def create_template(self, name, data, mtime=1000000000):
+        fn = os.path.join(self.themedir, 'html', name)
+        if not os.path.exists(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        with open(fn, 'w') as fp:
+            fp.write(data)
+        os.utime(fn, (mtime, mtime))
+        return fn
+
+
+class TestEnvironment(ThemeTestBase):
+    def render(self, name='entry.html', **context):
+        env = jinjarenderer.build_environment(
+            self.themedir, 'html', self.cachedir)
+        return env.get_template(name).render(**context)
+
+    def test_bytecode_cache(self):
+        eq_(self.render(title='Hi'), '<p>Hi</p>')
+        assert os.listdir(os.path.join(self.cachedir, 'bytecode'))
+        eq_(self.render(title='Hi'), '<p>Hi</p>')
+
+    def test_precompile_theme(self):
+        eq_(jinjarenderer.precompile_theme(
+            self.themedir, 'html', self.cachedir), 1)
+
+        env = jinjarenderer.build_environment(
+            self.themedir, 'html', self.cachedir)
+        assert isinstance(env.loader, jinjarenderer.PrecompiledLoader)
+        template = env.get_template('entry.html')
+        assert template.filename.startswith(self.cachedir)
+        eq_(template.render(title='Hi'), '<p>Hi</p>')
+
+    def test_precompiled_template_changed(self):
+        jinjarenderer.precompile_theme(self.themedir, 'html', self.cachedir)
+        env = jinjarenderer.build_environment(
+            self.themedir, 'html', self.cachedir)
+        eq_(env.get_template('entry.html').render(title='Hi'), '<p>Hi</p>')
+
+        # Templates that changed since they were precompiled get
+        # compiled from the theme.
+        self.create_template('entry.html', '<h2>{{ title }}</h2>',
+                             mtime=1000000100)
+        eq_(env.get_template('entry.html').render(title='Hi'),
+            '<h2>Hi</h2>')
+        eq_(self.render(title='Hi'), '<h2>Hi</h2>')
+
+
+class TestTheme(ThemeTestBase):
+    def setUp(self):
+        ThemeTestBase.setUp(self)
+        self.cfg = {'themedir': self.themedir,
+                    'theme_check_interval': 0}
+        jinjarenderer._themes.clear()
+
+    def tearDown(self):
+        jinjarenderer._themes.clear()
+        ThemeTestBase.tearDown(self)
+
+    def test_same_environment(self):
+        theme = jinjarenderer.get_theme(self.cfg, 'html')
+        env = theme.env
+        eq_(theme.content_type, 'text/html')
+        assert jinjarenderer.get_theme(self.cfg, 'html') is theme
+        assert theme.env is env
+
+    def test_reloads_changed_theme(self):
+        theme = jinjarenderer.get_theme(self.cfg, 'html')
+        eq_(theme.env.get_template('entry.html').render(title='Hi'),
+            '<p>Hi</p>')
+
+        self.create_template('content_type', 'application/xhtml+xml',
+                             mtime=1000000100)
+        self.create_template('entry.html', '<h2>{{ title }}</h2>',
+                             mtime=1000000100)
+        jinjarenderer.get_theme(self.cfg, 'html')
+        eq_(theme.content_type, 'application/xhtml+xml')
+        eq_(theme.env.get_template('entry.html').render(title='Hi'),
+            '<h2>Hi</h2>')
+
+    def test_check_interval(self):
+        self.cfg['theme_check_interval'] = 60
+        theme = jinjarenderer.get_theme(self.cfg, 'html')
+        eq_(theme.env.get_template('entry.html').render(title='Hi'),
+            '<p>Hi</p>')
+
+        # Changes don't get noticed until the interval is up.
+        self.create_template('entry.html', '<h2>{{ title }}</h2>',
+                             mtime=1000000100)
+        jinjarenderer.get_theme(self.cfg, 'html')
+        eq_(theme.env.get_template('entry.html').render(title='Hi'),
+            '<p>Hi</p>')
+
+        theme.last_checked -= 60
+        jinjarenderer.get_theme(self.cfg, 'html')
+        eq_(theme.env.get_template('entry.html').render(title='Hi'),
+            '<h2>Hi</h2>')
+
+    def test_reloads_changed_subdirectory(self):
+        self.create_template('partials/title.html', '<p>{{ title }}</p>')
+        self.create_template('entry.html',
+                             '{% include "partials/title.html" %}')
+        theme = jinjarenderer.get_theme(self.cfg, 'html')
+        eq_(theme.env.get_template('entry.html').render(title='Hi'),
+            '<p>Hi</p>')
+
+        # Templates in subdirectories count as theme files, too.
+        self.create_template('partials/title.html', '<h2>{{ title }}</h2>',
+                             mtime=1000000100)
+        jinjarenderer.get_theme(self.cfg, 'html')
+        eq_(theme.env.get_template('entry.html').render(title='Hi'),
+            '<h2>Hi</h2>')
@@ -0,0 +1,201 @@
+import os
+import time
+
+from nose.tools import eq_, raises
+
+from douglas import memcache
+from douglas.tests import UnitTestBase
+
+
+class MemcacheTest(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self._usecache = memcache.usecache
+        self._backend = memcache.get_backend()
+
+    def tearDown(self):
+        UnitTestBase.tearDown(self)
+        memcache.usecache = self._usecache
+        memcache.set_backend(self._backend)
+
+
+class TestLRUBackend(MemcacheTest):
+    def test_evicts_least_recently_used(self):
+        backend = memcache.LRUBackend(max_entries=2)
+        backend.set('scope', 'a', 1)
+        backend.set('scope', 'b', 2)
+
+        # Using 'a' makes 'b' the least recently used.
+        eq_(backend.get('scope', 'a'), 1)
+        backend.set('scope', 'c', 3)
+
+        eq_(backend.get('scope', 'a'), 1)
+        eq_(backend.get('scope', 'c'), 3)
+        self.assertRaises(KeyError, backend.get, 'scope', 'b')
+
+    def test_limit_is_per_scope(self):
+        backend = memcache.LRUBackend(max_entries=1)
+        backend.set('scope1', 'a', 1)
+        backend.set('scope2', 'a', 2)
+
+        eq_(backend.get('scope1', 'a'), 1)
+        eq_(backend.get('scope2', 'a'), 2)
+
+    @raises(KeyError)
+    def test_ttl(self):
+        backend = memcache.LRUBackend(ttl=10)
+        backend.set('scope', 'a', 1)
+        eq_(backend.get('scope', 'a'), 1)
+
+        backend._cache['scope']['a'] = (time.time() - 1, 1)
+        backend.get('scope', 'a')
+
+
+class TestConfigure(MemcacheTest):
+    def test_lru(self):
+        memcache.configure({'use_memcache': True,
+                            'memcache_backend': 'lru',
+                            'memcache_max_entries': 5,
+                            'memcache_ttl': 60})
+        eq_(memcache.usecache, True)
+        backend = memcache.get_backend()
+        assert isinstance(backend, memcache.LRUBackend)
+        eq_(backend.max_entries, 5)
+        eq_(backend.ttl, 60)
+
+    def test_default(self):
+        memcache.configure({})
+        eq_(memcache.usecache, False)
+        assert isinstance(memcache.get_backend(), memcache.DictBackend)
+
+
+class TestMemcacheDecorator(MemcacheTest):
+    def test_file_args(self):
+        memcache.usecache = True
+        memcache.set_backend(memcache.DictBackend())
+
+        @memcache.memcache_decorator('test', file_args=(0,))
+        def read(fn):
+            with open(fn) as fp:
+                return fp.read()
+
+        fn = self.create_file('test.txt', 'abc')
+        eq_(read(fn), 'abc')
+
+        # Changing the file throws out the cached value.
+        with open(fn, 'w') as fp:
+            fp.write('abcdef')
+        eq_(read(fn), 'abcdef')
+
+        # If the file didn't change, we get the cached value.
+        os.utime(fn, (1000000000, 1000000000))
+        eq_(read(fn), 'abcdef')
+        with open(fn, 'w') as fp:
+            fp.write('ghijkl')
+        os.utime(fn, (1000000000, 1000000000))
+        eq_(read(fn), 'abcdef')
+
+
+class TestSQLiteBackend(MemcacheTest):
+    def setUp(self):
+        MemcacheTest.setUp(self)
+        self.dbfile = os.path.join(self.blogdir, 'cache.db')
+
+    def test_shared(self):
+        backend1 = memcache.SQLiteBackend(self.dbfile)
+        backend2 = memcache.SQLiteBackend(self.dbfile)
+
+        backend1.set('scope', ('a', 1), {'title': u'Title'})
+        eq_(backend2.get('scope', ('a', 1)), {'title': u'Title'})
+        self.assertRaises(KeyError, backend2.get, 'scope', ('a', 2))
+
+        backend2.clear('scope')
+        self.assertRaises(KeyError, backend1.get, 'scope', ('a', 1))
+
+    def test_unpicklable(self):
+        backend1 = memcache.SQLiteBackend(self.dbfile)
+        backend2 = memcache.SQLiteBackend(self.dbfile)
+
+        # Things that can't be pickled stay in the process.
+        value = lambda: 1
+        backend1.set('scope', 'a', value)
+        eq_(backend1.get('scope', 'a'), value)
+        self.assertRaises(KeyError, backend2.get, 'scope', 'a')
+
+    def test_corrupt_row(self):
+        backend = memcache.SQLiteBackend(self.dbfile)
+        backend.set('scope', 'a', u'value')
+
+        conn = backend.get_connection()
+        with conn:
+            conn.execute('UPDATE cache SET value=?',
+                         (memcache.sqlite3.Binary('\x80\x02truncated'),))
+
+        self.assertRaises(KeyError, backend.get, 'scope', 'a')
+        eq_(conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0], 0)
+
+    def test_max_entries(self):
+        backend = memcache.SQLiteBackend(self.dbfile, max_entries=2)
+        for i in range(4):
+            backend.set('scope', i, i)
+            backend.set('scope2', i, i)
+
+        self.assertRaises(KeyError, backend.get, 'scope', 0)
+        self.assertRaises(KeyError, backend.get, 'scope', 1)
+        eq_(backend.get('scope', 3), 3)
+        eq_(backend.get('scope2', 3), 3)
+
+    def test_configure(self):
+        memcache.configure({'use_memcache': True,
+                            'memcache_backend': 'sqlite',
+                            'memcache_sqlite_filename': self.dbfile})
+        assert isinstance(memcache.get_backend(), memcache.SQLiteBackend)
+
+    def test_local_scopes(self):
+        backend1 = memcache.SQLiteBackend(self.dbfile)
+        backend2 = memcache.SQLiteBackend(self.dbfile)
+
+        memcache.memcache_decorator('test_local', shared=False)
+        backend1.set('test_local', 'a', 1)
+        eq_(backend1.get('test_local', 'a'), 1)
+        self.assertRaises(KeyError, backend2.get, 'test_local', 'a')
+
+
+class TestDiskBackend(MemcacheTest):
+    def setUp(self):
+        MemcacheTest.setUp(self)
+        self.cachedir = os.path.join(self.blogdir, 'cache')
+
+    def test_shared(self):
+        backend1 = memcache.DiskBackend(self.cachedir)
+        backend2 = memcache.DiskBackend(self.cachedir)
+
+        backend1.set('scope', ('a', 1), u'value')
+        eq_(backend2.get('scope', ('a', 1)), u'value')
+        self.assertRaises(KeyError, backend2.get, 'scope', ('a', 2))
+
+        backend2.clear('scope')
+        self.assertRaises(KeyError, backend1.get, 'scope', ('a', 1))
+
+    def test_max_entries(self):
+        backend = memcache.DiskBackend(self.cachedir, max_entries=2)
+        backend.set('scope', 0, 0)
+        backend.set('scope', 1, 1)
+        os.utime(backend.get_path('scope', 0), (1000000000, 1000000000))
+        os.utime(backend.get_path('scope', 1), (1000000100, 1000000100))
+        backend.set('scope', 2, 2)
+
+        self.assertRaises(KeyError, backend.get, 'scope', 0)
+        eq_(backend.get('scope', 1), 1)
+        eq_(backend.get('scope', 2), 2)
+
+    def test_prunes_periodically(self):
+        backend = memcache.DiskBackend(self.cachedir, max_entries=20)
+        scopedir = os.path.join(self.cachedir, 'scope')
+        for i in range(21):
+            backend.set('scope', i, i)
+
+        # The scope only gets pruned every max_entries / 10 writes.
+        eq_(len(os.listdir(scopedir)), 21)
+        backend.set('scope', 21, 21)
+        eq_(len(os.listdir(scopedir)), 20)
@@ -0,0 +1,64 @@
+import os
+
+from nose.tools import eq_
+
+from douglas import pagecache
+from douglas.tests import UnitTestBase
+
+
+class TestPageCache(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self.cfg = self.build_request({
+            'themedir': self.themedir,
+            'pagecache_backend': 'memory',
+            'pagecache_check_interval': 0
+        }).get_configuration()
+        self.env = {'PATH_INFO': '/index.html', 'QUERY_STRING': '',
+                    'REQUEST_METHOD': 'GET'}
+
+    def test_cache(self):
+        self.create_file('entry1.txt', 'Title\nbody\n')
+
+        cache = pagecache.build_pagecache(self.cfg)
+        eq_(cache.get(self.env), None)
+
+        cache.set(self.env, '200 OK', [('ETag', '"a"')], 'body')
+        eq_(cache.get(self.env), ('200 OK', [('ETag', '"a"')], 'body'))
+
+        # Other urls aren't cached.
+        eq_(cache.get(dict(self.env, QUERY_STRING='theme=rss')), None)
+
+    def test_only_successful_gets(self):
+        cache = pagecache.build_pagecache(self.cfg)
+
+        cache.set(self.env, '404 Not Found', [], 'body')
+        eq_(cache.get(self.env), None)
+
+        env = dict(self.env, REQUEST_METHOD='POST')
+        cache.set(env, '200 OK', [], 'body')
+        eq_(cache.get(env), None)
+
+    def test_invalidation(self):
+        fn = self.create_file('entry1.txt', 'Title\nbody\n')
+
+        cache = pagecache.build_pagecache(self.cfg)
+        cache.set(self.env, '200 OK', [], 'body')
+
+        # Changing an entry throws out cached pages.
+        with open(fn, 'a') as fp:
+            fp.write('more body\n')
+        os.utime(fn, (1000000000, 1000000000))
+        eq_(cache.get(self.env), None)
+
+        cache.set(self.env, '200 OK', [], 'body')
+        eq_(cache.get(self.env), ('200 OK', [], 'body'))
+
+        # Changing a theme throws out cached pages.
+        with open(os.path.join(self.themedir, 'entry.html'), 'w') as fp:
+            fp.write('{{ title }}')
+        eq_(cache.get(self.env), None)
+
+    def test_off(self):
+        self.cfg['pagecache_backend'] = ''
+        eq_(pagecache.build_pagecache(self.cfg), None)
@@ -27,3 +27,24 @@ class PaginateTest(PluginTest):
         eq_(pager.has_previous(), False)
         pager.as_list()
         pager.as_span()
+
+    def test_filelist_compiling_other_pages(self):
+        # When the first page gets compiled, it passes the entry list
+        # and its data to the rest of the pages.
+        entry_list = self.generate_entry_list(self.request, 25)
+        data = self.request.get_data()
+        data['COMPILING'] = 1
+        data['paginate_page'] = 3
+        data['paginate_entry_list'] = entry_list
+        data['paginate_data'] = {'bl_type': 'entry_list', 'pi_tag': 'foo'}
+        self.request.get_http()['REQUEST_URI'] = '/index_page3.html'
+
+        new_entry_list = paginate.cb_filelist({'request': self.request})
+
+        eq_(new_entry_list, entry_list[20:])
+        eq_(data['pi_tag'], 'foo')
+        eq_(data['pager'].number, 3)
+        eq_(data['pager'].has_next(), False)
+
+    def test_filelist_not_compiling(self):
+        eq_(paginate.cb_filelist({'request': self.request}), None)
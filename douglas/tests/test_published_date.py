@@ -0,0 +1,74 @@
+import os
+import time
+
+from nose.tools import eq_
+
+from douglas import entryindex
+from douglas.plugins import published_date
+from douglas.tests import PluginTest
+
+
+class Test_published_date(PluginTest):
+    def setUp(self):
+        PluginTest.setUp(self, published_date)
+
+    def tearDown(self):
+        PluginTest.tearDown(self)
+
+    def generate_entry(self, filename, published=None, body='<p>body</p>'):
+        filename = os.path.join(self.datadir, filename)
+        with open(filename, 'w') as fp:
+            fp.write('Title\n')
+            if published:
+                fp.write('#published {0}\n'.format(published))
+            fp.write(body + '\n')
+        return filename
+
+    def test_get_date(self):
+        fn = self.generate_entry('test1.txt', published='2008-01-01 12:20:22')
+        eq_(published_date.get_date(fn),
+            tuple(time.strptime('2008-01-01 12:20:22', '%Y-%m-%d %H:%M:%S')))
+
+        # #published after the metadata lines doesn't count.
+        fn = self.generate_entry('test2.txt',
+                                 body='<p>body</p>\n#published 2008-01-01')
+        eq_(published_date.get_date(fn), None)
+
+    def test_filestat_many(self):
+        fn1 = self.generate_entry('test1.txt', published='2008-01-01 12:20:22')
+        fn2 = self.generate_entry('test2.txt')
+
+        args = published_date.cb_filestat_many({
+            'config': self.config,
+            'filenames': [fn1, fn2],
+            'mtimes': {}
+        })
+        eq_(args['mtimes'], {
+            fn1: time.mktime(time.strptime('2008-01-01 12:20:22',
+                                           '%Y-%m-%d %H:%M:%S'))
+        })
+
+        # It gives the same answer as cb_filestat.
+        args = published_date.cb_filestat({
+            'config': self.config,
+            'filename': fn1,
+            'mtime': os.stat(fn1)
+        })
+        eq_(args['mtime'][8], time.mktime(
+            time.strptime('2008-01-01 12:20:22', '%Y-%m-%d %H:%M:%S')))
+
+    def test_filestat_many_uses_index(self):
+        fn = self.generate_entry('test1.txt', published='2008-01-01 12:20:22')
+
+        index = entryindex.get_index(self.config)
+        index.get_records([fn])
+        index.entries[fn]['published'] = 1000000000
+
+        # Entries that haven't changed since they were indexed come
+        # from the index.
+        args = published_date.cb_filestat_many({
+            'config': self.config,
+            'filenames': [fn],
+            'mtimes': {}
+        })
+        eq_(args['mtimes'], {fn: 1000000000})
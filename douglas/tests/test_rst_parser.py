@@ -1,3 +1,4 @@
+import os
 from textwrap import dedent
 
 from nose.tools import eq_
@@ -44,3 +45,24 @@ class TagsTest(PluginTest):
              'summary': '<p>first part</p>\n',
              'body': '<p>first part</p>\n<p>second part</p>\n',
              'meta1': 'val1'})
+
+    def test_cache(self):
+        self.config['reST_cache_dir'] = os.path.join(self.blogdir, 'rstcache')
+        fn = self.create_file('entries/blogpost.rst', dedent("""\
+        The Title
+        **so amazing**
+        """))
+        expected = rst_parser.parse_rst_file(fn, self.request)
+
+        # Rendered bodies come out of the cache rather than docutils.
+        parse = rst_parser._parse
+        rst_parser._parse = lambda *args: 'not rendered'
+        try:
+            eq_(rst_parser.parse_rst_file(fn, self.request), expected)
+
+            # Changing the settings changes the cache key.
+            self.config['reST_initial_header_level'] = 2
+            eq_(rst_parser.parse_rst_file(fn, self.request)['body'],
+                'not rendered')
+        finally:
+            rst_parser._parse = parse
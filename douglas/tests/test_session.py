@@ -0,0 +1,103 @@
+from nose.tools import eq_
+
+from douglas import entryindex, incremental, plugin_utils, session, tools
+from douglas.tests import UnitTestBase
+
+
+class SessionTest(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self.cfg = self.build_request(
+            {'entryindex_check_interval': 0}).get_configuration()
+        self.calls = []
+        session.clear()
+
+    def tearDown(self):
+        session.clear()
+        UnitTestBase.tearDown(self)
+
+    def count_entries(self, cfg):
+        self.calls.append(1)
+        return len(tools.get_entries(cfg, cfg['datadir']))
+
+    def test_cached_until_entries_change(self):
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Entry one', {}, 'body\n')
+
+        eq_(session.get_aggregate(self.cfg, 'count', self.count_entries), 1)
+        eq_(session.get_aggregate(self.cfg, 'count', self.count_entries), 1)
+        eq_(len(self.calls), 1)
+
+        tools.create_entry(self.datadir, 'cat', 'entry2.txt', 1000000000,
+                           'Entry two', {}, 'body\n')
+        entryindex.get_index(self.cfg).expire()
+        eq_(session.get_aggregate(self.cfg, 'count', self.count_entries), 2)
+        eq_(len(self.calls), 2)
+
+    def test_cached_until_files_change(self):
+        fn = self.create_file('extra.txt', 'abc')
+
+        session.get_aggregate(self.cfg, 'count', self.count_entries,
+                              files=(fn,))
+        session.get_aggregate(self.cfg, 'count', self.count_entries,
+                              files=(fn,))
+        eq_(len(self.calls), 1)
+
+        with open(fn, 'w') as fp:
+            fp.write('abcdef')
+        session.get_aggregate(self.cfg, 'count', self.count_entries,
+                              files=(fn,))
+        eq_(len(self.calls), 2)
+
+    def test_cached_until_filtered_entries_change(self):
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Entry one', {}, 'body\n')
+        tools.create_entry(self.datadir, '', 'entry2.txt', 1000000000,
+                           'Entry two', {}, 'body\n')
+
+        # Like ignore_future, this filters on something other than the
+        # entries.
+        hidden = set(['entry2.txt'])
+
+        def cb_entries(args):
+            args['entry_files'] = [
+                fn for fn in args['entry_files']
+                if fn.split('/')[-1] not in hidden]
+            return args
+
+        callbacks = plugin_utils.callbacks.get('entries')
+        plugin_utils.callbacks['entries'] = [cb_entries]
+        try:
+            eq_(session.get_aggregate(self.cfg, 'count', self.count_entries),
+                1)
+            eq_(session.get_aggregate(self.cfg, 'count', self.count_entries),
+                1)
+            eq_(len(self.calls), 1)
+
+            hidden.clear()
+            eq_(session.get_aggregate(self.cfg, 'count', self.count_entries),
+                2)
+            eq_(len(self.calls), 2)
+        finally:
+            if callbacks is None:
+                del plugin_utils.callbacks['entries']
+            else:
+                plugin_utils.callbacks['entries'] = callbacks
+
+    def test_records_dependencies(self):
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Entry one', {}, 'body\n')
+
+        incremental.start_recording()
+        session.get_aggregate(self.cfg, 'count', self.count_entries)
+        deps1 = incremental.stop_recording()
+
+        # The second url gets the same dependencies even though the
+        # aggregate didn't get computed again.
+        incremental.start_recording()
+        session.get_aggregate(self.cfg, 'count', self.count_entries)
+        deps2 = incremental.stop_recording()
+
+        eq_(len(self.calls), 1)
+        assert deps1.listings
+        eq_(deps1.snapshot(), deps2.snapshot())
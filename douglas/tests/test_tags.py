@@ -1,7 +1,9 @@
+import cPickle as pickle
 import os
 
 from nose.tools import eq_
 
+from douglas import entryindex
 from douglas.plugins import tags
 from douglas.tests import PluginTest
 
@@ -71,3 +73,132 @@ class TagsTest(PluginTest):
             '<a class="tag smallestTag" '
             'href="http://example.com/tag/tag3.html">tag3</a>\n'
             '</div>')
+
+
+class TagsIndexTest(PluginTest):
+    def setUp(self):
+        PluginTest.setUp(self, tags)
+        self.tagsfile = os.path.join(self.blogdir, 'tags.index')
+        self.cfg = self.build_request(
+            {'tags_filename': self.tagsfile,
+             'entryindex_check_interval': 0}).get_configuration()
+
+    def create_entry(self, file_path, mtime, tagsline):
+        fn = self.create_file(
+            file_path, 'Title\n#tags {0}\n<p>body</p>\n'.format(tagsline))
+        os.utime(fn, (mtime, mtime))
+        return fn
+
+    def test_update(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'a, b')
+        fn2 = self.create_entry('cat/entry2.txt', 1000000000, 'b')
+
+        eq_(tags.is_stale(self.cfg), True)
+        eq_(tags.update_tagsindex(self.cfg), True)
+        eq_(tags.loadfile(self.tagsfile), {'a': [fn1], 'b': [fn2, fn1]})
+        eq_(tags.is_stale(self.cfg), False)
+
+        # Nothing changed, so nothing to do.
+        eq_(tags.update_tagsindex(self.cfg), False)
+
+        # Change one, add one.
+        self.create_entry('entry1.txt', 1000000100, 'c')
+        fn3 = self.create_entry('entry3.txt', 1000000000, 'a')
+        entryindex.get_index(self.cfg).expire()
+        eq_(tags.is_stale(self.cfg), True)
+        eq_(tags.update_tagsindex(self.cfg), True)
+        eq_(tags.loadfile(self.tagsfile),
+            {'a': [fn3], 'b': [fn2], 'c': [fn1]})
+
+        # Remove one.
+        os.remove(fn2)
+        entryindex.get_index(self.cfg).expire()
+        eq_(tags.update_tagsindex(self.cfg), True)
+        eq_(tags.loadfile(self.tagsfile), {'a': [fn3], 'c': [fn1]})
+
+    def test_old_tags_file(self):
+        # Tags files from older versions are pickled dicts.  They get
+        # treated as empty and replaced.
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'a')
+        with open(self.tagsfile, 'w') as fp:
+            pickle.dump({'old': ['entry0.txt']}, fp)
+        eq_(tags.loadfile(self.tagsfile), {})
+
+        eq_(tags.update_tagsindex(self.cfg), True)
+        eq_(tags.loadfile(self.tagsfile), {'a': [fn1]})
+
+    def test_auto_update(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'a')
+
+        tags.auto_update(self.cfg)
+        eq_(os.path.exists(self.tagsfile), False)
+
+        self.cfg['tags_auto_update'] = True
+        tags.auto_update(self.cfg)
+        eq_(tags.loadfile(self.tagsfile), {'a': [fn1]})
+
+    def test_postings_and_counts(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'a, b')
+        fn2 = self.create_entry('entry2.txt', 1000000200, 'a')
+        fn3 = self.create_entry('entry3.txt', 1000000100, 'a')
+        tags.update_tagsindex(self.cfg)
+
+        tagsindex = tags.get_tagsindex(self.cfg)
+        eq_(tagsindex.get_counts(), {'a': 3, 'b': 1})
+
+        # Postings are newest first.
+        eq_(tagsindex.get_postings('a'),
+            [(fn2, 1000000200), (fn3, 1000000100), (fn1, 1000000000)])
+        eq_(tagsindex.get_postings('a', limit=2),
+            [(fn2, 1000000200), (fn3, 1000000100)])
+        eq_(tagsindex.get_postings('c'), [])
+
+        tagsdata = tags.TagsData(tagsindex)
+        eq_(tags.get_counts(tagsdata), {'a': 3, 'b': 1})
+
+        # Checking for a tag doesn't read its postings.
+        eq_('a' in tagsdata, True)
+        eq_('c' in tagsdata, False)
+        eq_(tagsdata._postings, {})
+
+        eq_(tagsdata['a'], [fn2, fn3, fn1])
+
+    def test_merge_postings(self):
+        postings_a = [('e3', 300), ('e2', 200), ('e1', 100)]
+        postings_b = [('e4', 400), ('e3', 300), ('e1', 100)]
+
+        eq_(list(tags.merge_postings([postings_a, postings_b], True)),
+            [('e3', 300), ('e1', 100)])
+        eq_(list(tags.merge_postings([postings_a, postings_b], False)),
+            [('e4', 400), ('e3', 300), ('e2', 200), ('e1', 100)])
+        eq_(list(tags.merge_postings([postings_a, []], True)), [])
+
+    def test_query_postings(self):
+        fn1 = self.create_entry('entry1.txt', 1000000000, 'a, b')
+        fn2 = self.create_entry('entry2.txt', 1000000200, 'a')
+        fn3 = self.create_entry('entry3.txt', 1000000100, 'b, c')
+        tags.update_tagsindex(self.cfg)
+
+        tagsindex = tags.get_tagsindex(self.cfg)
+        tagsdata = tags.TagsData(tagsindex)
+
+        def query(q, limit=None):
+            postings = tags.get_query_postings(tagsindex, tagsdata, q, limit)
+            if postings is None:
+                return None
+            return [fn for fn, published in postings]
+
+        eq_(query('a'), [fn2, fn1])
+        eq_(query('a+b'), [fn1])
+        eq_(query('a,c'), [fn2, fn3, fn1])
+        eq_(query('a,c', limit=2), [fn2, fn3])
+
+        # All the tags have to exist.
+        eq_(query('x'), None)
+        eq_(query('a+x'), None)
+        eq_(query('a,x'), None)
+
+        # Mixing + and , isn't supported.
+        eq_(tags.parse_tag_query('a+b,c'), ([], False))
+        eq_(query('a+b,c'), None)
+        eq_(query('a,b+c'), None)
@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 import os
 import os.path
+import re
 import string
 from textwrap import dedent
 
 from nose.tools import eq_
 
-from douglas import app, tools
+from douglas import app, memcache, tools
 from douglas.tests import UnitTestBase
 
 
@@ -46,6 +47,23 @@ class Testparse_entry_file(UnitTestBase):
              'meta1': '1', 'meta2': 'val2', 'meta3': 'val3', 'meta4': '1'})
 
 
+class Testread_entry_header(UnitTestBase):
+    def test_empty(self):
+        fn = self.create_file('test1.txt', '')
+        eq_(tools.read_entry_header(fn), {'title': ''})
+
+    def test_metadata(self):
+        fn = self.create_file('test1.txt', dedent("""\
+        Only a title
+        #meta1
+        #meta2 val2
+        Body
+        #notmeta val
+        """))
+        eq_(tools.read_entry_header(fn),
+            {'title': 'Only a title', 'meta1': '1', 'meta2': 'val2'})
+
+
 class Testescape_text(UnitTestBase):
     """tools.escape_text"""
     def test_none_to_none(self):
@@ -218,3 +236,83 @@ class Testurl_rewrite(UnitTestBase):
             '/',
             'http://localhost:8000/'),
             '<img src="http://localhost:8000/foo.gif">')
+
+
+class Testwalk_entries(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        self._usecache = memcache.usecache
+        self._backend = memcache.get_backend()
+        self.cfg = {'extensions': {'txt': None},
+                    'ignore_directories': []}
+
+    def tearDown(self):
+        memcache.usecache = self._usecache
+        memcache.set_backend(self._backend)
+        UnitTestBase.tearDown(self)
+
+    def test_sees_new_entries_with_memcache(self):
+        memcache.usecache = True
+        memcache.set_backend(memcache.LRUBackend())
+
+        fn1 = self.create_file('a.txt', 'a')
+        eq_(tools.walk_entries(self.cfg, self.datadir), [fn1])
+
+        fn2 = self.create_file('b.txt', 'b')
+        eq_(sorted(tools.walk_entries(self.cfg, self.datadir)), [fn1, fn2])
+
+
+class Testwalk(UnitTestBase):
+    def setUp(self):
+        UnitTestBase.setUp(self)
+        for mem in ('a.txt', 'b.html', 'cat1/b.txt', 'cat1/sub/c.txt',
+                    'CVS/d.txt', '.hidden/e.txt'):
+            self.create_file(mem, 'lorem ipsum')
+
+        # Symlinked directories get listed, but not walked.
+        elsewhere = os.path.join(self.blogdir, 'elsewhere')
+        os.makedirs(elsewhere)
+        with open(os.path.join(elsewhere, 'f.txt'), 'w') as fp:
+            fp.write('lorem ipsum')
+        os.symlink(elsewhere, os.path.join(self.datadir, 'link'))
+
+    def walk(self, cfg=None, **kwargs):
+        request = self.build_request(cfg)
+        files = tools.walk(request, self.datadir, **kwargs)
+        return sorted(fn[len(self.datadir) + 1:] for fn in files)
+
+    def test_walk(self):
+        eq_(self.walk(),
+            ['CVS/d.txt', 'a.txt', 'cat1/b.txt', 'cat1/sub/c.txt'])
+
+    def test_recurse(self):
+        eq_(self.walk(recurse=1), ['a.txt'])
+        eq_(self.walk(recurse=2), ['CVS/d.txt', 'a.txt', 'cat1/b.txt'])
+
+    def test_ignore_directories(self):
+        eq_(self.walk({'ignore_directories': ['CVS', 'cat1/sub']}),
+            ['a.txt', 'cat1/b.txt'])
+
+    def test_return_folders(self):
+        pattern = re.compile('.*')
+        eq_(self.walk(pattern=pattern, return_folders=1),
+            ['.hidden', 'CVS', 'cat1', 'cat1/sub', 'link'])
+        eq_(self.walk({'ignore_directories': ['CVS']},
+                      pattern=pattern, return_folders=1),
+            ['.hidden', 'cat1', 'cat1/sub', 'link'])
+
+    def test_missing_root(self):
+        request = self.build_request()
+        eq_(tools.walk(request, os.path.join(self.datadir, 'missing')), [])
+
+
+class Testwalk_lstat(Testwalk):
+    """tools.walk without scandir"""
+    def setUp(self):
+        Testwalk.setUp(self)
+        self._scandir = tools.scandir
+        tools.scandir = None
+
+    def tearDown(self):
+        tools.scandir = self._scandir
+        Testwalk.tearDown(self)
@@ -1,5 +1,10 @@
+import os
+
 from nose.tools import eq_
 
+from douglas import entryindex
+from douglas import memcache
+from douglas import tools
 from douglas.tests import PluginTest
 from douglas.plugins import yeararchives
 
@@ -23,3 +28,81 @@ class Test_yeararchives(PluginTest):
 
         for data, expected in testdata:
             eq_(yeararchives.parse_path_info(data), expected)
+
+    def test_get_items(self):
+        cfg = self.build_request().get_configuration()
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Entry one', {}, '<p>body</p>\n')
+        tools.create_entry(self.datadir, 'cat/sub', 'entry2.txt', 1000000000,
+                           'Entry two', {}, '<p>body</p>\n')
+        fn1 = os.path.join(self.datadir, 'entry1.txt')
+        fn2 = os.path.join(self.datadir, 'cat', 'sub', 'entry2.txt')
+
+        entries = [('2001', '2001-09', '2001-09-09', fn2),
+                   ('2001', '2001-09', '2001-09-09', fn1)]
+        eq_(yeararchives.get_items(cfg, entries),
+            [('2001-09', '2001-09-09', 'cat/sub', 'cat/sub/entry2',
+              'Entry two'),
+             ('2001-09', '2001-09-09', '', 'entry1', 'Entry one')])
+
+    def test_build_tables(self):
+        items = [('2001-10', '2001-10-01', '', 'entry3', 'Entry three'),
+                 ('2001-09', '2001-09-09', 'cat', 'cat/entry2', 'Entry two'),
+                 ('2001-09', '2001-09-09', '', 'entry1', 'Entry one')]
+        tables = yeararchives.build_tables(
+            '2001', 'http://example.com', 'html', items)
+
+        eq_([month for month, table in tables], ['2001-10', '2001-09'])
+        eq_(tables[1][1],
+            '<table><tr>\n<td valign="top" align="left">2001-09-09</td>\n'
+            '<td>(cat) <a href="http://example.com/cat/entry2.html">'
+            'Entry two</a><br>\n'
+            '() <a href="http://example.com/entry1.html">Entry one</a><br>'
+            '</td></tr>\n</table>')
+
+        eq_(yeararchives.build_tables(
+            '2001', 'http://example.com', 'html', []), [])
+
+    def test_build_past_tables(self):
+        cfg = self.build_request().get_configuration()
+        tools.create_entry(self.datadir, '', 'entry1.txt', 1000000000,
+                           'Entry one', {}, '<p>body</p>\n')
+        fn1 = os.path.join(self.datadir, 'entry1.txt')
+        entries = [('2001', '2001-09', '2001-09-09', fn1)]
+        entryindex.get_index(cfg).get_records([fn1])
+
+        calls = []
+        get_items = yeararchives.get_items
+
+        def counting_get_items(cfg, entries):
+            calls.append(entries)
+            return get_items(cfg, entries)
+
+        usecache = memcache.usecache
+        backend = memcache.get_backend()
+        memcache.usecache = True
+        memcache.set_backend(memcache.DictBackend())
+        yeararchives.get_items = counting_get_items
+        try:
+            tables = yeararchives.build_past_tables(
+                cfg, '2001', 'http://example.com', 'html', entries)
+            assert 'Entry one' in tables[0][1]
+            eq_(len(calls), 1)
+
+            # The items only get figured out again when an entry
+            # changes.
+            eq_(yeararchives.build_past_tables(
+                cfg, '2001', 'http://example.com', 'html', entries), tables)
+            eq_(len(calls), 1)
+
+            tools.create_entry(self.datadir, '', 'entry1.txt', 1000000100,
+                               'Entry uno', {}, '<p>body</p>\n')
+            entryindex.get_index(cfg).get_records([fn1])
+            tables = yeararchives.build_past_tables(
+                cfg, '2001', 'http://example.com', 'html', entries)
+            assert 'Entry uno' in tables[0][1]
+            eq_(len(calls), 2)
+        finally:
+            yeararchives.get_items = get_items
+            memcache.usecache = usecache
+            memcache.set_backend(backend)
@@ -12,6 +12,16 @@ import time
 import urllib
 from urlparse import urlparse, urlsplit, urlunsplit
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+from douglas import incremental
+from douglas import memcache
 from douglas import plugin_utils
 from douglas.memcache import get_cache, memcache_decorator, set_cache
 
@@ -119,25 +129,66 @@ def convert_configini_values(configini):
     return config
 
 
-@memcache_decorator('parse_entry')
+def parse_entry_header(lines):
+    """Parses the title and ``#key value`` metadata lines at the top of
+    a Douglas-structured entry.
+
+    :arg lines: list of lines of the entry
+
+    :returns: ``(entry_data, num_lines)`` tuple where ``entry_data`` is
+        a dict of the title and metadata and ``num_lines`` is the
+        number of lines the header takes up
+    """
+    entry_data = {}
+    if not lines:
+        return entry_data, 0
+
+    entry_data['title'] = lines[0].strip()
+
+    i = 1
+    while i < len(lines) and lines[i].startswith('#'):
+        match = re.match(r'^#([^\s]+)( [^$]+)?$', lines[i])
+        key, val = match.groups()
+        entry_data[key.strip()] = val.strip() if (val and val.strip()) else '1'
+        i += 1
+
+    return entry_data, i
+
+
+@memcache_decorator('parse_entry_header', file_args=(0,))
+def read_entry_header(filename, encoding='utf-8'):
+    """Reads the title and ``#key value`` metadata lines at the top of
+    a Douglas-structured entry file without reading the body.
+
+    :arg filename: the entry file
+    :arg encoding: the encoding of the file
+
+    :returns: dict of the title and metadata
+    """
+    lines = []
+    with codecs.open(filename, 'r', encoding) as fp:
+        for line in fp:
+            if lines and not line.startswith('#'):
+                break
+            lines.append(line)
+
+    if not lines:
+        return {'title': ''}
+
+    return parse_entry_header(lines)[0]
+
+
+@memcache_decorator('parse_entry', file_args=(0,))
 def parse_entry_file(filename, encoding='utf-8'):
     """Parses a a Douglas-structured entry file"""
-    entry_data = {}
     with codecs.open(filename, 'r', encoding) as fp:
         lines = fp.readlines()
 
     if not lines:
         return {'title': '', 'body': ''}
 
-    entry_data['title'] = lines.pop(0).strip()
-
-    while lines and lines[0].startswith('#'):
-        meta = lines.pop(0)
-        match = re.match(r'^#([^\s]+)( [^$]+)?$', meta)
-        key, val = match.groups()
-        entry_data[key.strip()] = val.strip() if (val and val.strip()) else '1'
-
-    entry_data['body'] = ''.join(lines)
+    entry_data, num_lines = parse_entry_header(lines)
+    entry_data['body'] = ''.join(lines[num_lines:])
     return entry_data
 
 
@@ -202,25 +253,28 @@ def get_entries(cfg, root, recurse=0):
 
     Allows plugins to remove and add items.
 
+    If the root is in the datadir, then the list comes from the entry
+    index which gets updated first.
+
     FIXME - fix docs
 
     """
     # the root must be a directory
     if not os.path.isdir(root):
+        incremental.record_listing(cfg, root, recurse, [])
         return []
 
-    ext = cfg['extensions']
-    pattern = re.compile(r'.*\.(' + '|'.join(ext.keys()) + r')$')
+    from douglas import entryindex
 
-    ignore = cfg['ignore_directories']
-
-    if ignore:
-        ignore = [re.escape(i) for i in ignore]
-        ignorere = re.compile(r'.*?(' + '|'.join(ignore) + r')$')
+    datadir = os.path.normpath(cfg['datadir'])
+    normroot = os.path.normpath(root)
+    if normroot == datadir or normroot.startswith(datadir + os.sep):
+        index = entryindex.get_index(cfg)
+        index.update()
+        entry_files = index.get_entries(normroot, recurse)
     else:
-        ignorere = None
+        entry_files = walk_entries(cfg, root, recurse)
 
-    entry_files = _walk_internal(root, recurse, pattern, ignorere, 0)
     argdict = {
         'config': cfg,
         'entry_files': entry_files
@@ -233,9 +287,76 @@ def get_entries(cfg, root, recurse=0):
         mappingfunc=lambda x, y: y,
         defaultfunc=lambda x: x)
 
+    incremental.record_listing(cfg, root, recurse, argdict['entry_files'])
+    return argdict['entry_files']
+
+
+def get_date_entries(cfg, year, month='', day='', recurse=0):
+    """
+    Returns the list of entry files in the datadir that were published
+    in the given year, month or day.
+
+    This comes from the date buckets in the entry index, so it only
+    looks at the entries in that range.  Like ``get_entries``, this
+    runs the ``entries`` callback on the list.
+
+    :arg cfg: config dict
+    :arg year: the year (e.g. ``'2012'``)
+    :arg month: the month (e.g. ``'05'``) or ``''`` for the whole year
+    :arg day: the day (e.g. ``'09'``) or ``''`` for the whole month
+    :arg recurse: the depth of recursion; 0 goes all the way down
+
+    :returns: sorted list of entry filenames
+    """
+    from douglas import entryindex
+
+    index = entryindex.get_index(cfg)
+    index.update()
+    entry_files = index.get_date_entries(year, month, day, recurse)
+
+    argdict = {
+        'config': cfg,
+        'entry_files': entry_files
+    }
+
+    argdict = run_callback(
+        'entries',
+        argdict,
+        mappingfunc=lambda x, y: y,
+        defaultfunc=lambda x: x)
+
+    incremental.record_listing(cfg, ('date', year, month, day), recurse,
+                               argdict['entry_files'])
     return argdict['entry_files']
 
 
+def walk_entries(cfg, root, recurse=0):
+    """Walks the root and returns a list of all the entry files in it
+    skipping ``ignore_directories``.
+
+    This doesn't run the ``entries`` callback. Most things should use
+    ``get_entries`` instead.
+
+    :arg cfg: config dict
+    :arg root: the directory to walk
+    :arg recurse: the depth of recursion; 0 goes all the way down
+
+    :returns: list of entry filenames
+    """
+    ext = cfg['extensions']
+    pattern = re.compile(r'.*\.(' + '|'.join(ext.keys()) + r')$')
+
+    ignore = cfg['ignore_directories']
+
+    if ignore:
+        ignore = [re.escape(i) for i in ignore]
+        ignorere = re.compile(r'.*?(' + '|'.join(ignore) + r')$')
+    else:
+        ignorere = None
+
+    return _walk_internal(root, recurse, pattern, ignorere, 0)
+
+
 def get_static_files(cfg):
     """
     Return a list of ``(root, file_path)`` tuples for all static
@@ -322,48 +443,96 @@ def walk(request, root='.', recurse=0, pattern='', return_folders=0):
     return _walk_internal(root, recurse, pattern, ignorere, return_folders)
 
 
-@memcache_decorator('walk')
+def _list_dir(path):
+    """Yields ``(name, is_dir, is_file, is_symlink)`` for each entry in
+    the directory.  ``is_dir`` and ``is_file`` follow symlinks.
+
+    This uses scandir which gets the file type from the directory
+    listing if it's available.  Otherwise it does one ``lstat`` per
+    entry and only follows symlinks when it has to.
+
+    :raises OSError: if the directory can't be listed
+    """
+    if scandir is not None:
+        for entry in scandir(path):
+            yield (entry.name, entry.is_dir(), entry.is_file(),
+                   entry.is_symlink())
+        return
+
+    lstat = os.lstat
+    S_ISLNK, S_ISDIR, S_ISREG = stat.S_ISLNK, stat.S_ISDIR, stat.S_ISREG
+    prefix = path + os.sep
+    for name in os.listdir(path):
+        try:
+            mode = lstat(prefix + name).st_mode
+        except OSError:
+            continue
+        is_link = S_ISLNK(mode)
+        if is_link:
+            try:
+                mode = os.stat(prefix + name).st_mode
+            except OSError:
+                mode = 0
+        yield (name, S_ISDIR(mode), S_ISREG(mode), is_link)
+
+
 def _walk_internal(root, recurse, pattern, ignorere, return_folders):
     """
     Note: This is an internal function--don't use it and don't expect
     it to stay the same between Douglas releases.
     """
-    # FIXME - we should either ditch this function and use os.walk or
-    # something similar, or optimize this version by removing the
-    # multiple stat calls that happen as a result of islink, isdir and
-    # isfile.
+    return list(_iter_walk(root, recurse, pattern, ignorere, return_folders))
 
-    # initialize
-    result = []
 
-    try:
-        names = os.listdir(root)
-    except OSError:
-        return []
+def _iter_walk(root, recurse, pattern, ignorere, return_folders):
+    """Generator that walks the tree in a single pass over each
+    directory.
 
-    # check each file
-    for name in names:
-        fullname = os.path.normpath(os.path.join(root, name))
+    Directories are visited depth-first in listing order with an
+    explicit stack, so results come out in the same order as a
+    recursive walk without the cost of nested generators.
+    """
+    def _open(path):
+        path = os.path.normpath(path)
+        if path == '.':
+            prefix = ''
+        elif path.endswith(os.sep):
+            prefix = path
+        else:
+            prefix = path + os.sep
+        return _list_dir(path), prefix
+
+    match = pattern.match
+    ignore = ignorere.match if ignorere else None
+
+    listing, prefix = _open(root)
+    stack = [(listing, prefix, recurse)]
+    while stack:
+        listing, prefix, recurse = stack[-1]
+        try:
+            name, is_dir, is_file, is_link = next(listing)
+        except (StopIteration, OSError):
+            # OSError means we couldn't list the directory.
+            stack.pop()
+            continue
+
+        fullname = prefix + name
 
         # grab if it matches our pattern and entry type
-        if pattern.match(name):
-            if ((os.path.isfile(fullname) and not return_folders) or
-                (return_folders and os.path.isdir(fullname) and
-                 (not ignorere or not ignorere.match(fullname)))):
-                result.append(fullname)
-
-        # recursively scan other folders, appending results
-        if (recurse == 0) or (recurse > 1):
-            if ((name[0] != "." and os.path.isdir(fullname)
-                 and not os.path.islink(fullname)
-                 and (not ignorere or not ignorere.match(fullname)))):
-                result = (
-                    result +
-                    _walk_internal(fullname,
-                                   (recurse > 1 and [recurse - 1] or [0])[0],
-                                   pattern, ignorere, return_folders))
-
-    return result
+        if match(name):
+            if return_folders:
+                if is_dir and not (ignore and ignore(fullname)):
+                    yield fullname
+            elif is_file:
+                yield fullname
+
+        # scan other folders
+        if ((is_dir and not is_link and name[0] != '.'
+             and (recurse == 0 or recurse > 1)
+             and not (ignore and ignore(fullname)))):
+            sublisting, subprefix = _open(fullname)
+            stack.append((sublisting, subprefix,
+                          recurse - 1 if recurse > 1 else 0))
 
 
 def filestat(config, filename):
@@ -373,11 +542,91 @@ def filestat(config, filename):
     This returns the mtime of the file (same as returned by
     ``time.localtime()``) -- tuple of 9 ints.
 
+    For entries in the datadir, this comes from the entry index.
+
     :param config: config
     :param filename: the file name of the file to stat
 
     :returns: the filestat (tuple of 9 ints) on the given file
 
+    """
+    from douglas import entryindex
+
+    if hasattr(config, 'get_configuration'):
+        config = config.get_configuration()
+
+    record = entryindex.get_index(config).get_record(filename)
+    if record is not None:
+        return time.localtime(record['published'])
+
+    return time.localtime(filestat_mtime(config, filename))
+
+
+def filestat_many(config, filenames, check=True):
+    """
+    Returns the filestat for a bunch of files.
+
+    This is like ``filestat``, but figures out all the mtimes in one
+    pass.  See ``get_mtimes``.
+
+    :param config: config or request
+    :param filenames: list of file names
+    :param check: whether to stat entries that are in the entry index
+        to see if they changed
+
+    :returns: dict of file name -> filestat (tuple of 9 ints)
+
+    """
+    mtimes = get_mtimes(config, filenames, check)
+    return dict((fn, time.localtime(mtime)) for fn, mtime in mtimes.items())
+
+
+def get_mtimes(config, filenames, check=True):
+    """
+    Returns the mtimes for a bunch of files in seconds since the epoch.
+
+    Entries in the datadir come from the entry index.  For everything
+    else, this runs the ``filestat_many`` callback and then the
+    ``filestat`` callback chain for files that didn't get handled.
+
+    :param config: config or request
+    :param filenames: list of file names
+    :param check: whether to stat entries that are in the entry index
+        to see if they changed; pass False if the index was just
+        updated (e.g. by ``get_entries``)
+
+    :returns: dict of file name -> mtime
+
+    """
+    from douglas import entryindex
+
+    if hasattr(config, 'get_configuration'):
+        config = config.get_configuration()
+
+    records = entryindex.get_index(config).get_records(filenames, check)
+    mtimes = dict((fn, record['published'])
+                  for fn, record in records.items())
+
+    missing = [fn for fn in filenames if fn not in mtimes]
+    if missing:
+        mtimes.update(filestat_mtime_many(config, missing))
+
+    return mtimes
+
+
+def filestat_mtime(config, filename):
+    """
+    Runs the ``filestat`` callback chain for the given file and
+    returns the mtime in seconds since the epoch.
+
+    This doesn't look at the entry index.  Most things should use
+    ``filestat`` instead.
+
+    :param config: config
+    :param filename: the file name of the file to stat
+
+    :returns: the mtime in seconds since the epoch
+
     """
     argdict = {
         'config': config,
@@ -391,17 +640,73 @@ def filestat(config, filename):
                            argdict,
                            mappingfunc=lambda x, y: y,
                            donefunc=lambda x: x and x["mtime"][MT] != 0,
-                           defaultfunc=lambda x: x,
-                           cache_key=lambda x: x['filename'])
+                           defaultfunc=lambda x: x)
 
     # Since no plugin handled cb_filestat; we default to asking the
     # filesystem
     if argdict['mtime'][MT] == 0:
         argdict['mtime'] = os.stat(filename)
 
-    timetuple = time.localtime(argdict['mtime'][MT])
+    return argdict['mtime'][MT]
+
 
-    return timetuple
+def filestat_mtime_many(config, filenames):
+    """
+    Runs the ``filestat_many`` callback for the given files and
+    returns their mtimes in seconds since the epoch.
+
+    Plugins that implement ``cb_filestat_many`` fill in the mtimes for
+    the files they know about.  The rest of the files go through the
+    ``filestat`` callback chain skipping plugins that implement
+    ``cb_filestat_many`` since they've already looked at them.
+
+    This doesn't look at the entry index.  Most things should use
+    ``filestat_many`` instead.
+
+    :param config: config
+    :param filenames: list of file names
+
+    :returns: dict of file name -> mtime in seconds since the epoch
+
+    """
+    argdict = {
+        'config': config,
+        'filenames': list(filenames),
+        'mtimes': {}
+    }
+
+    argdict = run_callback('filestat_many',
+                           argdict,
+                           mappingfunc=lambda x, y: y,
+                           defaultfunc=lambda x: x)
+    mtimes = argdict['mtimes']
+
+    batched = set(func.__module__
+                  for func in plugin_utils.get_callback_chain('filestat_many'))
+    chain = [func for func in plugin_utils.get_callback_chain('filestat')
+             if func.__module__ not in batched]
+
+    MT = stat.ST_MTIME
+
+    for fn in filenames:
+        if fn in mtimes:
+            continue
+
+        argdict = {
+            'config': config,
+            'filename': fn,
+            'mtime': (0,) * 10
+        }
+        argdict = _run_callback(chain,
+                                argdict,
+                                mappingfunc=lambda x, y: y,
+                                donefunc=lambda x: x and x["mtime"][MT] != 0,
+                                defaultfunc=lambda x: x)
+        if argdict['mtime'][MT] == 0:
+            argdict['mtime'] = os.stat(fn)
+        mtimes[fn] = argdict['mtime'][MT]
+
+    return mtimes
 
 
 def what_ext(extensions, filepath):
@@ -500,11 +805,15 @@ def run_callback(chain, input,
 
     :param cache_key: If the return value for this callback with these
         arguments can be cached, then this is a function that takes the
-        original input args dict and returns the cache key.
+        original input args dict and returns the cache key.  This is
+        only used when memcache is turned on.
 
     :returns: varies
 
     """
+    if not memcache.usecache:
+        cache_key = None
+
     if cache_key is not None:
         hash_key = cache_key(input)
         try:
@@ -523,7 +832,10 @@ def _run_callback(chain, input,
                  mappingfunc=lambda x, y: x,
                  donefunc=lambda x: 0,
                  defaultfunc=None):
-    chain = plugin_utils.get_callback_chain(chain)
+    # chain is either the name of a callback chain or a list of
+    # callback functions
+    if isinstance(chain, basestring):
+        chain = plugin_utils.get_callback_chain(chain)
     output = None
 
     for func in chain:
@@ -605,13 +917,14 @@ def create_entry(datadir, category, filename, mtime, title, metadata, body):
     os.utime(fn, (mtime, mtime))
 
 
-def render_url_statically(cfg, url, querystring):
+def render_url_statically(cfg, url, querystring, data=None):
     """Renders a url and saves the rendered output to the
     filesystem.
 
     :param cfg: config dict
     :param url: url to render
     :param querystring: querystring of the url to render or ""
+    :param data: dict of additional data variables for the request
 
     """
     compiledir = cfg['compiledir']
@@ -621,16 +934,26 @@ def render_url_statically(cfg, url, querystring):
     if not compiledir:
         raise Exception("You must set compiledir in your config file.")
 
-    response = render_url(cfg, url, querystring)
+    response = render_url(cfg, url, querystring, data)
     response.seek(0)
 
     fn = os.path.normpath(compiledir + os.sep + url)
     if not os.path.isdir(os.path.dirname(fn)):
-        os.makedirs(os.path.dirname(fn))
+        try:
+            os.makedirs(os.path.dirname(fn))
+        except OSError:
+            # Another compile process may have created it in the
+            # meantime.
+            if not os.path.isdir(os.path.dirname(fn)):
+                raise
 
     # Write just the response data to the file skipping the headers.
-    with open(fn, 'w') as fp:
+    # We write to a temp file and then move it into place so that the
+    # compiledir never has partially written files in it.
+    tmp_fn = '{0}.{1}.tmp'.format(fn, os.getpid())
+    with open(tmp_fn, 'w') as fp:
         fp.write(response.read())
+    shutil.move(tmp_fn, fn)
 
 
 def copy_dir(src, dst, notifyfun):
@@ -717,7 +1040,7 @@ def url_rewrite(html, old_url, new_url):
     return ''.join(out)
 
 
-def render_url(cfg, pathinfo, querystring=""):
+def render_url(cfg, pathinfo, querystring="", data=None):
     """
     Takes a url and a querystring and renders the page that
     corresponds with that by creating a Request and a Douglas object
@@ -727,6 +1050,7 @@ def render_url(cfg, pathinfo, querystring=""):
     :param pathinfo: the ``PATH_INFO`` string;
         example: ``/dev/douglas/firstpost.html``
     :param querystring: the querystring (if any); example: debug=yes
+    :param data: dict of additional data variables for the request
 
     :returns: a douglas ``Response`` object.
 
@@ -755,7 +1079,11 @@ def render_url(cfg, pathinfo, querystring=""):
         'wsgi.input': None
     }
 
-    p = Douglas(cfg, env, {'COMPILING': 1})
+    request_data = {'COMPILING': 1}
+    if data:
+        request_data.update(data)
+
+    p = Douglas(cfg, env, request_data)
     p.run(compiling=True)
     return p.get_response()
 
@@ -38,6 +38,9 @@ setup(
         'Jinja2',
         'wsgiref'
     ],
+    extras_require={
+        'scandir': ['scandir'],
+    },
     classifiers=[
         "Development Status :: 2 - Pre-Alpha",
         "Environment :: Web Environment",